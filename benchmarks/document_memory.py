@@ -0,0 +1,53 @@
+"""
+Per-document memory overhead of StandardDocument vs. the stored
+DocumentRecord. Names and bodies are allocated up front and shared, so
+only what each representation adds is counted.
+
+    python -m benchmarks.document_memory [count]
+"""
+import sys
+import uuid
+import tracemalloc
+from datetime import datetime, timezone
+
+from core.records import DocumentRecord
+from models.document_types.document import StandardDocument
+
+TABLE_DATA = {"id": str(uuid.uuid4()), "name": "bench"}
+
+
+def _document(name: str, body: dict) -> StandardDocument:
+    now = datetime.now(timezone.utc)
+    doc = StandardDocument(name=name, body=body, table_data=dict(TABLE_DATA), updated_at=now, version=2)
+    doc.get_body_hash()
+    return doc
+
+
+def _measure(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def main(count: int = 100_000) -> None:
+    names = [f"doc{i}" for i in range(count)]
+    bodies = [{"n": i} for i in range(count)]
+
+    model_bytes = _measure(lambda: [_document(names[i], bodies[i]) for i in range(count)])
+    # models are converted as they arrive, like create, replay and snapshot load do
+    record_bytes = _measure(lambda: [DocumentRecord.from_document(_document(names[i], bodies[i]))
+                                     for i in range(count)])
+
+    print(f"{count} documents, names and bodies excluded")
+    print(f"  StandardDocument: {model_bytes / count:8.1f} bytes/doc")
+    print(f"  DocumentRecord:   {record_bytes / count:8.1f} bytes/doc")
+    print(f"  saved:            {(model_bytes - record_bytes) / count:8.1f} bytes/doc "
+          f"({100 * (1 - record_bytes / model_bytes):.0f}%)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,118 @@
+from typing import Any, Dict, List, Tuple
+
+from core.query import resolve_path
+
+ACCUMULATORS = {"count", "sum", "avg", "min", "max"}
+
+
+def validate_accumulators(accumulators: Dict[str, Dict[str, Any]], group_by: List[str]) -> None:
+    for name, spec in accumulators.items():
+        op = spec.get("op")
+        if op not in ACCUMULATORS:
+            raise ValueError(f"Unknown accumulator '{op}' for '{name}', expected one of {sorted(ACCUMULATORS)}")
+        if op != "count" and not spec.get("field"):
+            raise ValueError(f"Accumulator '{name}' ({op}) needs a 'field'")
+        if name in group_by:
+            raise ValueError(f"Accumulator name '{name}' clashes with a group_by path")
+
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class GroupAccumulator:
+    """Running state of every accumulator for one group"""
+
+    __slots__ = ("key_values", "state")
+
+    def __init__(self, key_values: Dict[str, Any], accumulators: Dict[str, Dict[str, Any]]):
+        self.key_values = key_values
+        self.state: Dict[str, Any] = {}
+        for name, spec in accumulators.items():
+            op = spec["op"]
+            if op == "avg":
+                self.state[name] = [0, 0]
+            elif op in ("count", "sum"):
+                self.state[name] = 0
+            else:
+                self.state[name] = None
+
+    def add(self, body: Dict[str, Any], accumulators: Dict[str, Dict[str, Any]]) -> None:
+        for name, spec in accumulators.items():
+            op = spec["op"]
+            if op == "count":
+                self.state[name] += 1
+                continue
+
+            value = resolve_path(body, spec["field"])
+            if op == "sum":
+                if _is_number(value):
+                    self.state[name] += value
+            elif op == "avg":
+                if _is_number(value):
+                    self.state[name][0] += value
+                    self.state[name][1] += 1
+            elif value is not None:
+                current = self.state[name]
+                try:
+                    if current is None or (value < current if op == "min" else value > current):
+                        self.state[name] = value
+                except TypeError:
+                    # values of another type than the current extreme are skipped
+                    pass
+
+    def result(self, accumulators: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        row = dict(self.key_values)
+        for name, spec in accumulators.items():
+            if spec["op"] == "avg":
+                total, n = self.state[name]
+                row[name] = total / n if n else None
+            else:
+                row[name] = self.state[name]
+        return row
+
+
+class Pipeline:
+    """group_by -> accumulators, fed one document at a time"""
+
+    def __init__(self, group_by: List[str], accumulators: Dict[str, Dict[str, Any]]):
+        validate_accumulators(accumulators, group_by)
+        self.group_by = group_by
+        self.accumulators = accumulators
+        self._groups: Dict[Tuple[Any, ...], GroupAccumulator] = {}
+
+    def feed(self, body: Dict[str, Any]) -> None:
+        values = [resolve_path(body, path) for path in self.group_by]
+        key = tuple(_hashable(v) for v in values)
+
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = GroupAccumulator(dict(zip(self.group_by, values)), self.accumulators)
+        group.add(body, self.accumulators)
+
+    def results(self, sort_by: str | None = None, reverse: bool = False,
+                limit: int | None = None) -> List[Dict[str, Any]]:
+        rows = [group.result(self.accumulators) for group in self._groups.values()]
+        if not self.group_by and not rows:
+            # an ungrouped aggregate over nothing still yields one row
+            rows = [GroupAccumulator({}, self.accumulators).result(self.accumulators)]
+
+        if sort_by:
+            try:
+                # missing values last in either direction
+                present = [r for r in rows if r.get(sort_by) is not None]
+                missing = [r for r in rows if r.get(sort_by) is None]
+                present.sort(key=lambda r: r[sort_by], reverse=reverse)
+                rows = present + missing
+            except TypeError as e:
+                print(f"⚠️ Sort failed: {e}")
+
+        return rows[:limit] if limit else rows
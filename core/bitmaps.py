@@ -0,0 +1,185 @@
+import bisect
+from array import array
+from typing import Dict, Iterable, Iterator
+
+# Roaring layout: the high 16 bits of an id select a container, the low
+# 16 bits live in it. Sparse containers are sorted array('H'), dense ones
+# a 65536-bit Python int, so AND/OR/ANDNOT and popcount run in C.
+CONTAINER_BITS = 1 << 16
+ARRAY_CONTAINER_MAX = 4096
+_CONTAINER_BYTES = CONTAINER_BITS // 8
+
+
+def _array_to_bits(values: array) -> int:
+    buf = bytearray(_CONTAINER_BYTES)
+    for v in values:
+        buf[v >> 3] |= 1 << (v & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _bits_to_array(bits: int) -> array:
+    out = array('H')
+    data = bits.to_bytes(_CONTAINER_BYTES, "little")
+    for byte_idx, byte in enumerate(data):
+        if byte:
+            base = byte_idx << 3
+            for bit in range(8):
+                if byte & (1 << bit):
+                    out.append(base + bit)
+    return out
+
+
+def _as_bits(container) -> int:
+    return container if isinstance(container, int) else _array_to_bits(container)
+
+
+def _cardinality(container) -> int:
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def _normalize(bits: int):
+    """Picks the cheaper container for a bit set (None when empty)"""
+    count = bits.bit_count()
+    if count == 0:
+        return None
+    if count <= ARRAY_CONTAINER_MAX:
+        return _bits_to_array(bits)
+    return bits
+
+
+class RoaringBitmap:
+    """Compressed bitmap of dense document ids"""
+
+    __slots__ = ("_containers",)
+
+    def __init__(self, values: Iterable[int] = ()):
+        self._containers: Dict[int, object] = {}
+        for v in values:
+            self.add(v)
+
+    def add(self, value: int) -> None:
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+
+        if container is None:
+            self._containers[high] = array('H', (low,))
+        elif isinstance(container, int):
+            self._containers[high] = container | (1 << low)
+        else:
+            i = bisect.bisect_left(container, low)
+            if i < len(container) and container[i] == low:
+                return
+            container.insert(i, low)
+            if len(container) > ARRAY_CONTAINER_MAX:
+                self._containers[high] = _array_to_bits(container)
+
+    def remove(self, value: int) -> None:
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            return
+
+        if isinstance(container, int):
+            container &= ~(1 << low)
+            normalized = _normalize(container)
+        else:
+            i = bisect.bisect_left(container, low)
+            if i < len(container) and container[i] == low:
+                del container[i]
+            normalized = container if container else None
+
+        if normalized is None:
+            del self._containers[high]
+        else:
+            self._containers[high] = normalized
+
+    def __contains__(self, value: int) -> bool:
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        i = bisect.bisect_left(container, low)
+        return i < len(container) and container[i] == low
+
+    def __len__(self) -> int:
+        return sum(_cardinality(c) for c in self._containers.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._containers)
+
+    def __iter__(self) -> Iterator[int]:
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            values = _bits_to_array(container) if isinstance(container, int) else container
+            base = high << 16
+            for low in values:
+                yield base + low
+
+    def _combine(self, other: 'RoaringBitmap', op: str) -> 'RoaringBitmap':
+        result = RoaringBitmap()
+
+        if op == "and":
+            highs = self._containers.keys() & other._containers.keys()
+        elif op == "or":
+            highs = self._containers.keys() | other._containers.keys()
+        else:
+            highs = self._containers.keys()
+
+        for high in highs:
+            left = self._containers.get(high)
+            right = other._containers.get(high)
+
+            if op == "and":
+                if isinstance(left, array) and isinstance(right, array):
+                    common = sorted(set(left).intersection(right))
+                    if common:
+                        result._containers[high] = array('H', common)
+                    continue
+                bits = _as_bits(left) & _as_bits(right)
+            elif op == "or":
+                if left is None or right is None:
+                    only = left if right is None else right
+                    result._containers[high] = only if isinstance(only, int) else array('H', only)
+                    continue
+                bits = _as_bits(left) | _as_bits(right)
+            else:
+                if right is None:
+                    result._containers[high] = left if isinstance(left, int) else array('H', left)
+                    continue
+                bits = _as_bits(left) & ~_as_bits(right)
+
+            normalized = _normalize(bits)
+            if normalized is not None:
+                result._containers[high] = normalized
+
+        return result
+
+    def __and__(self, other: 'RoaringBitmap') -> 'RoaringBitmap':
+        return self._combine(other, "and")
+
+    def __or__(self, other: 'RoaringBitmap') -> 'RoaringBitmap':
+        return self._combine(other, "or")
+
+    def __sub__(self, other: 'RoaringBitmap') -> 'RoaringBitmap':
+        return self._combine(other, "andnot")
+
+    def copy(self) -> 'RoaringBitmap':
+        return self | RoaringBitmap()
+
+    def to_array(self) -> array:
+        return array('I', self)
+
+    def size_in_bytes(self) -> int:
+        total = 0
+        for container in self._containers.values():
+            total += _CONTAINER_BYTES if isinstance(container, int) else container.itemsize * len(container)
+        return total
+
+    @staticmethod
+    def union_all(bitmaps: Iterable['RoaringBitmap']) -> 'RoaringBitmap':
+        result = RoaringBitmap()
+        for bitmap in bitmaps:
+            result = result | bitmap
+        return result
@@ -3,4 +3,59 @@ import os
 DATA_DIR = os.getenv("DATA_DIR", ".")
 
 STORAGE_FILE = os.path.join(DATA_DIR, "yaradb_storage.json")
-WAL_FILE = os.path.join(DATA_DIR, "yaradb_wal")
\ No newline at end of file
+WAL_FILE = os.path.join(DATA_DIR, "yaradb_wal")
+
+# --- Multi-process serving ---
+# standalone: single process (default)
+# owner: the only process that writes the WAL, reached by readers over OWNER_SOCKET
+# reader: serves reads from a replica that tails the WAL, forwards writes to the owner
+YARADB_ROLE = os.getenv("YARADB_ROLE", "standalone")
+WORKERS = int(os.getenv("WORKERS", "1"))
+OWNER_SOCKET = os.getenv("OWNER_SOCKET", os.path.join(DATA_DIR, "yaradb_owner.sock"))
+REPLICA_POLL_INTERVAL = float(os.getenv("REPLICA_POLL_INTERVAL", "0.05"))
+
+# --- Table partitions ---
+SHARD_COUNT = max(1, int(os.getenv("SHARD_COUNT", "4")))
+SCAN_WORKERS = max(1, int(os.getenv("SCAN_WORKERS", str(min(SHARD_COUNT, os.cpu_count() or 1)))))
+# tables smaller than this are scanned inline, without the scan pool
+PARALLEL_SCAN_MIN_ROWS = int(os.getenv("PARALLEL_SCAN_MIN_ROWS", "20000"))
+
+# --- Long running queries ---
+# documents processed between two yields to the event loop
+SCAN_CHUNK_SIZE = int(os.getenv("SCAN_CHUNK_SIZE", "1000"))
+# queries planned to touch more documents are rejected (0 = no limit)
+MAX_SCAN_DOCS = int(os.getenv("MAX_SCAN_DOCS", "0"))
+# result sets larger than this are sorted off the event loop
+SORT_OFFLOAD_ROWS = int(os.getenv("SORT_OFFLOAD_ROWS", "50000"))
+
+# --- Vector indexes ---
+# rows scored per matrix product, bounds temporary memory of a search
+VECTOR_BATCH_ROWS = int(os.getenv("VECTOR_BATCH_ROWS", "65536"))
+# below this many vectors an IVF search is just an exact search
+VECTOR_IVF_MIN_ROWS = int(os.getenv("VECTOR_IVF_MIN_ROWS", "10000"))
+
+# --- Geo indexes ---
+# side of a grid cell in degrees (0.05 is about 5.5 km of latitude)
+GEO_CELL_DEGREES = float(os.getenv("GEO_CELL_DEGREES", "0.05"))
+
+# --- Response caching ---
+# budget for serialized bytes of hot documents (0 disables the cache)
+DOC_CACHE_MAX_BYTES = int(os.getenv("DOC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# budget for cached find results, used by finds sent with cache=true
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# --- Body hashes ---
+# sha256 (default), blake2b or crc32; the latter two are cheaper on large bodies
+BODY_HASH_ALGORITHM = os.getenv("BODY_HASH_ALGORITHM", "sha256")
+# seconds between background re-checks of stored body hashes (0 = off)
+HASH_VERIFY_INTERVAL = float(os.getenv("HASH_VERIFY_INTERVAL", "0"))
+
+# --- Body interning ---
+# distinct short string values shared per table before the dictionary stops growing
+VALUE_DICT_MAX_ENTRIES = int(os.getenv("VALUE_DICT_MAX_ENTRIES", "65536"))
+# longer strings are rarely repeated and are never shared
+VALUE_DICT_MAX_LENGTH = int(os.getenv("VALUE_DICT_MAX_LENGTH", "64"))
+# lookups per window after which a field's (and the table's) hit ratio is checked
+VALUE_DICT_SAMPLE_SIZE = int(os.getenv("VALUE_DICT_SAMPLE_SIZE", "1000"))
+# fields and tables whose values repeat less often than this are no longer interned
+VALUE_DICT_MIN_HIT_RATIO = float(os.getenv("VALUE_DICT_MIN_HIT_RATIO", "0.25"))
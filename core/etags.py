@@ -0,0 +1,33 @@
+from typing import Any
+
+from core import mvcc
+from core import state
+
+
+def document_etag(doc: Any) -> str:
+    """Versions are immutable, so id + version pins the exact bytes"""
+    return f'"{doc.id.hex}-{doc.version}-{doc.get_body_hash()}"'
+
+
+def table_etag(table_name: str) -> str:
+    # WAL offsets and the snapshot epoch are read from the shared files, so
+    # the owner and every replica tag the same table state alike
+    return f'W/"{table_name}-{state.db_snapshot_epoch}-{mvcc.table_position(table_name)}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def if_none_match(header: str | None, etag: str) -> bool:
+    """
+    True when an If-None-Match header matches etag. The comparison is weak
+    (RFC 9110 13.1.2): the W/ prefix is ignored on both sides.
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    target = _opaque(etag)
+    return any(_opaque(candidate) == target for candidate in header.split(","))
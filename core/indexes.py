@@ -1,34 +1,167 @@
 ﻿import uuid
-from typing import Any, Dict, List, Set, Optional
-from collections import defaultdict
+from array import array
+from typing import Any, Dict, Iterable, List, Set, Optional, Tuple
 from datetime import datetime
 import bisect
+import math
+
+from core.bitmaps import RoaringBitmap
+from core.constants.main_values import VECTOR_BATCH_ROWS, VECTOR_IVF_MIN_ROWS, GEO_CELL_DEGREES
+from core.scheduling import CancelToken, raise_if_cancelled
+from core.query import (is_operator_condition, equality_value, range_bounds, prefix_value, mentions_null,
+                        validate_filter, matches_filter, matches_condition, filter_implies, resolve_path)
+from core import text
+from core import query as geo
+
+
+class DocIdMap:
+    """
+    Dense integer ids for documents.
+
+    The dense id of a document is its row in db_storage; indexes keep
+    these 4-byte ints instead of UUID objects and translate back to UUIDs
+    only when a result leaves the index layer.
+    """
+
+    def __init__(self):
+        self._by_uuid: Dict[uuid.UUID, int] = {}
+        self._uuids: List[uuid.UUID] = []
+
+    def assign(self, doc_id: uuid.UUID) -> int:
+        dense_id = self._by_uuid.get(doc_id)
+        if dense_id is None:
+            dense_id = len(self._uuids)
+            self._by_uuid[doc_id] = dense_id
+            self._uuids.append(doc_id)
+        return dense_id
+
+    def get(self, doc_id: uuid.UUID, default: Any = None) -> Any:
+        return self._by_uuid.get(doc_id, default)
+
+    def to_uuid(self, dense_id: int) -> uuid.UUID:
+        return self._uuids[dense_id]
+
+    def __contains__(self, doc_id: uuid.UUID) -> bool:
+        return doc_id in self._by_uuid
+
+    def __len__(self) -> int:
+        return len(self._uuids)
+
+    def clear(self) -> None:
+        self._by_uuid.clear()
+        self._uuids.clear()
+
+
+def new_postings(items: Iterable[int] = ()) -> array:
+    return array('I', items)
+
+
+def postings_add(postings: array, dense_id: int) -> None:
+    """Inserts into a sorted posting list (ids mostly arrive in order)"""
+    if not postings or postings[-1] < dense_id:
+        postings.append(dense_id)
+        return
+    i = bisect.bisect_left(postings, dense_id)
+    if i == len(postings) or postings[i] != dense_id:
+        postings.insert(i, dense_id)
+
+
+def postings_remove(postings: array, dense_id: int) -> None:
+    i = bisect.bisect_left(postings, dense_id)
+    if i < len(postings) and postings[i] == dense_id:
+        del postings[i]
+
+
+def intersect_postings(*lists: array) -> array:
+    """Intersection of sorted posting lists, smallest list first"""
+    if not lists:
+        return new_postings()
+
+    ordered = sorted(lists, key=len)
+    result = ordered[0]
+
+    for other in ordered[1:]:
+        if not result:
+            break
+        if len(other) > 16 * len(result):
+            # skewed sizes: binary search the small list into the big one
+            found = new_postings()
+            lo = 0
+            for dense_id in result:
+                lo = bisect.bisect_left(other, dense_id, lo)
+                if lo == len(other):
+                    break
+                if other[lo] == dense_id:
+                    found.append(dense_id)
+            result = found
+        else:
+            result = new_postings(sorted(set(result).intersection(other)))
+
+    return new_postings(result)
+
+
+def union_postings(*lists: array) -> array:
+    if len(lists) == 1:
+        return new_postings(lists[0])
+    merged: Set[int] = set()
+    for postings in lists:
+        merged.update(postings)
+    return new_postings(sorted(merged))
+
+
+def postings_bytes(postings: Iterable[array]) -> int:
+    return sum(p.itemsize * len(p) for p in postings)
+
+
+def index_keys(value: Any) -> List[Any]:
+    """
+    Keys a value is indexed under. An array is multikey: one key per
+    distinct scalar element. Objects can't be keys.
+    """
+    if isinstance(value, list):
+        return list(dict.fromkeys(
+            item for item in value
+            if item is not None and not isinstance(item, (list, dict))
+        ))
+    if value is None or isinstance(value, dict):
+        return []
+    return [value]
 
 
 class BaseIndex:
     def __init__(self, field_name: str):
         self.field_name = field_name
         self.index_type = "base"
+        # partial index: only documents matching this filter are indexed
+        self.predicate: Dict[str, Any] | None = None
+        # set once an array value is indexed: a document may then sit
+        # under several keys
+        self.multikey = False
 
-    def add(self, doc_id: uuid.UUID, value: Any) -> None:
+    def add(self, dense_id: int, value: Any) -> None:
         """add document to index"""
         raise NotImplementedError
 
-    def remove(self, doc_id: uuid.UUID, value: Any) -> None:
+    def remove(self, dense_id: int, value: Any) -> None:
         """delete document from index"""
         raise NotImplementedError
 
-    def lookup(self, value: Any) -> Set[uuid.UUID]:
+    def lookup(self, value: Any) -> array:
         """search documents by exact value"""
         raise NotImplementedError
 
-    def range_lookup(self, min_val: Any = None, max_val: Any = None) -> Set[uuid.UUID]:
+    def range_lookup(self, min_val: Any = None, max_val: Any = None,
+                     include_min: bool = True, include_max: bool = True) -> array:
         """search documents by range"""
         raise NotImplementedError
 
     def clear(self) -> None:
         raise NotImplementedError
 
+    def entries(self) -> Iterable[Tuple[Any, Iterable[int]]]:
+        """(key, dense ids) pairs, used to answer covered queries"""
+        raise NotImplementedError
+
 
 class HashIndex(BaseIndex):
     """
@@ -38,46 +171,55 @@ class HashIndex(BaseIndex):
     def __init__(self, field_name: str):
         super().__init__(field_name)
         self.index_type = "hash"
-        # value -> set of doc_ids
-        self._data: Dict[Any, Set[uuid.UUID]] = defaultdict(set)
+        # value -> sorted dense ids
+        self._data: Dict[Any, array] = {}
 
-    def add(self, doc_id: uuid.UUID, value: Any) -> None:
+    def add(self, dense_id: int, value: Any) -> None:
         """O(1) - insertion"""
-        if value is None:
-            return
-
         if isinstance(value, list):
-            for item in value:
-                self._data[item].add(doc_id)
+            self.multikey = True
+        for key in index_keys(value):
+            self._add_one(dense_id, key)
+
+    def _add_one(self, dense_id: int, value: Any) -> None:
+        postings = self._data.get(value)
+        if postings is None:
+            self._data[value] = new_postings((dense_id,))
         else:
-            self._data[value].add(doc_id)
+            postings_add(postings, dense_id)
 
-    def remove(self, doc_id: uuid.UUID, value: Any) -> None:
+    def remove(self, dense_id: int, value: Any) -> None:
         """O(1) - deletion"""
-        if value is None:
-            return
+        for key in index_keys(value):
+            self._remove_one(dense_id, key)
 
-        if isinstance(value, list):
-            for item in value:
-                self._data[item].discard(doc_id)
-                if not self._data[item]:
-                    del self._data[item]
-        else:
-            self._data[value].discard(doc_id)
-            if not self._data[value]:
-                del self._data[value]
+    def _remove_one(self, dense_id: int, value: Any) -> None:
+        postings = self._data.get(value)
+        if postings is None:
+            return
+        postings_remove(postings, dense_id)
+        if not postings:
+            del self._data[value]
 
-    def lookup(self, value: Any) -> Set[uuid.UUID]:
+    def lookup(self, value: Any) -> array:
         """O(1) - search by exact value"""
-        return self._data.get(value, set()).copy()
+        return new_postings(self._data.get(value, ()))
+
+    def count(self, value: Any) -> int:
+        """O(1) - posting list size, nothing is copied"""
+        return len(self._data.get(value, ()))
 
-    def range_lookup(self, min_val: Any = None, max_val: Any = None) -> Set[uuid.UUID]:
+    def range_lookup(self, min_val: Any = None, max_val: Any = None,
+                     include_min: bool = True, include_max: bool = True) -> array:
         """Hash index doesn't support range queries"""
         raise NotImplementedError("Hash index doesn't support range queries. Use BTreeIndex instead.")
 
     def clear(self) -> None:
         self._data.clear()
 
+    def entries(self) -> Iterable[Tuple[Any, Iterable[int]]]:
+        return self._data.items()
+
     def stats(self) -> Dict[str, Any]:
         """Index statistics"""
         total_docs = sum(len(docs) for docs in self._data.values())
@@ -86,7 +228,8 @@ class HashIndex(BaseIndex):
             "field": self.field_name,
             "unique_values": len(self._data),
             "total_entries": total_docs,
-            "avg_docs_per_value": total_docs / len(self._data) if self._data else 0
+            "avg_docs_per_value": total_docs / len(self._data) if self._data else 0,
+            "postings_bytes": postings_bytes(self._data.values())
         }
 
 
@@ -99,88 +242,1149 @@ class BTreeIndex(BaseIndex):
         super().__init__(field_name)
         self.index_type = "btree"
         self._sorted_keys: List[Any] = []
-        self._data: Dict[Any, Set[uuid.UUID]] = defaultdict(set)
+        self._data: Dict[Any, array] = {}
 
-    def add(self, doc_id: uuid.UUID, value: Any) -> None:
-        """O(log n) - insertion"""
-        if value is None:
-            return
-
-        if value not in self._data:
-            bisect.insort(self._sorted_keys, value)
+    def add(self, dense_id: int, value: Any) -> None:
+        """O(log n) - insertion, one entry per array element"""
+        if isinstance(value, list):
+            self.multikey = True
 
-        self._data[value].add(doc_id)
+        for key in index_keys(value):
+            postings = self._data.get(key)
+            if postings is None:
+                bisect.insort(self._sorted_keys, key)
+                self._data[key] = new_postings((dense_id,))
+            else:
+                postings_add(postings, dense_id)
 
-    def remove(self, doc_id: uuid.UUID, value: Any) -> None:
+    def remove(self, dense_id: int, value: Any) -> None:
         """O(log n) - deletion"""
-        if value is None or value not in self._data:
-            return
-
-        self._data[value].discard(doc_id)
+        for key in index_keys(value):
+            postings = self._data.get(key)
+            if postings is None:
+                continue
+            postings_remove(postings, dense_id)
 
-        if not self._data[value]:
-            del self._data[value]
-            self._sorted_keys.remove(value)
+            if not postings:
+                del self._data[key]
+                del self._sorted_keys[bisect.bisect_left(self._sorted_keys, key)]
 
-    def lookup(self, value: Any) -> Set[uuid.UUID]:
+    def lookup(self, value: Any) -> array:
         """O(log n) - search by exact value"""
-        return self._data.get(value, set()).copy()
+        return new_postings(self._data.get(value, ()))
+
+    def count(self, value: Any) -> int:
+        return len(self._data.get(value, ()))
 
-    def range_lookup(self, min_val: Any = None, max_val: Any = None) -> Set[uuid.UUID]:
+    def range_lookup(self, min_val: Any = None, max_val: Any = None,
+                     include_min: bool = True, include_max: bool = True) -> array:
         """
         O(log n + k) - range query
         k = quantity of matched keys
         """
-        result = set()
+        start_idx, end_idx = self._key_range(min_val, max_val, include_min, include_max)
+
+        if start_idx >= end_idx:
+            return new_postings()
+
+        return union_postings(*(self._data[self._sorted_keys[i]] for i in range(start_idx, end_idx)))
+
+    def ordered_lookup(self, min_val: Any = None, max_val: Any = None,
+                       include_min: bool = True, include_max: bool = True,
+                       reverse: bool = False, limit: int | None = None) -> array:
+        """Dense ids in key order (ties by id) for the given range"""
+        start_idx, end_idx = self._key_range(min_val, max_val, include_min, include_max)
+        return self._ordered_ids(start_idx, end_idx, reverse, limit)
+
+    def prefix_lookup(self, prefix: str, ordered: bool = False,
+                      reverse: bool = False, limit: int | None = None) -> array:
+        """
+        O(log n + k) - string keys starting with prefix. With ordered=True
+        ids come in lexical key order and the walk stops after limit ids.
+        """
+        start_idx, end_idx = self._prefix_range(prefix)
+        if ordered:
+            return self._ordered_ids(start_idx, end_idx, reverse, limit)
+        if start_idx >= end_idx:
+            return new_postings()
+        return union_postings(*(self._data[self._sorted_keys[i]] for i in range(start_idx, end_idx)))
+
+    def _ordered_ids(self, start_idx: int, end_idx: int,
+                     reverse: bool, limit: int | None) -> array:
+        keys = range(end_idx - 1, start_idx - 1, -1) if reverse else range(start_idx, end_idx)
+
+        result = new_postings()
+        seen: Set[int] | None = set() if self.multikey else None
+        for i in keys:
+            postings = self._data[self._sorted_keys[i]]
+            if seen is None:
+                result.extend(postings)
+            else:
+                for dense_id in postings:
+                    if dense_id not in seen:
+                        seen.add(dense_id)
+                        result.append(dense_id)
+            if limit is not None and len(result) >= limit:
+                del result[limit:]
+                break
+        return result
 
-        start_idx = 0 if min_val is None else bisect.bisect_left(self._sorted_keys, min_val)
-        end_idx = len(self._sorted_keys) if max_val is None else bisect.bisect_right(self._sorted_keys, max_val)
+    def _prefix_range(self, prefix: str) -> Tuple[int, int]:
+        # keys of other types can't start with a string prefix
+        keys = self._sorted_keys
+        if keys and not isinstance(keys[0], str):
+            return 0, 0
+
+        start_idx = bisect.bisect_left(keys, prefix)
+        if not prefix or prefix[-1] == chr(0x10FFFF):
+            end_idx = start_idx
+            while end_idx < len(keys) and keys[end_idx].startswith(prefix):
+                end_idx += 1
+            return start_idx, end_idx
+
+        # smallest string greater than every key with this prefix
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return start_idx, bisect.bisect_left(keys, upper, start_idx)
+
+    def _key_range(self, min_val: Any, max_val: Any,
+                   include_min: bool, include_max: bool) -> Tuple[int, int]:
+        if min_val is None:
+            start_idx = 0
+        elif include_min:
+            start_idx = bisect.bisect_left(self._sorted_keys, min_val)
+        else:
+            start_idx = bisect.bisect_right(self._sorted_keys, min_val)
+
+        if max_val is None:
+            end_idx = len(self._sorted_keys)
+        elif include_max:
+            end_idx = bisect.bisect_right(self._sorted_keys, max_val)
+        else:
+            end_idx = bisect.bisect_left(self._sorted_keys, max_val)
+
+        return start_idx, end_idx
+
+    def clear(self) -> None:
+        self._sorted_keys.clear()
+        self._data.clear()
+
+    def key_extremes(self, bounds: Tuple[Any, bool, Any, bool] | None = None) -> Tuple[Any, Any]:
+        """O(log n) - smallest and largest key, within bounds when given"""
+        if bounds is None:
+            start_idx, end_idx = 0, len(self._sorted_keys)
+        else:
+            lower, include_lower, upper, include_upper = bounds
+            start_idx, end_idx = self._key_range(lower, upper, include_lower, include_upper)
+        if start_idx >= end_idx:
+            return None, None
+        return self._sorted_keys[start_idx], self._sorted_keys[end_idx - 1]
 
+    def entries(self, bounds: Tuple[Any, bool, Any, bool] | None = None) -> Iterable[Tuple[Any, Iterable[int]]]:
+        """Entries in key order, restricted to bounds when given"""
+        if bounds is None:
+            start_idx, end_idx = 0, len(self._sorted_keys)
+        else:
+            lower, include_lower, upper, include_upper = bounds
+            start_idx, end_idx = self._key_range(lower, upper, include_lower, include_upper)
         for i in range(start_idx, end_idx):
             key = self._sorted_keys[i]
-            result.update(self._data[key])
+            yield key, self._data[key]
+
+    def stats(self) -> Dict[str, Any]:
+        total_docs = sum(len(docs) for docs in self._data.values())
+        return {
+            "type": self.index_type,
+            "field": self.field_name,
+            "unique_values": len(self._data),
+            "total_entries": total_docs,
+            "min_value": self._sorted_keys[0] if self._sorted_keys else None,
+            "max_value": self._sorted_keys[-1] if self._sorted_keys else None,
+            "postings_bytes": postings_bytes(self._data.values())
+        }
+
+
+class BitmapIndex(BaseIndex):
+    """
+    Bitmap Index - one compressed bitmap per value, for low-cardinality
+    fields. Several bitmap conditions combine with AND/OR/NOT on whole
+    bitmaps and counts are popcounts.
+    """
+
+    def __init__(self, field_name: str):
+        super().__init__(field_name)
+        self.index_type = "bitmap"
+        self._data: Dict[Any, RoaringBitmap] = {}
+
+    def add(self, dense_id: int, value: Any) -> None:
+        if isinstance(value, list):
+            self.multikey = True
+        for item in index_keys(value):
+            bitmap = self._data.get(item)
+            if bitmap is None:
+                bitmap = self._data[item] = RoaringBitmap()
+            bitmap.add(dense_id)
+
+    def remove(self, dense_id: int, value: Any) -> None:
+        for item in index_keys(value):
+            bitmap = self._data.get(item)
+            if bitmap is None:
+                continue
+            bitmap.remove(dense_id)
+            if not bitmap:
+                del self._data[item]
+
+    def bitmap(self, value: Any) -> RoaringBitmap:
+        return self._data.get(value) or RoaringBitmap()
+
+    def lookup(self, value: Any) -> array:
+        return self.bitmap(value).to_array()
+
+    def range_lookup(self, min_val: Any = None, max_val: Any = None,
+                     include_min: bool = True, include_max: bool = True) -> array:
+        raise NotImplementedError("Bitmap index doesn't support range queries. Use BTreeIndex instead.")
+
+    def count(self, value: Any) -> int:
+        bitmap = self._data.get(value)
+        return len(bitmap) if bitmap is not None else 0
+
+    def match(self, condition: Any, universe: RoaringBitmap) -> RoaringBitmap | None:
+        """Bitmap of documents satisfying condition (None if unsupported)"""
+        if not is_operator_condition(condition):
+            return self.bitmap(condition)
+
+        result = None
+        for op, operand in condition.items():
+            if op == "$eq":
+                part = self.bitmap(operand)
+            elif op == "$in":
+                part = RoaringBitmap.union_all(self.bitmap(v) for v in operand)
+            elif op == "$ne":
+                part = universe - self.bitmap(operand)
+            elif op == "$nin":
+                part = universe - RoaringBitmap.union_all(self.bitmap(v) for v in operand)
+            else:
+                return None
+            result = part if result is None else result & part
 
         return result
 
+    def clear(self) -> None:
+        self._data.clear()
+
+    def entries(self) -> Iterable[Tuple[Any, Iterable[int]]]:
+        return self._data.items()
+
+    def stats(self) -> Dict[str, Any]:
+        total_docs = sum(len(bitmap) for bitmap in self._data.values())
+        return {
+            "type": self.index_type,
+            "field": self.field_name,
+            "unique_values": len(self._data),
+            "total_entries": total_docs,
+            "bitmap_bytes": sum(bitmap.size_in_bytes() for bitmap in self._data.values())
+        }
+
+
+class TextIndex(BaseIndex):
+    """
+    Full-text inverted index: term -> {dense id: positions}. Answers
+    BM25-ranked searches with prefix terms and phrases; it never serves
+    equality filters in find().
+    """
+
+    def __init__(self, field_name: str):
+        super().__init__(field_name)
+        self.index_type = "text"
+        self._postings: Dict[str, Dict[int, array]] = {}
+        self._sorted_terms: List[str] = []
+        self._doc_lengths: Dict[int, int] = {}
+        self._total_length = 0
+
+    @staticmethod
+    def _text_of(value: Any) -> str | None:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, list):
+            parts = [item for item in value if isinstance(item, str)]
+            return " ".join(parts) if parts else None
+        return None
+
+    def add(self, dense_id: int, value: Any) -> None:
+        content = self._text_of(value)
+        if content is None:
+            return
+        if dense_id in self._doc_lengths:
+            # added twice (a write raced an index build): the old text is
+            # unknown here, so drop the row from every posting list
+            self._forget(dense_id)
+
+        tokens = text.tokenize(content)
+        for term, position in tokens:
+            docs = self._postings.get(term)
+            if docs is None:
+                docs = self._postings[term] = {}
+                bisect.insort(self._sorted_terms, term)
+            positions = docs.get(dense_id)
+            if positions is None:
+                docs[dense_id] = array('I', (position,))
+            else:
+                positions.append(position)
+
+        self._doc_lengths[dense_id] = len(tokens)
+        self._total_length += len(tokens)
+
+    def remove(self, dense_id: int, value: Any) -> None:
+        if dense_id not in self._doc_lengths:
+            return
+
+        content = self._text_of(value) or ""
+        for term in {term for term, _ in text.tokenize(content)}:
+            docs = self._postings.get(term)
+            if docs is None:
+                continue
+            docs.pop(dense_id, None)
+            if not docs:
+                del self._postings[term]
+                i = bisect.bisect_left(self._sorted_terms, term)
+                del self._sorted_terms[i]
+
+        self._total_length -= self._doc_lengths.pop(dense_id)
+
+    def _forget(self, dense_id: int) -> None:
+        for term in [term for term, docs in self._postings.items() if dense_id in docs]:
+            docs = self._postings[term]
+            del docs[dense_id]
+            if not docs:
+                del self._postings[term]
+                i = bisect.bisect_left(self._sorted_terms, term)
+                del self._sorted_terms[i]
+        self._total_length -= self._doc_lengths.pop(dense_id)
+
+    def lookup(self, value: Any) -> array:
+        """Documents containing every term of value"""
+        terms = {term for term, _ in text.tokenize(str(value))}
+        if not terms:
+            return new_postings()
+        return intersect_postings(*(new_postings(sorted(self._postings.get(t, ()))) for t in terms))
+
+    def range_lookup(self, min_val: Any = None, max_val: Any = None,
+                     include_min: bool = True, include_max: bool = True) -> array:
+        raise NotImplementedError("Text index doesn't support range queries. Use BTreeIndex instead.")
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        """Indexed terms starting with prefix (or with its stem)"""
+        found = []
+        for candidate in {prefix, text.stem(prefix)}:
+            i = bisect.bisect_left(self._sorted_terms, candidate)
+            while i < len(self._sorted_terms) and self._sorted_terms[i].startswith(candidate):
+                found.append(self._sorted_terms[i])
+                i += 1
+        return sorted(set(found))
+
+    def _phrase_rows(self, phrase: List[Tuple[str, int]]) -> Set[int]:
+        first_term, first_pos = phrase[0]
+        rows = set(self._postings.get(first_term, ()))
+        for term, _ in phrase[1:]:
+            rows &= self._postings.get(term, {}).keys()
+
+        matched = set()
+        for row in rows:
+            for start in self._postings[first_term][row]:
+                base = start - first_pos
+                if all(base + pos in self._postings[term][row] for term, pos in phrase[1:]):
+                    matched.add(row)
+                    break
+        return matched
+
+    def search(self, query: str, limit: int | None = 10) -> List[Tuple[int, float]]:
+        """
+        (dense id, BM25 score) pairs, best first. Plain and prefix terms
+        are OR-ed and scored; every phrase is required and contributes the
+        scores of its terms.
+        """
+        parsed = text.parse_query(query)
+
+        scored_terms = list(parsed.terms)
+        for prefix in parsed.prefixes:
+            scored_terms.extend(self.expand_prefix(prefix))
+        for phrase in parsed.phrases:
+            scored_terms.extend(term for term, _ in phrase)
+
+        required: Set[int] | None = None
+        for phrase in parsed.phrases:
+            rows = self._phrase_rows(phrase)
+            required = rows if required is None else required & rows
+
+        total_docs = len(self._doc_lengths)
+        if not total_docs or not scored_terms:
+            return []
+        avg_length = self._total_length / total_docs or 1
+
+        scores: Dict[int, float] = {}
+        for term in set(scored_terms):
+            docs = self._postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for row, positions in docs.items():
+                if required is not None and row not in required:
+                    continue
+                tf = len(positions)
+                norm = 1 - text.BM25_B + text.BM25_B * self._doc_lengths[row] / avg_length
+                scores[row] = scores.get(row, 0.0) + idf * tf * (text.BM25_K1 + 1) / (tf + text.BM25_K1 * norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._sorted_terms.clear()
+        self._doc_lengths.clear()
+        self._total_length = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "type": self.index_type,
+            "field": self.field_name,
+            "unique_values": len(self._postings),
+            "total_entries": sum(len(docs) for docs in self._postings.values()),
+            "indexed_documents": len(self._doc_lengths),
+            "avg_document_length": self._total_length / len(self._doc_lengths) if self._doc_lengths else 0
+        }
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ValueError("Column indexes need numpy: pip install numpy")
+    return numpy
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# the largest magnitude up to which every int survives a float64 round trip
+_EXACT_INT_LIMIT = 2 ** 53
+
+
+def _fits_column(value: Any) -> bool:
+    return _is_number(value) and (isinstance(value, float) or abs(value) <= _EXACT_INT_LIMIT)
+
+
+class ColumnIndex(BaseIndex):
+    """
+    Column Index - a numeric field materialized into a NumPy float64 array
+    aligned with dense ids, so range filters, sorts and aggregates run as
+    vectorized masks instead of per-document dict lookups.
+
+    Non-numeric values are simply absent (they never match a numeric
+    condition). Booleans, arrays and ints beyond 2**53 (which float64
+    can't hold exactly) would need Python semantics, so while any document
+    holds one the column stops serving queries.
+    """
+
+    def __init__(self, field_name: str):
+        super().__init__(field_name)
+        self.index_type = "column"
+        np = _numpy()
+        self._values = np.zeros(1024, dtype=np.float64)
+        self._present = np.zeros(1024, dtype=bool)
+        self._count = 0
+        self._floats = 0
+        self._unsupported = 0
+
+    @property
+    def mixed(self) -> bool:
+        return self._unsupported > 0
+
+    @property
+    def all_ints(self) -> bool:
+        return self._floats == 0
+
+    def _ensure_capacity(self, dense_id: int) -> None:
+        if dense_id < len(self._values):
+            return
+        np = _numpy()
+        size = max(dense_id + 1, len(self._values) * 2)
+        values = np.zeros(size, dtype=np.float64)
+        present = np.zeros(size, dtype=bool)
+        values[:len(self._values)] = self._values
+        present[:len(self._present)] = self._present
+        self._values, self._present = values, present
+
+    def add(self, dense_id: int, value: Any) -> None:
+        if isinstance(value, (bool, list)) or (_is_number(value) and not _fits_column(value)):
+            self._unsupported += 1
+            return
+        if not _is_number(value):
+            return
+
+        self._ensure_capacity(dense_id)
+        if not self._present[dense_id]:
+            self._count += 1
+        self._values[dense_id] = value
+        self._present[dense_id] = True
+        if isinstance(value, float):
+            self._floats += 1
+
+    def remove(self, dense_id: int, value: Any) -> None:
+        if isinstance(value, (bool, list)) or (_is_number(value) and not _fits_column(value)):
+            self._unsupported -= 1
+            return
+        if dense_id < len(self._present) and self._present[dense_id]:
+            self._present[dense_id] = False
+            self._count -= 1
+            if isinstance(value, float):
+                self._floats -= 1
+
+    def _rows(self, mask) -> array:
+        return new_postings(_numpy().flatnonzero(mask).tolist())
+
+    def match_rows(self, condition: Any) -> array | None:
+        mask = self.mask(condition)
+        return self._rows(mask) if mask is not None else None
+
+    def mask(self, condition: Any):
+        """
+        Boolean mask of the documents satisfying condition, None when the
+        condition isn't purely numeric and positive ($eq/$in/ranges).
+        """
+        if self.mixed:
+            return None
+
+        value = equality_value(condition)
+        if value is not None:
+            return self._present & (self._values == value) if _fits_column(value) else None
+
+        if not is_operator_condition(condition):
+            return None
+
+        mask = self._present.copy()
+        for op, operand in condition.items():
+            if op == "$in":
+                if not all(_fits_column(v) for v in operand):
+                    return None
+                mask &= _numpy().isin(self._values, operand)
+            elif op in ("$gt", "$gte", "$lt", "$lte", "$eq"):
+                if not _fits_column(operand):
+                    return None
+                if op == "$gt":
+                    mask &= self._values > operand
+                elif op == "$gte":
+                    mask &= self._values >= operand
+                elif op == "$lt":
+                    mask &= self._values < operand
+                elif op == "$lte":
+                    mask &= self._values <= operand
+                else:
+                    mask &= self._values == operand
+            else:
+                return None
+        return mask
+
+    def lookup(self, value: Any) -> array:
+        mask = self.mask(value)
+        return self._rows(mask) if mask is not None else new_postings()
+
+    def range_lookup(self, min_val: Any = None, max_val: Any = None,
+                     include_min: bool = True, include_max: bool = True) -> array:
+        condition = {}
+        if min_val is not None:
+            condition["$gte" if include_min else "$gt"] = min_val
+        if max_val is not None:
+            condition["$lte" if include_max else "$lt"] = max_val
+        mask = self.mask(condition) if condition else self._present
+        return self._rows(mask) if mask is not None else new_postings()
+
+    def ordered(self, condition: Any, reverse: bool = False, limit: int | None = None) -> array | None:
+        """Dense ids satisfying condition ordered by value (ties by id)"""
+        mask = self.mask(condition)
+        if mask is None:
+            return None
+        np = _numpy()
+        rows = np.flatnonzero(mask)
+        keys = -self._values[rows] if reverse else self._values[rows]
+        rows = rows[np.argsort(keys, kind="stable")]
+        if limit is not None:
+            rows = rows[:limit]
+        return new_postings(rows.tolist())
+
+    def aggregate(self, op: str, rows: array | None = None) -> Any:
+        """count/sum/avg/min/max over the column (restricted to rows)"""
+        np = _numpy()
+        if rows is None:
+            values = self._values[self._present]
+        else:
+            selected = np.frombuffer(rows, dtype=np.uint32).astype(np.int64)
+            selected = selected[selected < len(self._values)]
+            selected = selected[self._present[selected]]
+            values = self._values[selected]
+
+        if op == "count":
+            return int(len(values))
+        if not len(values):
+            return 0 if op == "sum" else None
+        if op == "avg":
+            return float(values.mean())
+
+        result = {"sum": values.sum, "min": values.min, "max": values.max}[op]()
+        return int(result) if self.all_ints else float(result)
+
+    def clear(self) -> None:
+        self._present[:] = False
+        self._count = 0
+        self._floats = 0
+        self._unsupported = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "type": self.index_type,
+            "field": self.field_name,
+            "total_entries": self._count,
+            "capacity": len(self._values),
+            "column_bytes": int(self._values.nbytes + self._present.nbytes),
+            "usable": not self.mixed
+        }
+
+
+class GeoIndex(BaseIndex):
+    """
+    Geo Index - uniform lat/lon grid, cell -> sorted dense ids, for a
+    {"lat": ..., "lon": ...} field. $near and $within_box first collect
+    the cells overlapping the area, then refine with the exact point.
+    """
+
+    # meters per degree of latitude
+    _M_PER_DEGREE = 111320.0
+
+    def __init__(self, field_name: str, cell_degrees: float = GEO_CELL_DEGREES):
+        super().__init__(field_name)
+        self.index_type = "geo"
+        self.cell_degrees = cell_degrees
+        self._cells: Dict[Tuple[int, int], array] = {}
+        self._points: Dict[int, Tuple[float, float]] = {}
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def add(self, dense_id: int, value: Any) -> None:
+        point = geo.geo_point(value)
+        if point is None:
+            return
+        self._points[dense_id] = point
+        cell = self._cell(*point)
+        postings = self._cells.get(cell)
+        if postings is None:
+            self._cells[cell] = new_postings((dense_id,))
+        else:
+            postings_add(postings, dense_id)
+
+    def remove(self, dense_id: int, value: Any) -> None:
+        point = self._points.pop(dense_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        postings = self._cells.get(cell)
+        if postings is not None:
+            postings_remove(postings, dense_id)
+            if not postings:
+                del self._cells[cell]
+
+    def lookup(self, value: Any) -> array:
+        raise NotImplementedError("Geo index only supports $near and $within_box")
+
+    def range_lookup(self, min_val: Any = None, max_val: Any = None,
+                     include_min: bool = True, include_max: bool = True) -> array:
+        raise NotImplementedError("Geo index only supports $near and $within_box")
+
+    def _box_candidates(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[int]:
+        low_y, low_x = self._cell(max(min_lat, -90.0), max(min_lon, -180.0))
+        high_y, high_x = self._cell(min(max_lat, 90.0), min(max_lon, 180.0))
+
+        cell_count = (high_y - low_y + 1) * (high_x - low_x + 1)
+        if cell_count > len(self._cells):
+            # huge area: walking the occupied cells is cheaper
+            cells = [c for c in self._cells if low_y <= c[0] <= high_y and low_x <= c[1] <= high_x]
+        else:
+            cells = [(y, x) for y in range(low_y, high_y + 1) for x in range(low_x, high_x + 1)]
+
+        rows: List[int] = []
+        for cell in cells:
+            rows.extend(self._cells.get(cell, ()))
+        return rows
+
+    def within_box(self, box: Dict[str, Any]) -> array:
+        rows = self._box_candidates(box["min_lat"], box["min_lon"], box["max_lat"], box["max_lon"])
+        return new_postings(sorted(r for r in rows if geo.within_box(self._points[r], box)))
+
+    def near(self, near: Dict[str, Any], ordered: bool = False, limit: int | None = None) -> array:
+        """
+        Dense ids within max_distance_m of the point. ordered=True sorts
+        them nearest first and keeps at most limit.
+        """
+        lat, lon, radius = near["lat"], near["lon"], near["max_distance_m"]
+        d_lat = radius / self._M_PER_DEGREE
+        # longitude degrees shrink towards the poles
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + d_lat)))
+        d_lon = min(360.0, radius / (self._M_PER_DEGREE * cos_lat))
+
+        found = []
+        for row in self._box_candidates(lat - d_lat, lon - d_lon, lat + d_lat, lon + d_lon):
+            p_lat, p_lon = self._points[row]
+            distance = geo.haversine_m(lat, lon, p_lat, p_lon)
+            if distance <= radius:
+                found.append((distance, row))
+
+        if not ordered:
+            return new_postings(sorted(row for _, row in found))
+        found.sort()
+        if limit is not None:
+            found = found[:limit]
+        return new_postings(row for _, row in found)
+
+    def match_rows(self, condition: Any) -> array | None:
+        if not is_operator_condition(condition) or not set(condition) <= geo.GEO_OPERATORS:
+            return None
+        parts = []
+        if "$near" in condition:
+            parts.append(self.near(condition["$near"]))
+        if "$within_box" in condition:
+            parts.append(self.within_box(condition["$within_box"]))
+        return intersect_postings(*parts)
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._points.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "type": self.index_type,
+            "field": self.field_name,
+            "total_entries": len(self._points),
+            "cells": len(self._cells),
+            "cell_degrees": self.cell_degrees,
+            "postings_bytes": postings_bytes(self._cells.values())
+        }
+
+
+VECTOR_METRICS = ("cosine", "dot", "l2")
+
+
+class VectorIndex(BaseIndex):
+    """
+    Vector Index - embeddings of a field stacked into one contiguous
+    float32 matrix (a slot per document), searched top-k with batched
+    matrix products. Removal moves the last slot into the hole, so the
+    matrix never has gaps.
+
+    The optional IVF mode clusters the vectors (k-means on a sample) and
+    only scores the nprobe clusters closest to the query. The clustering
+    is rebuilt lazily once the table has changed by a quarter.
+    """
+
+    def __init__(self, field_name: str):
+        super().__init__(field_name)
+        self.index_type = "vector"
+        np = _numpy()
+        self.dim: int | None = None
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._slot_of: Dict[int, int] = {}
+        self._centroids = None
+        self._lists = None
+        self._changes_since_build = 0
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def _as_vector(self, value: Any):
+        if not isinstance(value, list) or not value or not all(_is_number(v) for v in value):
+            return None
+        if self.dim is not None and len(value) != self.dim:
+            return None
+        return _numpy().asarray(value, dtype="float32")
+
+    def _ensure_capacity(self, size: int) -> None:
+        if size <= len(self._ids):
+            return
+        np = _numpy()
+        capacity = max(size, len(self._ids) * 2, 256)
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        norms = np.zeros(capacity, dtype=np.float32)
+        ids = np.zeros(capacity, dtype=np.int64)
+        n = len(self._slot_of)
+        if n:
+            matrix[:n] = self._matrix[:n]
+            norms[:n] = self._norms[:n]
+            ids[:n] = self._ids[:n]
+        self._matrix, self._norms, self._ids = matrix, norms, ids
+        if self._lists is not None:
+            lists = np.zeros(capacity, dtype=np.int32)
+            lists[:n] = self._lists[:n]
+            self._lists = lists
+
+    def add(self, dense_id: int, value: Any) -> None:
+        vector = self._as_vector(value)
+        if vector is None:
+            return
+        if self.dim is None:
+            self.dim = len(vector)
+        if dense_id in self._slot_of:
+            self.remove(dense_id, None)
+
+        np = _numpy()
+        slot = len(self._slot_of)
+        self._ensure_capacity(slot + 1)
+        self._matrix[slot] = vector
+        self._norms[slot] = np.linalg.norm(vector)
+        self._ids[slot] = dense_id
+        self._slot_of[dense_id] = slot
+        if self._lists is not None:
+            self._lists[slot] = self._nearest_centroids(vector[None, :], 1)[0, 0]
+        self._changes_since_build += 1
+
+    def remove(self, dense_id: int, value: Any) -> None:
+        slot = self._slot_of.pop(dense_id, None)
+        if slot is None:
+            return
+
+        last = len(self._slot_of)
+        if slot != last:
+            moved = int(self._ids[last])
+            self._matrix[slot] = self._matrix[last]
+            self._norms[slot] = self._norms[last]
+            self._ids[slot] = moved
+            if self._lists is not None:
+                self._lists[slot] = self._lists[last]
+            self._slot_of[moved] = slot
+        self._changes_since_build += 1
+
+    def lookup(self, value: Any) -> array:
+        raise NotImplementedError("Vector index only supports similarity search")
+
+    def range_lookup(self, min_val: Any = None, max_val: Any = None,
+                     include_min: bool = True, include_max: bool = True) -> array:
+        raise NotImplementedError("Vector index only supports similarity search")
+
+    def _scores(self, query, slots, metric: str):
+        """Higher is better for every metric (l2 is negated distance)"""
+        matrix = self._matrix[slots]
+        dots = matrix @ query
+        if metric == "dot":
+            return dots
+        if metric == "cosine":
+            norms = self._norms[slots] * float(_numpy().linalg.norm(query))
+            return _numpy().divide(dots, norms, out=_numpy().zeros_like(dots), where=norms > 0)
+        squared = self._norms[slots] ** 2 - 2 * dots + float(query @ query)
+        return -_numpy().sqrt(_numpy().maximum(squared, 0))
+
+    def search(self, vector: List[float], k: int = 10, metric: str = "cosine",
+               nprobe: int | None = None, token: CancelToken | None = None) -> List[Tuple[int, float]]:
+        """
+        (dense id, score) best first; for l2 the score is the distance.
+        A cancelled token stops the scoring between batches.
+        """
+        if metric not in VECTOR_METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {list(VECTOR_METRICS)}")
+        n = len(self._slot_of)
+        if not n:
+            return []
+        query = self._as_vector(vector)
+        if query is None:
+            raise ValueError(f"Query vector must be {self.dim} numbers")
+
+        np = _numpy()
+        if nprobe and n >= VECTOR_IVF_MIN_ROWS:
+            self._build_ivf_if_stale()
+            probed = self._nearest_centroids(query[None, :], nprobe)[0]
+            candidates = np.flatnonzero(np.isin(self._lists[:n], probed))
+        else:
+            candidates = np.arange(n)
+
+        best_scores = np.zeros(0, dtype=np.float32)
+        best_slots = np.zeros(0, dtype=np.int64)
+        for start in range(0, len(candidates), VECTOR_BATCH_ROWS):
+            raise_if_cancelled(token)
+            slots = candidates[start:start + VECTOR_BATCH_ROWS]
+            scores = np.concatenate([best_scores, self._scores(query, slots, metric)])
+            slots = np.concatenate([best_slots, slots])
+            if len(scores) > k:
+                keep = np.argpartition(-scores, k - 1)[:k]
+                scores, slots = scores[keep], slots[keep]
+            best_scores, best_slots = scores, slots
+
+        order = np.argsort(-best_scores, kind="stable")
+        sign = -1.0 if metric == "l2" else 1.0
+        return [(int(self._ids[best_slots[i]]), sign * float(best_scores[i])) for i in order]
+
+    def _nearest_centroids(self, vectors, count: int):
+        np = _numpy()
+        distances = (
+            (vectors ** 2).sum(axis=1)[:, None]
+            - 2 * vectors @ self._centroids.T
+            + (self._centroids ** 2).sum(axis=1)[None, :]
+        )
+        count = min(count, len(self._centroids))
+        return np.argsort(distances, axis=1)[:, :count]
+
+    def _build_ivf_if_stale(self, iterations: int = 8) -> None:
+        n = len(self._slot_of)
+        if self._lists is not None and self._changes_since_build <= n // 4:
+            return
+
+        np = _numpy()
+        rng = np.random.default_rng(0)
+        nlist = max(1, int(n ** 0.5))
+        sample = self._matrix[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        self._centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assigned = self._nearest_centroids(sample, 1)[:, 0]
+            for c in range(nlist):
+                members = sample[assigned == c]
+                if len(members):
+                    self._centroids[c] = members.mean(axis=0)
+
+        lists = np.zeros(len(self._ids), dtype=np.int32)
+        for start in range(0, n, VECTOR_BATCH_ROWS):
+            end = min(n, start + VECTOR_BATCH_ROWS)
+            lists[start:end] = self._nearest_centroids(self._matrix[start:end], 1)[:, 0]
+        self._lists = lists
+        self._changes_since_build = 0
+
+    def clear(self) -> None:
+        np = _numpy()
+        self.dim = None
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._slot_of.clear()
+        self._centroids = None
+        self._lists = None
+        self._changes_since_build = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "type": self.index_type,
+            "field": self.field_name,
+            "total_entries": len(self._slot_of),
+            "dimensions": self.dim,
+            "matrix_bytes": int(self._matrix.nbytes),
+            "ivf_lists": len(self._centroids) if self._centroids is not None else 0
+        }
+
+
+COMPOUND_SEPARATOR = ","
+
+
+def compound_index_name(fields: List[str]) -> str:
+    return COMPOUND_SEPARATOR.join(fields)
+
+
+def is_compound_name(name: str) -> bool:
+    return COMPOUND_SEPARATOR in name
+
+
+class CompoundIndex(BaseIndex):
+    """
+    Compound Index - one entry per tuple of values of several fields.
+
+    The hash flavor answers equality on all fields. The btree flavor keeps
+    the tuples sorted, so equality on a leading prefix plus a range (or a
+    sort) on the next field is a single contiguous key range.
+    """
+
+    def __init__(self, fields: List[str], flavor: str = "hash"):
+        super().__init__(compound_index_name(fields))
+        if flavor not in ("hash", "btree"):
+            raise ValueError(f"Compound indexes support 'hash' and 'btree', not '{flavor}'")
+        self.fields = fields
+        self.index_type = flavor
+        self._sorted_keys: List[tuple] = []
+        self._data: Dict[tuple, array] = {}
+
+    def add(self, dense_id: int, value: tuple) -> None:
+        if value is None:
+            return
+
+        postings = self._data.get(value)
+        if postings is None:
+            if self.index_type == "btree":
+                bisect.insort(self._sorted_keys, value)
+            self._data[value] = new_postings((dense_id,))
+        else:
+            postings_add(postings, dense_id)
+
+    def remove(self, dense_id: int, value: tuple) -> None:
+        if value is None or value not in self._data:
+            return
+
+        postings = self._data[value]
+        postings_remove(postings, dense_id)
+
+        if not postings:
+            del self._data[value]
+            if self.index_type == "btree":
+                self._sorted_keys.remove(value)
+
+    def lookup(self, value: tuple) -> array:
+        return new_postings(self._data.get(tuple(value), ()))
+
+    def range_lookup(self, min_val: Any = None, max_val: Any = None,
+                     include_min: bool = True, include_max: bool = True) -> array:
+        raise NotImplementedError("Use prefix_lookup() on compound indexes")
+
+    def prefix_lookup(self, prefix: tuple, bounds: Tuple[Any, bool, Any, bool] | None = None,
+                      ordered: bool = False, reverse: bool = False) -> array:
+        """
+        Dense ids whose leading fields equal prefix and whose next field is
+        within bounds. ordered=True returns them in key order instead of
+        id order.
+        """
+        if self.index_type != "btree":
+            raise NotImplementedError("Hash compound indexes only support full-key lookups")
+
+        start_idx, end_idx = self._prefix_range(prefix, bounds)
+        keys = range(end_idx - 1, start_idx - 1, -1) if reverse else range(start_idx, end_idx)
+
+        if not ordered:
+            return union_postings(*(self._data[self._sorted_keys[i]] for i in keys))
+
+        result = new_postings()
+        for i in keys:
+            result.extend(self._data[self._sorted_keys[i]])
+        return result
+
+    def _prefix_range(self, prefix: tuple, bounds: Tuple[Any, bool, Any, bool] | None) -> Tuple[int, int]:
+        n = len(prefix)
+        keys = self._sorted_keys
+
+        if bounds is None:
+            head = lambda key: key[:n]
+            return bisect.bisect_left(keys, prefix, key=head), bisect.bisect_right(keys, prefix, key=head)
+
+        lower, include_lower, upper, include_upper = bounds
+        head = lambda key: key[:n + 1]
+
+        if lower is None:
+            start_idx = bisect.bisect_left(keys, prefix, key=lambda key: key[:n])
+        elif include_lower:
+            start_idx = bisect.bisect_left(keys, prefix + (lower,), key=head)
+        else:
+            start_idx = bisect.bisect_right(keys, prefix + (lower,), key=head)
+
+        if upper is None:
+            end_idx = bisect.bisect_right(keys, prefix, key=lambda key: key[:n])
+        elif include_upper:
+            end_idx = bisect.bisect_right(keys, prefix + (upper,), key=head)
+        else:
+            end_idx = bisect.bisect_left(keys, prefix + (upper,), key=head)
+
+        return start_idx, end_idx
+
     def clear(self) -> None:
         self._sorted_keys.clear()
         self._data.clear()
 
+    def entries(self, prefix: tuple = (),
+                bounds: Tuple[Any, bool, Any, bool] | None = None) -> Iterable[Tuple[Any, Iterable[int]]]:
+        """Entries, restricted to a leading prefix and next-field bounds on btree"""
+        if self.index_type != "btree" or (not prefix and bounds is None):
+            return self._data.items()
+        start_idx, end_idx = self._prefix_range(prefix, bounds)
+        return ((key, self._data[key]) for key in self._sorted_keys[start_idx:end_idx])
+
     def stats(self) -> Dict[str, Any]:
         total_docs = sum(len(docs) for docs in self._data.values())
         return {
             "type": self.index_type,
             "field": self.field_name,
+            "fields": self.fields,
             "unique_values": len(self._data),
             "total_entries": total_docs,
-            "min_value": self._sorted_keys[0] if self._sorted_keys else None,
-            "max_value": self._sorted_keys[-1] if self._sorted_keys else None
+            "postings_bytes": postings_bytes(self._data.values())
         }
 
 
 class IndexManager:
-    def __init__(self):
+    def __init__(self, id_map: DocIdMap | None = None):
         self.indexes: Dict[str, BaseIndex] = {}
+        # indexes still being filled: writers maintain them, queries don't see them
+        self._building: Dict[str, BaseIndex] = {}
+        # shared with db_storage in the server, private when used standalone
+        self.id_map = id_map if id_map is not None else DocIdMap()
+        # every indexed (live) document of the table, the universe for NOT
+        self.live_rows = RoaringBitmap()
+        # predicate fields seen holding an array, including in documents a
+        # partial index left out
+        self._array_fields: Set[str] = set()
 
-    def create_index(self, field_name: str, index_type: str = "hash") -> BaseIndex:
-        if field_name in self.indexes:
+    def create_index(self, field_name: str, index_type: str = "hash",
+                     predicate: Dict[str, Any] | None = None, building: bool = False) -> BaseIndex:
+        """
+        building=True keeps the index out of query planning until
+        finish_index(), so a half-filled index never answers a query.
+        """
+        if field_name in self.indexes or field_name in self._building:
             raise ValueError(f"Index for field '{field_name}' already exists")
+        if predicate:
+            validate_filter(predicate)
 
-        if index_type == "hash":
+        if is_compound_name(field_name):
+            fields = field_name.split(COMPOUND_SEPARATOR)
+            if len(fields) < 2 or not all(fields) or len(set(fields)) != len(fields):
+                raise ValueError(f"Invalid compound index fields: '{field_name}'")
+            index = CompoundIndex(fields, index_type)
+        elif index_type == "hash":
             index = HashIndex(field_name)
         elif index_type == "btree":
             index = BTreeIndex(field_name)
+        elif index_type == "bitmap":
+            index = BitmapIndex(field_name)
+        elif index_type == "text":
+            index = TextIndex(field_name)
+        elif index_type == "column":
+            index = ColumnIndex(field_name)
+        elif index_type == "vector":
+            index = VectorIndex(field_name)
+        elif index_type == "geo":
+            index = GeoIndex(field_name)
         else:
             raise ValueError(f"Unknown index type: {index_type}")
 
-        self.indexes[field_name] = index
+        index.predicate = predicate or None
+        if building:
+            self._building[field_name] = index
+        else:
+            self.indexes[field_name] = index
         return index
 
+    def finish_index(self, field_name: str) -> None:
+        """Publishes an index created with building=True"""
+        self.indexes[field_name] = self._building.pop(field_name)
+
     def drop_index(self, field_name: str) -> bool:
         if field_name in self.indexes:
             del self.indexes[field_name]
             return True
-        return False
+        return self._building.pop(field_name, None) is not None
+
+    def _maintained(self) -> Iterable[BaseIndex]:
+        """Every index writers keep current, published or still building"""
+        if not self._building:
+            return self.indexes.values()
+        return [*self.indexes.values(), *self._building.values()]
+
+    def indexed_keys(self) -> Set[str]:
+        """Top-level body keys any index or index predicate reads"""
+        keys = set()
+        for name, index in [*self.indexes.items(), *self._building.items()]:
+            paths = name.split(COMPOUND_SEPARATOR) + list(index.predicate or ())
+            keys.update(path.split(".", 1)[0] for path in paths)
+        return keys
 
     def has_index(self, field_name: str) -> bool:
         return field_name in self.indexes
@@ -188,32 +1392,49 @@ class IndexManager:
     def get_index(self, field_name: str) -> Optional[BaseIndex]:
         return self.indexes.get(field_name)
 
+    def index_document(self, field_name: str, doc_id: uuid.UUID, body: Dict[str, Any]) -> None:
+        """Adds a document to one index only (used while building it)"""
+        index = self._building.get(field_name) or self.indexes[field_name]
+        dense_id = self.id_map.assign(doc_id)
+        self.live_rows.add(dense_id)
+        value = self._index_value(index, body)
+        if value is not None:
+            index.add(dense_id, value)
+
     def add_document(self, doc_id: uuid.UUID, body: Dict[str, Any]) -> None:
-        for field_name, index in self.indexes.items():
-            value = self._get_nested_value(body, field_name)
+        dense_id = self.id_map.assign(doc_id)
+        self.live_rows.add(dense_id)
+        for index in self._maintained():
+            value = self._index_value(index, body)
             if value is not None:
-                index.add(doc_id, value)
+                index.add(dense_id, value)
 
     def remove_document(self, doc_id: uuid.UUID, body: Dict[str, Any]) -> None:
-        for field_name, index in self.indexes.items():
-            value = self._get_nested_value(body, field_name)
+        dense_id = self.id_map.get(doc_id)
+        if dense_id is None:
+            return
+        self.live_rows.remove(dense_id)
+        for index in self._maintained():
+            value = self._index_value(index, body)
             if value is not None:
-                index.remove(doc_id, value)
+                index.remove(dense_id, value)
 
     def update_document(self, doc_id: uuid.UUID, old_body: Dict[str, Any],
                         new_body: Dict[str, Any]) -> None:
-        for field_name, index in self.indexes.items():
-            old_value = self._get_nested_value(old_body, field_name)
-            new_value = self._get_nested_value(new_body, field_name)
+        dense_id = self.id_map.assign(doc_id)
+        for index in self._maintained():
+            old_value = self._index_value(index, old_body)
+            new_value = self._index_value(index, new_body)
 
             if old_value != new_value:
                 if old_value is not None:
-                    index.remove(doc_id, old_value)
+                    index.remove(dense_id, old_value)
                 if new_value is not None:
-                    index.add(doc_id, new_value)
+                    index.add(dense_id, new_value)
 
-    def query(self, field_name: str, value: Any = None,
-              min_val: Any = None, max_val: Any = None) -> Set[uuid.UUID]:
+    def query_rows(self, field_name: str, value: Any = None,
+                   min_val: Any = None, max_val: Any = None) -> array:
+        """Same as query() but returns sorted dense ids"""
         index = self.indexes.get(field_name)
         if not index:
             raise ValueError(f"No index for field '{field_name}'")
@@ -226,8 +1447,352 @@ class IndexManager:
 
         raise ValueError("Either 'value' or 'min_val/max_val' must be provided")
 
-    def rebuild_all(self, documents: List[Any]) -> None:
+    def query(self, field_name: str, value: Any = None,
+              min_val: Any = None, max_val: Any = None) -> Set[uuid.UUID]:
+        rows = self.query_rows(field_name, value=value, min_val=min_val, max_val=max_val)
+        return self.to_uuids(rows)
+
+    def to_uuids(self, rows: Iterable[int]) -> Set[uuid.UUID]:
+        return {self.id_map.to_uuid(row) for row in rows}
+
+    def plan(self, filter_body: Dict[str, Any]) -> Tuple[array | None, List[str]]:
+        """
+        Candidate dense ids for filter_body from every usable index,
+        intersected; None when no index applies. Candidates are a superset
+        of the matches, callers still re-check the filter.
+        """
+        postings: List[array] = []
+        bitmap: RoaringBitmap | None = None
+        used_fields: List[str] = []
+
+        for name, index in self.indexes.items():
+            if not isinstance(index, CompoundIndex) or not self._usable(index, filter_body):
+                continue
+            try:
+                rows = self._lookup_compound(index, filter_body)
+            except Exception as e:
+                print(f"⚠️ Index lookup failed for '{name}': {e}")
+                continue
+            if rows is not None:
+                postings.append(rows)
+                used_fields.append(name)
+
+        for field, condition in filter_body.items():
+            index = self.indexes.get(field)
+            if index is None or isinstance(index, (TextIndex, VectorIndex)) or not self._usable(index, filter_body):
+                continue
+            if mentions_null(condition):
+                continue
+
+            try:
+                if isinstance(index, BitmapIndex):
+                    matched = index.match(condition, self.live_rows)
+                    if matched is None:
+                        continue
+                    bitmap = matched if bitmap is None else bitmap & matched
+                else:
+                    rows = self._lookup_condition(index, condition)
+                    if rows is None:
+                        continue
+                    postings.append(rows)
+                used_fields.append(field)
+            except Exception as e:
+                print(f"⚠️ Index lookup failed for '{field}': {e}")
+
+        if bitmap is not None:
+            postings.append(bitmap.to_array())
+
+        if not postings:
+            return None, used_fields
+
+        return intersect_postings(*postings), used_fields
+
+    def _usable(self, index: BaseIndex, filter_body: Dict[str, Any]) -> bool:
+        """A partial index only holds the answer if the query implies its predicate"""
+        return index.predicate is None or filter_implies(filter_body, index.predicate, self._multikey_fields())
+
+    def _multikey_fields(self) -> Set[str]:
+        fields = set(self._array_fields)
+        for name, index in self.indexes.items():
+            if index.multikey:
+                fields.update(name.split(COMPOUND_SEPARATOR))
+        return fields
+
+    def _lookup_condition(self, index: BaseIndex, condition: Any) -> array | None:
+        if isinstance(index, (ColumnIndex, GeoIndex)):
+            return index.match_rows(condition)
+
+        if is_operator_condition(condition) and set(condition) == {"$in"}:
+            return union_postings(*(index.lookup(v) for v in condition["$in"]))
+
+        if isinstance(index, BTreeIndex):
+            bounds = range_bounds(condition)
+            if bounds is not None:
+                lower, include_lower, upper, include_upper = bounds
+                return index.range_lookup(lower, upper, include_lower, include_upper)
+            prefix = prefix_value(condition)
+            if prefix is not None:
+                return index.prefix_lookup(prefix)
+
+        value = equality_value(condition)
+        if value is None or isinstance(value, (list, dict)):
+            # whole-array equality isn't a key lookup
+            return None
+        return index.lookup(value)
+
+    def _equality_prefix(self, index: 'CompoundIndex', filter_body: Dict[str, Any]) -> tuple:
+        prefix = []
+        for field in index.fields:
+            if field not in filter_body:
+                break
+            value = equality_value(filter_body[field])
+            if value is None or isinstance(value, (list, dict)):
+                break
+            prefix.append(value)
+        return tuple(prefix)
+
+    def _lookup_compound(self, index: 'CompoundIndex', filter_body: Dict[str, Any]) -> array | None:
+        prefix = self._equality_prefix(index, filter_body)
+
+        if len(prefix) == len(index.fields):
+            return index.lookup(prefix)
+
+        if index.index_type != "btree" or not prefix:
+            return None
+
+        next_field = index.fields[len(prefix)]
+        bounds = range_bounds(filter_body[next_field]) if next_field in filter_body else None
+        return index.prefix_lookup(prefix, bounds)
+
+    def ordered_rows(self, filter_body: Dict[str, Any], sort_by: str, reverse: bool = False,
+                     limit: int | None = None) -> array | None:
+        """
+        Candidate dense ids already in sort_by order, when a btree index can
+        produce them: a single-field btree on sort_by, or a compound btree
+        whose leading fields are equalities and whose next field is sort_by.
+        The filter must constrain sort_by, otherwise documents missing the
+        field (absent from the index) would be lost.
+
+        limit cuts the walk short, but only when the index answers the
+        whole filter, i.e. sort_by is the only filtered field.
+        """
+        if sort_by not in filter_body:
+            return None
+
+        condition = filter_body[sort_by]
+        if len(filter_body) > 1:
+            limit = None
+
+        index = self.indexes.get(sort_by)
+        if index is not None and not self._usable(index, filter_body):
+            index = None
+        if isinstance(index, ColumnIndex):
+            return index.ordered(condition, reverse=reverse, limit=limit)
+        prefix = prefix_value(condition)
+        if prefix is not None:
+            if isinstance(index, BTreeIndex):
+                return index.prefix_lookup(prefix, ordered=True, reverse=reverse, limit=limit)
+            return None
+
+        value = equality_value(condition)
+        bounds = range_bounds(condition)
+        if bounds is None and value is not None and not isinstance(value, (list, dict)):
+            bounds = (value, True, value, True)
+        if bounds is None:
+            return None
+
+        if isinstance(index, BTreeIndex):
+            lower, include_lower, upper, include_upper = bounds
+            return index.ordered_lookup(lower, upper, include_lower, include_upper,
+                                        reverse=reverse, limit=limit)
+
+        for index in self.indexes.values():
+            if not isinstance(index, CompoundIndex) or index.index_type != "btree":
+                continue
+            if sort_by not in index.fields or not self._usable(index, filter_body):
+                continue
+            position = index.fields.index(sort_by)
+            prefix = self._equality_prefix(index, filter_body)
+            if len(prefix) >= position:
+                return index.prefix_lookup(prefix[:position], bounds, ordered=True, reverse=reverse)
+
+        return None
+
+    def covered_rows(self, filter_body: Dict[str, Any],
+                     fields: List[str]) -> List[Tuple[int, Dict[str, Any]]] | None:
+        """
+        Answers a projected query from index keys alone: (dense id,
+        {field: value}) pairs in id order, or None if no index covers it.
+
+        An index covers the query when it holds every filtered and
+        projected field (besides "_id") and each of its fields is filtered
+        by a condition that rejects a missing value, since documents
+        lacking an indexed field are not in the index at all. Multikey
+        indexes never cover: their keys are elements, not field values.
+        """
+        wanted = {f for f in fields if f != "_id"} | set(filter_body)
+
         for index in self.indexes.values():
+            if isinstance(index, (TextIndex, ColumnIndex, VectorIndex, GeoIndex)) or index.multikey:
+                continue
+            index_fields = index.fields if isinstance(index, CompoundIndex) else [index.field_name]
+            if not wanted <= set(index_fields) or not self._usable(index, filter_body):
+                continue
+            if any(f not in filter_body or matches_condition(None, filter_body[f]) for f in index_fields):
+                continue
+
+            found = []
+            for key, rows in self._covered_entries(index, filter_body):
+                values = dict(zip(index_fields, key)) if isinstance(index, CompoundIndex) else {index.field_name: key}
+                if all(matches_condition(values[f], condition) for f, condition in filter_body.items()):
+                    found.extend((row, values) for row in rows)
+            found.sort(key=lambda item: item[0])
+            return found
+
+        return None
+
+    def _covered_entries(self, index: BaseIndex,
+                         filter_body: Dict[str, Any]) -> Iterable[Tuple[Any, Iterable[int]]]:
+        """
+        Entries of a covering index that can match filter_body: a single
+        key for equality, a key range on btree, every entry otherwise.
+        """
+        if isinstance(index, CompoundIndex):
+            prefix = self._equality_prefix(index, filter_body)
+            if len(prefix) == len(index.fields):
+                rows = index.lookup(prefix)
+                return [(prefix, rows)] if rows else []
+            return index.entries(prefix, range_bounds(filter_body[index.fields[len(prefix)]]))
+
+        condition = filter_body[index.field_name]
+        value = equality_value(condition)
+        if value is not None and not isinstance(value, (list, dict)):
+            rows = index.lookup(value)
+            return [(value, rows)] if rows else []
+        if isinstance(index, BTreeIndex):
+            return index.entries(range_bounds(condition))
+        return index.entries()
+
+    def exact_rows(self, filter_body: Dict[str, Any]) -> array | None:
+        """
+        Dense ids matching filter_body when single-field indexes answer
+        every condition exactly (no re-check needed), otherwise None.
+        """
+        rows, used_fields = self.plan(filter_body)
+        if rows is None or not all(field in used_fields for field in filter_body):
+            return None
+        return rows
+
+    def count(self, filter_body: Dict[str, Any]) -> int | None:
+        """
+        Number of live documents matching filter_body from posting sizes,
+        None when the indexes can't answer exactly.
+        """
+        if len(filter_body) == 1:
+            (field, condition), = filter_body.items()
+            index = self.indexes.get(field)
+            if isinstance(index, (HashIndex, BTreeIndex, BitmapIndex)) and self._usable(index, filter_body):
+                value = equality_value(condition)
+                if value is not None and not isinstance(value, (list, dict)):
+                    return index.count(value)
+                bounds = range_bounds(condition)
+                if bounds is not None and isinstance(index, BTreeIndex) and not index.multikey:
+                    # a document sits under one key only: sizes add up
+                    return sum(len(rows) for _, rows in index.entries(bounds))
+
+        rows = self.exact_rows(filter_body)
+        return len(rows) if rows is not None else None
+
+    def distinct(self, field_name: str, filter_body: Dict[str, Any]) -> List[Tuple[Any, int]] | None:
+        """
+        (value, document count) for every key of the index on field_name,
+        restricted to the documents matching filter_body. None when that
+        can't be read off the indexes.
+        """
+        index = self.indexes.get(field_name)
+        if not isinstance(index, (HashIndex, BTreeIndex, BitmapIndex)) or not self._usable(index, filter_body):
+            return None
+
+        if not filter_body:
+            return [(key, len(rows)) for key, rows in index.entries()]
+
+        rows = self.exact_rows(filter_body)
+        if rows is None:
+            return None
+
+        counts = []
+        for key, key_rows in index.entries():
+            if isinstance(key_rows, RoaringBitmap):
+                key_rows = key_rows.to_array()
+            n = len(intersect_postings(rows, key_rows))
+            if n:
+                counts.append((key, n))
+        return counts
+
+    def min_max(self, field_name: str, filter_body: Dict[str, Any]) -> Tuple[Any, Any] | None:
+        """
+        Smallest and largest value of field_name over the matching
+        documents, read off the ends of its btree. Only when the filter is
+        empty or a range/equality on that same field.
+        """
+        index = self.indexes.get(field_name)
+        if not isinstance(index, BTreeIndex) or index.multikey or not self._usable(index, filter_body):
+            return None
+        if not filter_body:
+            return index.key_extremes()
+        if set(filter_body) != {field_name}:
+            return None
+
+        condition = filter_body[field_name]
+        bounds = range_bounds(condition)
+        value = equality_value(condition)
+        if bounds is None and value is not None and not isinstance(value, (list, dict)):
+            bounds = (value, True, value, True)
+        if bounds is None:
+            return None
+        return index.key_extremes(bounds)
+
+    def nearest_rows(self, filter_body: Dict[str, Any], limit: int | None = None) -> array | None:
+        """
+        Dense ids of the filter's $near matches, nearest first, from a geo
+        index. limit applies only when that condition is the whole filter.
+        """
+        near = geo.near_condition(filter_body)
+        if near is None:
+            return None
+        field, operand = near
+        index = self.indexes.get(field)
+        if not isinstance(index, GeoIndex) or not self._usable(index, filter_body):
+            return None
+        if len(filter_body) > 1 or set(filter_body[field]) != {"$near"}:
+            limit = None
+        return index.near(operand, ordered=True, limit=limit)
+
+    def column_for(self, field_name: str, filter_body: Dict[str, Any]) -> Optional['ColumnIndex']:
+        index = self.indexes.get(field_name)
+        if not isinstance(index, ColumnIndex) or index.mixed or not self._usable(index, filter_body):
+            return None
+        return index
+
+    def search_rows(self, field_name: str, query: str, limit: int | None = 10) -> List[Tuple[int, float]]:
+        index = self.indexes.get(field_name)
+        if not isinstance(index, TextIndex):
+            raise ValueError(f"No text index for field '{field_name}'")
+        return index.search(query, limit)
+
+    def vector_rows(self, field_name: str, vector: List[float], k: int = 10, metric: str = "cosine",
+                    nprobe: int | None = None, token: CancelToken | None = None) -> List[Tuple[int, float]]:
+        index = self.indexes.get(field_name)
+        if not isinstance(index, VectorIndex):
+            raise ValueError(f"No vector index for field '{field_name}'")
+        return index.search(vector, k, metric, nprobe, token)
+
+    def text_fields(self) -> List[str]:
+        return [name for name, index in self.indexes.items() if isinstance(index, TextIndex)]
+
+    def rebuild_all(self, documents: List[Any]) -> None:
+        self.live_rows = RoaringBitmap()
+        for index in self._maintained():
             index.clear()
 
         for doc in documents:
@@ -235,20 +1800,39 @@ class IndexManager:
                 self.add_document(doc.id, doc.body)
 
     def list_indexes(self) -> List[Dict[str, Any]]:
-        return [index.stats() for index in self.indexes.values()]
+        stats = []
+        for index in self.indexes.values():
+            entry = index.stats()
+            if index.predicate is not None:
+                entry["predicate"] = index.predicate
+            stats.append(entry)
+        return stats
 
     def clear_all(self) -> None:
-        for index in self.indexes.values():
+        self.live_rows = RoaringBitmap()
+        for index in self._maintained():
             index.clear()
 
-    def _get_nested_value(self, data: Dict[str, Any], field_path: str) -> Any:
-        keys = field_path.split(".")
-        value = data
+    def _index_value(self, index: BaseIndex, body: Dict[str, Any]) -> Any:
+        if index.predicate is not None:
+            for field in index.predicate:
+                if isinstance(resolve_path(body, field), list):
+                    self._array_fields.add(field)
+            if not matches_filter(body, index.predicate):
+                return None
 
-        for key in keys:
-            if isinstance(value, dict):
-                value = value.get(key)
-            else:
+        if not isinstance(index, CompoundIndex):
+            return self._get_nested_value(body, index.field_name)
+
+        values = []
+        for field in index.fields:
+            value = self._get_nested_value(body, field)
+            # compound keys need every field, as hashable scalars
+            if value is None or isinstance(value, (list, dict)):
                 return None
+            values.append(value)
+        return tuple(values)
 
-        return value
\ No newline at end of file
+    def _get_nested_value(self, data: Dict[str, Any], field_path: str) -> Any:
+        # same path semantics as the filter matcher, including arrays
+        return resolve_path(data, field_path)
\ No newline at end of file
@@ -0,0 +1,125 @@
+import sys
+from typing import Any, Dict, Iterable, List, Set
+
+from core.constants.main_values import (VALUE_DICT_MAX_ENTRIES, VALUE_DICT_MAX_LENGTH,
+                                        VALUE_DICT_SAMPLE_SIZE, VALUE_DICT_MIN_HIT_RATIO)
+
+# JSON parsing makes a new str for every key and value of every body.
+# Keys go through sys.intern; short string values go through a per-table
+# dictionary, so "status": "active" over a million documents is one
+# "status" and one "active" object shared by all of them.
+# High-cardinality values (ids, emails) would only grow the dictionary:
+# the hit ratio is sampled per top-level field and per table, and a field
+# or table whose values rarely repeat is no longer interned.
+
+
+class ValueDictionary:
+    """Per-table dictionary of repeated short string values"""
+
+    __slots__ = ("_values", "max_entries", "hits", "misses", "enabled", "skipped_fields",
+                 "_field_window", "_window")
+
+    def __init__(self, max_entries: int = VALUE_DICT_MAX_ENTRIES):
+        self._values: Dict[str, str] = {}
+        self.max_entries = max_entries
+        self.hits = 0
+        # lookups that found no shared value
+        self.misses = 0
+        self.enabled = True
+        self.skipped_fields: Set[str] = set()
+        # [lookups, hits] of the current sampling window, per field and overall
+        self._field_window: Dict[str, List[int]] = {}
+        self._window = [0, 0]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def canonical(self, value: str, field: str) -> str:
+        if not self.enabled or field in self.skipped_fields:
+            return value
+
+        shared = self._values.get(value)
+        if shared is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if len(self._values) < self.max_entries:
+                self._values[value] = value
+        self._observe(field, shared is not None)
+        return value if shared is None else shared
+
+    def _observe(self, field: str, hit: bool) -> None:
+        window = self._field_window.get(field)
+        if window is None:
+            window = self._field_window[field] = [0, 0]
+        if _window_is_low(window, hit):
+            self.skipped_fields.add(field)
+            del self._field_window[field]
+        if _window_is_low(self._window, hit):
+            self.enabled = False
+
+    def size_in_bytes(self) -> int:
+        return sys.getsizeof(self._values) + sum(sys.getsizeof(v) for v in self._values)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._values),
+            "hits": self.hits,
+            "misses": self.misses,
+            "enabled": self.enabled,
+            "skipped_fields": sorted(self.skipped_fields),
+            "bytes": self.size_in_bytes()
+        }
+
+
+def _window_is_low(window: List[int], hit: bool) -> bool:
+    """Counts one lookup; True when a full window's hit ratio was too low"""
+    window[0] += 1
+    window[1] += hit
+    if window[0] < VALUE_DICT_SAMPLE_SIZE:
+        return False
+    low = window[1] < window[0] * VALUE_DICT_MIN_HIT_RATIO
+    window[0] = window[1] = 0
+    return low
+
+
+def intern_value(value: Any, dictionary: ValueDictionary, field: str = "") -> Any:
+    """field is the top-level body key the value sits under"""
+    if isinstance(value, str):
+        return dictionary.canonical(value, field) if len(value) <= VALUE_DICT_MAX_LENGTH else value
+    if isinstance(value, dict):
+        return {
+            sys.intern(k) if isinstance(k, str) else k: intern_value(v, dictionary, field)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [intern_value(v, dictionary, field) for v in value]
+    return value
+
+
+def intern_body(body: Dict[str, Any], dictionary: ValueDictionary) -> Dict[str, Any]:
+    """Copy of body with interned keys and dictionary-shared short strings"""
+    return {
+        sys.intern(k) if isinstance(k, str) else k: intern_value(v, dictionary, k)
+        for k, v in body.items()
+    }
+
+
+def deep_size(obj: Any, seen: set) -> int:
+    """Bytes of obj and everything it holds, objects in seen counted once"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += deep_size(k, seen) + deep_size(v, seen)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            size += deep_size(v, seen)
+    return size
+
+
+def bodies_size(bodies: Iterable[Dict[str, Any]]) -> int:
+    seen: set = set()
+    return sum(deep_size(body, seen) for body in bodies)
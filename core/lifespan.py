@@ -1,18 +1,41 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from core import wal
+from core.constants.main_values import YARADB_ROLE, HASH_VERIFY_INTERVAL
 import asyncio
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("--- YaraDB: Starting up... ---")
+    print(f"--- YaraDB: Starting up ({YARADB_ROLE})... ---")
+
+    if YARADB_ROLE == "reader":
+        from core import replica
+
+        replica.full_reload()
+        sync_task = asyncio.create_task(replica.follow_wal())
+
+        print("--- YaraDB: Replica startup complete. Service is running. ---")
+
+        yield
+
+        # readers never touch the data files; the owner checkpoints
+        sync_task.cancel()
+        await replica.close_owner_client()
+        return
 
     wal.load_snapshot()
 
     wal.recover_from_wal()
 
+    verify_task = None
+    if HASH_VERIFY_INTERVAL > 0:
+        from core import repository
+        verify_task = asyncio.create_task(repository.verify_hashes_periodically(HASH_VERIFY_INTERVAL))
+
     print("--- YaraDB: Startup complete. Service is running. ---")
 
     yield
 
-    await asyncio.to_thread(wal.perform_checkpoint)
\ No newline at end of file
+    if verify_task is not None:
+        verify_task.cancel()
+    await asyncio.to_thread(wal.perform_checkpoint)
@@ -0,0 +1,172 @@
+import uuid
+from typing import Any, Dict, Iterator
+
+from core import state
+from core import shards
+
+
+class Snapshot:
+    """
+    Point-in-time view of the document storage.
+
+    Every committed document version carries the commit sequence number
+    that produced it. A snapshot remembers the sequence number and the
+    storage length at the moment it was opened and resolves every document
+    to the newest version committed at or before that point, so a reader
+    never needs to hold db_lock while it walks the data.
+    """
+
+    def __init__(self, seq: int, storage_len: int):
+        self.seq = seq
+        self.storage_len = storage_len
+        self._closed = False
+
+    def resolve(self, doc: Any) -> Any:
+        """Returns the version of doc visible in this snapshot (or None)"""
+        if doc is None:
+            return None
+
+        if doc._commit_seq <= self.seq:
+            return doc
+
+        for old in reversed(state.db_old_versions.get(doc.id, ())):
+            if old._commit_seq <= self.seq:
+                return old
+
+        return None
+
+    def get(self, doc_id: uuid.UUID) -> Any:
+        return self.resolve(state.db_index_by_id.get(doc_id))
+
+    def documents(self) -> Iterator[Any]:
+        """Yields every visible document in storage order"""
+        for row in range(self.storage_len):
+            if row >= len(state.db_storage):
+                # storage was reset underneath us (replica reload / wipe)
+                break
+            doc = self.resolve(state.db_storage[row])
+            if doc is not None:
+                yield doc
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+
+        oldest_reader = min(state.db_active_snapshots, default=None)
+        refs = state.db_active_snapshots.get(self.seq, 0) - 1
+        if refs > 0:
+            state.db_active_snapshots[self.seq] = refs
+            return
+        state.db_active_snapshots.pop(self.seq, None)
+
+        # versions are pinned by the oldest reader alone, so nothing new
+        # becomes garbage until that reader goes away
+        if self.seq == oldest_reader:
+            _collect_garbage()
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def open_snapshot() -> Snapshot:
+    seq = state.db_commit_seq
+    state.db_active_snapshots[seq] = state.db_active_snapshots.get(seq, 0) + 1
+    return Snapshot(seq, len(state.db_storage))
+
+
+def next_commit_seq() -> int:
+    state.db_commit_seq += 1
+    return state.db_commit_seq
+
+
+def install_new(doc: Any) -> None:
+    """Publishes a freshly created document"""
+    doc._commit_seq = next_commit_seq()
+    row = state.db_doc_ids.assign(doc.id)
+    state.db_storage.append(doc)
+    state.db_index_by_id[doc.id] = doc
+
+    table_data = getattr(doc, "table_data", None)
+    if isinstance(table_data, dict) and table_data.get("name"):
+        shards.assign(table_data["name"], doc.id, row)
+        note_table_change(table_data["name"])
+
+
+def install_version(old_doc: Any, new_doc: Any) -> None:
+    """
+    Replaces old_doc with new_doc (copy-on-write).
+
+    The old version is kept in the version chain only while some snapshot
+    may still need it; otherwise it is dropped right away and left to the
+    garbage collector.
+    """
+    new_doc._commit_seq = next_commit_seq()
+
+    if state.db_active_snapshots:
+        state.db_old_versions.setdefault(old_doc.id, []).append(old_doc)
+
+    row = state.db_doc_ids.get(old_doc.id)
+    if row is not None:
+        state.db_storage[row] = new_doc
+    state.db_index_by_id[new_doc.id] = new_doc
+
+    table_data = getattr(new_doc, "table_data", None)
+    if isinstance(table_data, dict) and table_data.get("name"):
+        note_table_change(table_data["name"])
+
+
+def note_table_change(table_name: str) -> None:
+    state.db_table_changes[table_name] = state.db_table_changes.get(table_name, 0) + 1
+    state.db_table_positions[table_name] = state.db_wal_position
+
+
+def table_change_count(table_name: str) -> int:
+    return state.db_table_changes.get(table_name, 0)
+
+
+def table_position(table_name: str) -> int:
+    """WAL offset of the last change to the table (0: none since the snapshot)"""
+    return state.db_table_positions.get(table_name, 0)
+
+
+def reset() -> None:
+    state.db_old_versions.clear()
+    state.db_doc_ids.clear()
+    shards.reset()
+    state.db_wal_position = 0
+    state.db_table_positions.clear()
+
+
+def _collect_garbage() -> None:
+    if not state.db_old_versions:
+        return
+
+    if not state.db_active_snapshots:
+        state.db_old_versions.clear()
+        return
+
+    oldest_reader = min(state.db_active_snapshots)
+
+    for doc_id in list(state.db_old_versions):
+        chain = state.db_old_versions[doc_id]
+        newer_seqs = [v._commit_seq for v in chain[1:]] + [state.db_index_by_id[doc_id]._commit_seq]
+
+        # a version is dead once its successor is visible to the oldest reader
+        kept = [v for v, next_seq in zip(chain, newer_seqs) if next_seq > oldest_reader]
+
+        if kept:
+            state.db_old_versions[doc_id] = kept
+        else:
+            del state.db_old_versions[doc_id]
+
+
+def version_stats() -> Dict[str, int]:
+    return {
+        "commit_seq": state.db_commit_seq,
+        "active_snapshots": sum(state.db_active_snapshots.values()),
+        "retained_versions": sum(len(chain) for chain in state.db_old_versions.values())
+    }
@@ -0,0 +1,333 @@
+import math
+from typing import Any, Collection, Dict, Tuple
+
+# Filter documents are {field: condition}. A condition is either a plain
+# value (equality) or an operator document such as {"$in": [...]}.
+OPERATORS = {"$eq", "$ne", "$in", "$nin", "$gt", "$gte", "$lt", "$lte", "$prefix", "$near", "$within_box"}
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+GEO_OPERATORS = {"$near", "$within_box"}
+
+EARTH_RADIUS_M = 6371008.8
+_NEAR_KEYS = ("lat", "lon", "max_distance_m")
+_BOX_KEYS = ("min_lat", "min_lon", "max_lat", "max_lon")
+
+
+def is_operator_condition(condition: Any) -> bool:
+    return (
+        isinstance(condition, dict)
+        and bool(condition)
+        and all(isinstance(k, str) and k.startswith("$") for k in condition)
+    )
+
+
+def validate_filter(filter_body: Dict[str, Any]) -> None:
+    for field, condition in filter_body.items():
+        if is_operator_condition(condition):
+            unknown = set(condition) - OPERATORS
+            if unknown:
+                raise ValueError(f"Unknown filter operator(s) for '{field}': {sorted(unknown)}")
+            for op in ("$in", "$nin"):
+                if op in condition and not isinstance(condition[op], list):
+                    raise ValueError(f"'{op}' for '{field}' expects a list")
+            if "$prefix" in condition and not isinstance(condition["$prefix"], str):
+                raise ValueError(f"'$prefix' for '{field}' expects a string")
+            if "$near" in condition:
+                _validate_geo_operand(field, "$near", condition["$near"], _NEAR_KEYS)
+            if "$within_box" in condition:
+                _validate_geo_operand(field, "$within_box", condition["$within_box"], _BOX_KEYS)
+
+
+def _validate_geo_operand(field: str, op: str, operand: Any, keys: Tuple[str, ...]) -> None:
+    if not isinstance(operand, dict) or not all(_is_coordinate(operand.get(k)) for k in keys):
+        raise ValueError(f"'{op}' for '{field}' expects numbers for {list(keys)}")
+
+
+def _is_coordinate(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def geo_point(value: Any) -> Tuple[float, float] | None:
+    """(lat, lon) of a {"lat": ..., "lon": ...} body value"""
+    if isinstance(value, dict) and _is_coordinate(value.get("lat")) and _is_coordinate(value.get("lon")):
+        return float(value["lat"]), float(value["lon"])
+    return None
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def within_box(point: Tuple[float, float], box: Dict[str, Any]) -> bool:
+    lat, lon = point
+    return box["min_lat"] <= lat <= box["max_lat"] and box["min_lon"] <= lon <= box["max_lon"]
+
+
+def within_radius(point: Tuple[float, float], near: Dict[str, Any]) -> bool:
+    return haversine_m(point[0], point[1], near["lat"], near["lon"]) <= near["max_distance_m"]
+
+
+def near_condition(filter_body: Dict[str, Any]) -> Tuple[str, Dict[str, Any]] | None:
+    """(field, $near operand) of the filter's $near condition, if any"""
+    for field, condition in filter_body.items():
+        if is_operator_condition(condition) and "$near" in condition:
+            return field, condition["$near"]
+    return None
+
+
+def equality_value(condition: Any) -> Any:
+    """Value an equality condition compares against (None if not an equality)"""
+    if not is_operator_condition(condition):
+        return condition
+    if set(condition) == {"$eq"}:
+        return condition["$eq"]
+    return None
+
+
+def mentions_null(condition: Any) -> bool:
+    """
+    True when null is an operand of condition. A missing field compares
+    as None, and indexes hold no entry for documents lacking the field,
+    so such conditions can only be answered by a scan.
+    """
+    if not is_operator_condition(condition):
+        return condition is None
+    for op in ("$eq", "$ne"):
+        if op in condition and condition[op] is None:
+            return True
+    for op in ("$in", "$nin"):
+        if op in condition and None in condition[op]:
+            return True
+    return False
+
+
+def prefix_value(condition: Any) -> str | None:
+    """Operand of a pure {"$prefix": ...} condition"""
+    if is_operator_condition(condition) and set(condition) == {"$prefix"}:
+        return condition["$prefix"]
+    return None
+
+
+def range_bounds(condition: Any) -> Tuple[Any, bool, Any, bool] | None:
+    """
+    (lower, include_lower, upper, include_upper) for a pure range
+    condition, None for anything else.
+    """
+    if not is_operator_condition(condition) or not set(condition) <= RANGE_OPERATORS:
+        return None
+
+    lower, include_lower, upper, include_upper = None, True, None, True
+    if "$gte" in condition:
+        lower = condition["$gte"]
+    if "$gt" in condition:
+        lower, include_lower = condition["$gt"], False
+    if "$lte" in condition:
+        upper = condition["$lte"]
+    if "$lt" in condition:
+        upper, include_upper = condition["$lt"], False
+
+    return lower, include_lower, upper, include_upper
+
+
+def _compare(doc_value: Any, op: str, operand: Any) -> bool:
+    if doc_value is None:
+        return False
+    try:
+        if op == "$gt":
+            return doc_value > operand
+        if op == "$gte":
+            return doc_value >= operand
+        if op == "$lt":
+            return doc_value < operand
+        return doc_value <= operand
+    except TypeError:
+        # values of different types never match a range
+        return False
+
+
+def resolve_path(body: Dict[str, Any], path: str) -> Any:
+    """
+    Value at a dotted path. Arrays met on the way are walked element by
+    element, so "items.sku" over a list of line items yields the list of
+    their skus (None when no element has one).
+    """
+    if "." not in path:
+        return body.get(path)
+
+    values = [body]
+    fanned_out = False
+    for key in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, list):
+                fanned_out = True
+                items = value
+            else:
+                items = (value,)
+            for item in items:
+                if isinstance(item, dict) and item.get(key) is not None:
+                    found.append(item[key])
+        values = found
+        if not values:
+            return None
+
+    if not fanned_out:
+        return values[0]
+
+    flat = []
+    for value in values:
+        if isinstance(value, list):
+            flat.extend(value)
+        else:
+            flat.append(value)
+    return flat
+
+
+def _matches_multikey(doc_values: list, condition: Any) -> bool:
+    """
+    Array semantics: a positive condition matches when the whole array or
+    any element satisfies it, $ne/$nin only when no element is excluded.
+    """
+    if not is_operator_condition(condition):
+        return doc_values == condition or condition in doc_values
+
+    positive = {op: operand for op, operand in condition.items() if op not in ("$ne", "$nin")}
+
+    if "$ne" in condition:
+        operand = condition["$ne"]
+        if doc_values == operand or operand in doc_values:
+            return False
+    if "$nin" in condition:
+        operand = condition["$nin"]
+        if doc_values in operand or any(item in operand for item in doc_values):
+            return False
+
+    if not positive:
+        return True
+    return _matches_scalar(doc_values, positive) or any(_matches_scalar(item, positive) for item in doc_values)
+
+
+def matches_condition(doc_value: Any, condition: Any) -> bool:
+    if isinstance(doc_value, list):
+        return _matches_multikey(doc_value, condition)
+    return _matches_scalar(doc_value, condition)
+
+
+def _matches_scalar(doc_value: Any, condition: Any) -> bool:
+    if not is_operator_condition(condition):
+        return doc_value == condition
+
+    for op, operand in condition.items():
+        if op == "$eq":
+            if doc_value != operand:
+                return False
+        elif op == "$ne":
+            if doc_value == operand:
+                return False
+        elif op == "$in":
+            if doc_value not in operand:
+                return False
+        elif op == "$nin":
+            if doc_value in operand:
+                return False
+        elif op in RANGE_OPERATORS:
+            if not _compare(doc_value, op, operand):
+                return False
+        elif op == "$prefix":
+            if not isinstance(doc_value, str) or not doc_value.startswith(operand):
+                return False
+        elif op in GEO_OPERATORS:
+            point = geo_point(doc_value)
+            if point is None:
+                return False
+            if op == "$near" and not within_radius(point, operand):
+                return False
+            if op == "$within_box" and not within_box(point, operand):
+                return False
+
+    return True
+
+
+def matches_filter(body: Dict[str, Any], filter_body: Dict[str, Any]) -> bool:
+    for field, condition in filter_body.items():
+        if not matches_condition(resolve_path(body, field), condition):
+            return False
+    return True
+
+
+def _condition_values(condition: Any) -> list | None:
+    """Finite set of values a condition allows, None if unbounded"""
+    value = equality_value(condition)
+    if value is not None:
+        return [value]
+    if is_operator_condition(condition) and set(condition) == {"$in"}:
+        return list(condition["$in"])
+    return None
+
+
+def _range_within(inner: Tuple[Any, bool, Any, bool], outer: Tuple[Any, bool, Any, bool]) -> bool:
+    in_low, in_low_inc, in_high, in_high_inc = inner
+    out_low, out_low_inc, out_high, out_high_inc = outer
+    try:
+        if out_low is not None:
+            if in_low is None or in_low < out_low:
+                return False
+            if in_low == out_low and in_low_inc and not out_low_inc:
+                return False
+        if out_high is not None:
+            if in_high is None or in_high > out_high:
+                return False
+            if in_high == out_high and in_high_inc and not out_high_inc:
+                return False
+    except TypeError:
+        return False
+    return True
+
+
+def condition_implies(condition: Any, required: Any, multikey: bool = False) -> bool:
+    """
+    True when every value satisfying condition also satisfies required.
+    Conservative: False whenever that can't be shown cheaply. multikey
+    says the field may hold arrays: an array matching condition through
+    one element can still hold a value $ne/$nin exclude.
+    """
+    if condition == required:
+        return True
+    if multikey and is_operator_condition(required) and not set(required).isdisjoint(("$ne", "$nin")):
+        return False
+
+    values = _condition_values(condition)
+    if values is not None:
+        return all(matches_condition(v, required) for v in values)
+
+    if not is_operator_condition(condition) or not is_operator_condition(required):
+        return False
+
+    bounds = range_bounds(condition)
+    required_bounds = range_bounds(required)
+    if bounds is not None and required_bounds is not None:
+        return _range_within(bounds, required_bounds)
+
+    if set(required) == {"$ne"}:
+        excluded = [required["$ne"]]
+    elif set(required) == {"$nin"}:
+        excluded = required["$nin"]
+    else:
+        return False
+
+    # condition must rule out every excluded value itself
+    return all(not matches_condition(v, condition) for v in excluded)
+
+
+def filter_implies(filter_body: Dict[str, Any], predicate: Dict[str, Any],
+                   multikey_fields: Collection[str] = ()) -> bool:
+    """True when every document matching filter_body also matches predicate"""
+    for field, required in predicate.items():
+        if field not in filter_body or not condition_implies(filter_body[field], required,
+                                                             field in multikey_fields):
+            return False
+    return True
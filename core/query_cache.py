@@ -0,0 +1,94 @@
+import json
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from core import mvcc
+from core.constants.main_values import QUERY_CACHE_MAX_BYTES
+
+CACHE_HITS = Counter("yaradb_query_cache_hits_total", "Finds answered from the query cache")
+CACHE_MISSES = Counter("yaradb_query_cache_misses_total", "Cacheable finds that had to run")
+CACHE_INVALIDATIONS = Counter("yaradb_query_cache_invalidations_total", "Cached results dropped by a table write")
+CACHE_EVICTIONS = Counter("yaradb_query_cache_evictions_total", "Cached results dropped to stay in budget")
+CACHE_BYTES = Gauge("yaradb_query_cache_bytes", "Approximate bytes held by the query cache")
+
+# dict slot, key tuple and array header of one entry, roughly
+_ENTRY_OVERHEAD = 200
+
+QueryKey = Tuple[Any, ...]
+
+
+def make_key(table_name: str, filter_body: Dict[str, Any], include_archived: bool,
+             sort_by: str | None, reverse: bool, limit: int | None, offset: int) -> QueryKey:
+    """Filters that differ only in key order share an entry"""
+    normalized = json.dumps(filter_body, sort_keys=True, separators=(",", ":"), default=str)
+    return table_name, normalized, include_archived, sort_by, reverse, limit or None, offset
+
+
+class QueryResultCache:
+    """
+    LRU of find results, stored as storage rows. An entry remembers the
+    table's change counter it was computed at and is void as soon as the
+    table has been written to since.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[QueryKey, Tuple[int, array]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _cost(key: QueryKey, rows: array) -> int:
+        return _ENTRY_OVERHEAD + len(key[1]) + rows.itemsize * len(rows)
+
+    def get(self, key: QueryKey) -> array | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            CACHE_MISSES.inc()
+            return None
+
+        changes, rows = entry
+        if changes != mvcc.table_change_count(key[0]):
+            self._drop(key)
+            CACHE_INVALIDATIONS.inc()
+            CACHE_MISSES.inc()
+            return None
+
+        self._entries.move_to_end(key)
+        CACHE_HITS.inc()
+        return rows
+
+    def put(self, key: QueryKey, changes: int, rows: array) -> None:
+        cost = self._cost(key, rows)
+        if self.max_bytes <= 0 or cost > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (changes, rows)
+        self.size += cost
+
+        while self.size > self.max_bytes:
+            old_key, (_, old_rows) = self._entries.popitem(last=False)
+            self.size -= self._cost(old_key, old_rows)
+            CACHE_EVICTIONS.inc()
+
+        CACHE_BYTES.set(self.size)
+
+    def _drop(self, key: QueryKey) -> None:
+        _, rows = self._entries.pop(key)
+        self.size -= self._cost(key, rows)
+        CACHE_BYTES.set(self.size)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+        CACHE_BYTES.set(0)
+
+
+result_cache = QueryResultCache(QUERY_CACHE_MAX_BYTES)
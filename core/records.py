@@ -0,0 +1,233 @@
+import json
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, FrozenSet, List
+
+from models.document_types.document import StandardDocument
+from models.document_types.body_hash import body_digest
+
+# Stored documents are DocumentRecords; StandardDocument is only built
+# when a document leaves through the API or goes to disk. A record keeps
+# the same attribute names, so readers don't care which one they hold.
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+# table_data is the same for every document of a table: one shared dict per table
+_table_data: List[Dict[str, Any]] = []
+_table_refs: Dict[str, int] = {}
+
+
+def table_ref(table_data: Any) -> int:
+    key = json.dumps(table_data, sort_keys=True, default=str)
+    ref = _table_refs.get(key)
+    if ref is None:
+        ref = _table_refs[key] = len(_table_data)
+        _table_data.append(table_data)
+    return ref
+
+
+def to_micros(value: datetime | None) -> int | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def from_micros(value: int | None) -> datetime | None:
+    return None if value is None else _EPOCH + timedelta(microseconds=value)
+
+
+BODY_ENCODINGS = ("json", "json+zlib")
+
+
+def encode_body(body: Dict[str, Any], encoding: str) -> bytes:
+    data = json.dumps(body, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return zlib.compress(data) if encoding == "json+zlib" else data
+
+
+def decode_body(data: bytes, encoding: str) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data) if encoding == "json+zlib" else data)
+
+
+class DocumentRecord:
+    """Compact stored form of a StandardDocument"""
+
+    __slots__ = ("id", "name", "body", "body_hash", "version",
+                 "_table_ref", "_created_us", "_updated_us", "_archived_us", "_commit_seq")
+
+    def __init__(self, id: uuid.UUID, name: str, body: Dict[str, Any], body_hash: str | None,
+                 version: int, table_ref: int, created_us: int, updated_us: int | None,
+                 archived_us: int | None, commit_seq: int = 0):
+        self.id = id
+        self.name = name
+        self.body = body
+        self.body_hash = body_hash
+        self.version = version
+        self._table_ref = table_ref
+        self._created_us = created_us
+        self._updated_us = updated_us
+        self._archived_us = archived_us
+        self._commit_seq = commit_seq
+
+    @classmethod
+    def from_document(cls, doc: StandardDocument) -> 'DocumentRecord':
+        return cls(
+            id=doc.id,
+            name=doc.name,
+            body=doc.body,
+            body_hash=doc.body_hash,
+            version=doc.version,
+            table_ref=table_ref(doc.table_data),
+            created_us=to_micros(doc.created_at),
+            updated_us=to_micros(doc.updated_at),
+            archived_us=to_micros(doc.archived_at),
+            commit_seq=doc._commit_seq
+        )
+
+    def to_document(self) -> StandardDocument:
+        # fields are already valid: construct skips validation. Every
+        # caller serializes the result, so the hash is settled on the record
+        return StandardDocument.model_construct(
+            id=self.id,
+            name=self.name,
+            table_data=self.table_data,
+            body=self.body,
+            body_hash=self.get_body_hash(),
+            created_at=self.created_at,
+            updated_at=self.updated_at,
+            version=self.version,
+            archived_at=self.archived_at
+        )
+
+    @property
+    def table_data(self) -> Dict[str, Any]:
+        return _table_data[self._table_ref]
+
+    @property
+    def created_at(self) -> datetime:
+        return from_micros(self._created_us)
+
+    @property
+    def updated_at(self) -> datetime | None:
+        return from_micros(self._updated_us)
+
+    @property
+    def archived_at(self) -> datetime | None:
+        return from_micros(self._archived_us)
+
+    def is_archived(self) -> bool:
+        return self._archived_us is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.body.get(key, default)
+
+    def get_id_str(self) -> str:
+        return str(self.id)
+
+    def get_body_hash(self) -> str:
+        if self.body_hash is None:
+            self.body_hash = body_digest(self.body)
+        return self.body_hash
+
+    def _reset_body_hash(self) -> None:
+        self.body_hash = None
+
+    @property
+    def index_body(self) -> Dict[str, Any]:
+        """What index maintenance reads; the whole body for a plain record"""
+        return self.body
+
+    def body_for(self, keys: FrozenSet[str]) -> Dict[str, Any]:
+        """A body holding at least the given top-level keys"""
+        return self.body
+
+    def _clone(self) -> 'DocumentRecord':
+        copy = object.__new__(type(self))
+        for cls in type(self).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                descriptor = cls.__dict__[slot]
+                try:
+                    descriptor.__set__(copy, descriptor.__get__(self))
+                except AttributeError:
+                    # slot shadowed by a subclass property, never set
+                    pass
+        return copy
+
+    def model_copy(self, update: Dict[str, Any] | None = None) -> 'DocumentRecord':
+        """Same contract as BaseModel.model_copy, for the write paths"""
+        copy = self._clone()
+        for field, value in (update or {}).items():
+            if field in ("updated_at", "archived_at", "created_at"):
+                setattr(copy, f"_{field[:-3]}_us", to_micros(value))
+            else:
+                setattr(copy, field, value)
+        return copy
+
+
+# records of a table share one key set object instead of holding a copy each
+_key_sets: Dict[FrozenSet[str], FrozenSet[str]] = {}
+
+
+def _shared_keys(keys: FrozenSet[str]) -> FrozenSet[str]:
+    return _key_sets.setdefault(keys, keys)
+
+
+class EncodedDocumentRecord(DocumentRecord):
+    """
+    Record of a table with a body_encoding setting: the body is kept as
+    bytes and decoded on every read. The top-level keys indexes and
+    unique checks need are copied out at write time into index_body.
+    """
+
+    __slots__ = ("_encoded", "_encoding", "_index_keys", "index_body")
+
+    @property
+    def body(self) -> Dict[str, Any]:
+        return decode_body(self._encoded, self._encoding)
+
+    @body.setter
+    def body(self, body: Dict[str, Any]) -> None:
+        self._encoded = encode_body(body, self._encoding)
+        self.index_body = {key: body[key] for key in self._index_keys if key in body}
+
+    def reindex(self, index_keys: FrozenSet[str], body: Dict[str, Any] | None = None) -> None:
+        """Re-extracts index_body after the table's indexes changed"""
+        if index_keys == self._index_keys:
+            return
+        self._index_keys = _shared_keys(index_keys)
+        body = body if body is not None else self.body
+        self.index_body = {key: body[key] for key in index_keys if key in body}
+
+    def body_for(self, keys: FrozenSet[str]) -> Dict[str, Any]:
+        # a record written before an index was added lacks its key: decode
+        return self.index_body if keys <= self._index_keys else self.body
+
+    def encoded_size(self) -> int:
+        return len(self._encoded)
+
+
+def encode_record(record: DocumentRecord, encoding: str, index_keys: FrozenSet[str]) -> EncodedDocumentRecord:
+    if encoding not in BODY_ENCODINGS:
+        raise ValueError(f"Unknown body encoding '{encoding}', expected one of {list(BODY_ENCODINGS)}")
+    encoded = object.__new__(EncodedDocumentRecord)
+    for slot in DocumentRecord.__slots__:
+        if slot != "body":
+            setattr(encoded, slot, getattr(record, slot))
+    encoded._encoding = encoding
+    encoded._index_keys = _shared_keys(index_keys)
+    encoded.body = record.body
+    return encoded
+
+
+def to_record(doc: Any) -> Any:
+    """StandardDocuments become records; CombinedDocuments are kept as they are"""
+    if type(doc) is StandardDocument:
+        return DocumentRecord.from_document(doc)
+    return doc
+
+
+def to_model(doc: Any) -> Any:
+    return doc.to_document() if isinstance(doc, DocumentRecord) else doc
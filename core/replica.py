@@ -0,0 +1,241 @@
+import os
+import json
+import uuid
+import asyncio
+from typing import Any, Dict
+
+from core import state
+from core import mvcc
+from core import shards
+from core import wal
+from core import serialization
+from core import query_cache
+from core.scheduling import cooperative
+from core.constants.main_values import WAL_FILE, STORAGE_FILE, OWNER_SOCKET, REPLICA_POLL_INTERVAL, YARADB_ROLE
+
+# POST endpoints that only read data and can be served by a replica
+READ_ONLY_POST_PATHS = {
+    "/document/find",
+    "/document/search",
+    "/document/vector_search",
+    "/document/count",
+    "/document/exists",
+    "/document/distinct",
+    "/aggregate"
+}
+
+_wal_offset: int = 0
+_storage_marker: tuple | None = None
+_owner_client = None
+
+
+def _storage_file_marker() -> tuple | None:
+    try:
+        st = os.stat(STORAGE_FILE)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _reset_memory() -> None:
+    state.db_storage.clear()
+    state.db_index_by_id.clear()
+    state.db_tables_by_name.clear()
+    state.db_table_indexes.clear()
+    mvcc.reset()
+    serialization.document_cache.clear()
+    query_cache.result_cache.clear()
+    state.db_value_dictionaries.clear()
+
+
+def _load_snapshot() -> None:
+    global _wal_offset, _storage_marker
+
+    _reset_memory()
+    _storage_marker = _storage_file_marker()
+    wal.load_snapshot()
+    _wal_offset = 0
+
+
+def full_reload() -> None:
+    """Rebuilds the replica from the snapshot and the whole WAL"""
+    global _wal_offset
+
+    _load_snapshot()
+    # entries appended during the replay, or torn at its end, are read by catch_up
+    _wal_offset = wal.recover_from_wal()
+    print(f"--- Replica loaded at WAL offset {_wal_offset} ---")
+
+
+def _table_name_of(doc: Any) -> str | None:
+    table_data = getattr(doc, "table_data", None)
+    if isinstance(table_data, dict):
+        return table_data.get("name")
+    return None
+
+
+def apply_replicated_op(op: Dict[str, Any]) -> None:
+    """
+    Applies one WAL entry written by the owner.
+
+    Unlike startup replay, the replica is live, so indexes are
+    maintained incrementally instead of being rebuilt.
+    """
+    from core.repository import _get_or_create_index_manager, _refresh_index_bodies, _written_keys
+
+    op_type = op.get("op")
+    old_doc = None
+    if op_type in ("update", "archive"):
+        old_doc = state.db_index_by_id.get(uuid.UUID(op["doc_id"]))
+
+    wal._apply_op_to_memory(op)
+    if old_doc is not None:
+        serialization.document_cache.invalidate(old_doc.id)
+
+    if op_type == "create":
+        doc = state.db_index_by_id.get(uuid.UUID(str(op["doc"]["_id"])))
+        table_name = _table_name_of(doc)
+        if doc and table_name:
+            _get_or_create_index_manager(table_name).add_document(doc.id, doc.index_body)
+
+    elif op_type == "update" and old_doc is not None:
+        table_name = _table_name_of(old_doc)
+        if table_name:
+            new_doc = state.db_index_by_id.get(old_doc.id)
+            keys = _written_keys(table_name)
+            _get_or_create_index_manager(table_name).update_document(
+                old_doc.id, old_doc.body_for(keys), new_doc.body_for(keys))
+
+    elif op_type == "archive" and old_doc is not None:
+        table_name = _table_name_of(old_doc)
+        if table_name and table_name in state.db_table_indexes:
+            state.db_table_indexes[table_name].remove_document(
+                old_doc.id, old_doc.body_for(_written_keys(table_name)))
+
+    elif op_type == "create_index":
+        table_name = op["table_name"]
+        docs_in_table = shards.collect(table_name, lambda doc: not doc.is_archived())
+        _get_or_create_index_manager(table_name).rebuild_all(docs_in_table)
+        _refresh_index_bodies(table_name)
+
+    elif op_type == "drop_table":
+        state.db_table_indexes.pop(op["name"], None)
+
+
+async def catch_up() -> int:
+    """
+    Applies WAL entries appended since the last call, yielding to the
+    event loop between chunks of them. Returns the number of applied
+    operations.
+    """
+    global _wal_offset
+
+    async with state.db_lock:
+        if _storage_file_marker() != _storage_marker:
+            # owner checkpointed or wiped the database: start over
+            _load_snapshot()
+
+        if not os.path.exists(WAL_FILE):
+            return 0
+
+        size = os.path.getsize(WAL_FILE)
+        if size < _wal_offset:
+            _load_snapshot()
+        if size == _wal_offset:
+            return 0
+
+        with open(WAL_FILE, 'rb') as f:
+            f.seek(_wal_offset)
+            chunk = f.read(size - _wal_offset)
+
+        # only complete lines; a partially written entry is picked up next time
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            return 0
+
+        applied = 0
+        async for line in cooperative(chunk[:end + 1].splitlines(keepends=True)):
+            _wal_offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                state.db_wal_position = _wal_offset
+                apply_replicated_op(json.loads(line))
+                applied += 1
+            except Exception as e:
+                print(f"!!! Replica failed to apply WAL entry: {line[:200]}. Error: {e} !!!")
+
+        return applied
+
+
+async def follow_wal() -> None:
+    """Background task keeping the replica in sync with the owner"""
+    while True:
+        try:
+            await catch_up()
+        except Exception as e:
+            print(f"!!! Replica sync error: {e} !!!")
+        await asyncio.sleep(REPLICA_POLL_INTERVAL)
+
+
+def is_write_request(method: str, path: str) -> bool:
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return False
+    if method == "POST" and path in READ_ONLY_POST_PATHS:
+        return False
+    return True
+
+
+def forwarded_headers(headers: Dict[str, str], client_host: str | None) -> Dict[str, str]:
+    """
+    Headers of a request forwarded to the owner. The client address
+    replaces any X-Forwarded-For the client sent, since the owner trusts
+    it for rate limiting.
+    """
+    forwarded = {
+        k: v for k, v in headers.items()
+        if k.lower() not in ("host", "content-length", "x-forwarded-for")
+    }
+    forwarded["x-forwarded-for"] = client_host or "127.0.0.1"
+    return forwarded
+
+
+def client_address(request) -> str:
+    """
+    Rate limit key. Requests on the owner socket come from readers, have
+    no peer address and name the original client in X-Forwarded-For.
+    """
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if YARADB_ROLE == "owner" and request.client is None and forwarded_for:
+        return forwarded_for
+    if not request.client or not request.client.host:
+        return "127.0.0.1"
+    return request.client.host
+
+
+async def forward_to_owner(method: str, path: str, query: str,
+                           headers: Dict[str, str], body: bytes):
+    global _owner_client
+    import httpx
+
+    if _owner_client is None:
+        _owner_client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=OWNER_SOCKET),
+            base_url="http://yaradb-owner",
+            timeout=30.0
+        )
+
+    url = path if not query else f"{path}?{query}"
+    response = await _owner_client.request(method, url, headers=headers, content=body)
+
+    # read-your-writes: the owner has logged the change before answering
+    await catch_up()
+
+    return response
+
+
+async def close_owner_client() -> None:
+    global _owner_client
+    if _owner_client is not None:
+        await _owner_client.aclose()
+        _owner_client = None
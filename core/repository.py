@@ -1,29 +1,42 @@
+import sys
 import uuid
 import json
+import asyncio
 
+from array import array
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Tuple, Callable, AsyncIterator, FrozenSet
 from uuid import UUID
 
 from core import wal
 from core import state
-from models.document_types.document import StandardDocument
+from core import mvcc
+from core import shards
+from core import scheduling
+from core import serialization
+from core import query_cache
+from core import records
+from core import interning
+from core.records import DocumentRecord
 from models.document_types.combined_document import CombinedDocument
 from models.models_init.document_init import create_document as init_doc
+from models.document_types.body_hash import matches_body
 from models.models_init.combined_document_init import create_combined_document as init_combined_doc
 from models.structure.table import Table
 from models.api import CreateTableRequest, TableResponse
-from core.constants.main_values import STORAGE_FILE, WAL_FILE
-from core.indexes import IndexManager
+from core.constants.main_values import STORAGE_FILE, WAL_FILE, SORT_OFFLOAD_ROWS
+from core import query
+from core import aggregation
+from core.indexes import IndexManager, index_keys
 
 
 def _get_or_create_index_manager(table_name: str) -> IndexManager:
     if table_name not in state.db_table_indexes:
-        state.db_table_indexes[table_name] = IndexManager()
+        state.db_table_indexes[table_name] = IndexManager(state.db_doc_ids)
     return state.db_table_indexes[table_name]
 
 
-async def create_document(name: str, body: Dict[str, Any], table_name: str) -> StandardDocument:
+async def create_document(name: str, body: Dict[str, Any], table_name: str) -> DocumentRecord:
     async with state.db_lock:
         table = state.db_tables_by_name.get(table_name)
 
@@ -58,31 +71,30 @@ async def create_document(name: str, body: Dict[str, Any], table_name: str) -> S
     if new_doc is None:
         raise ValueError("Error creating document (pydantic validation failed).")
 
-    wal_op = {"op": "create", "doc": new_doc.model_dump(by_alias=True)}
+    # the hash is left out: nothing has read it yet, replay computes it lazily
+    wal_op = {"op": "create", "doc": new_doc.model_dump(by_alias=True, exclude={"body_hash"})}
+
+    new_doc = _stored_record(records.to_record(new_doc))
 
     async with state.db_lock:
         await wal.log_to_wal(wal_op)
-        state.db_storage.append(new_doc)
-        state.db_index_by_id[new_doc.id] = new_doc
+        mvcc.install_new(new_doc)
         table.documents_count += 1
 
         index_manager = _get_or_create_index_manager(table_name)
-        index_manager.add_document(new_doc.id, new_doc.body)
+        index_manager.add_document(new_doc.id, new_doc.index_body)
 
     return new_doc
 
 
-async def get_document(doc_id: uuid.UUID) -> StandardDocument | CombinedDocument | None:
-    async with state.db_lock:
-        doc = state.db_index_by_id.get(doc_id)
-
-        if not doc or doc.is_archived():
-            return None
+async def get_document(doc_id: uuid.UUID) -> DocumentRecord | CombinedDocument | None:
+    # versions are immutable once published, so a single lookup needs no lock
+    doc = state.db_index_by_id.get(doc_id)
 
-        if isinstance(doc, CombinedDocument):
-            return await get_combined_document(doc_id)
+    if not doc or doc.is_archived():
+        return None
 
-        return doc
+    return doc
 
 
 async def find_documents(
@@ -92,64 +104,106 @@ async def find_documents(
         sort_by: str | None = None,
         order: str = "asc",
         limit: int | None = None,
-        offset: int = 0
-) -> List[StandardDocument]:
-    candidates_from_index: Set[uuid.UUID] | None = None
-    used_field: str | None = None
-
-    if table_name and filter_body:
+        offset: int = 0,
+        fields: List[str] | None = None,
+        cache: bool = False
+) -> List[DocumentRecord] | List[Dict[str, Any]]:
+    """
+    Documents matching filter_body. With fields, returns only those body
+    paths ("_id" for the id) as plain dicts, straight from an index when
+    one covers the query. With cache, the matching rows of a table query
+    are kept until the table is next written to.
+    """
+    candidate_rows: array | None = None
+    presorted = False
+    reverse = (order.lower() == "desc")
+    query.validate_filter(filter_body)
+    # without an explicit sort, $near results come nearest first
+    near = query.near_condition(filter_body) if not sort_by else None
+
+    cache_key = None
+    if cache and table_name:
+        cache_key = query_cache.make_key(table_name, filter_body, include_archived, sort_by, reverse, limit, offset)
+        cached_rows = query_cache.result_cache.get(cache_key)
+        if cached_rows is not None:
+            # the table is unchanged since, so every row still holds the cached version
+            print(f"✅ Served from query cache: {len(cached_rows)} documents")
+            results = [state.db_storage[row] for row in cached_rows]
+            if fields:
+                return [_project_document(doc, fields) for doc in results]
+            return results
+
+    if fields and table_name and filter_body and not include_archived:
+        covering = fields + [sort_by] if sort_by else fields
+        covered = _get_or_create_index_manager(table_name).covered_rows(filter_body, covering)
+        if covered is not None:
+            print(f"✅ Covered query on {sorted(filter_body)}: {len(covered)} entries, no documents read")
+            if sort_by:
+                covered.sort(key=lambda item: item[1][sort_by], reverse=reverse)
+            page = covered[offset:offset + limit] if limit else covered[offset:]
+            id_map = state.db_doc_ids
+            return [_project_values(id_map.to_uuid(row), values, fields) for row, values in page]
+
+    # index lookup and snapshot are taken without awaiting in between,
+    # so both describe the same commit
+    snapshot = mvcc.open_snapshot()
+    changes = mvcc.table_change_count(table_name) if cache_key else 0
+
+    # archived documents are not in the indexes
+    if table_name and filter_body and not include_archived:
         index_manager = _get_or_create_index_manager(table_name)
 
-        for field, value in filter_body.items():
-            if index_manager.has_index(field):
-                try:
-                    candidates_from_index = index_manager.query(field, value=value)
-                    used_field = field
-                    print(f"✅ Used index '{field}': {len(candidates_from_index)} candidates")
-                    break
-                except Exception as e:
-                    print(f"⚠️ Index lookup failed for '{field}': {e}")
-
-    async with state.db_lock:
-        if candidates_from_index is not None:
-            candidates = [
-                state.db_index_by_id.get(doc_id)
-                for doc_id in candidates_from_index
-            ]
-            candidates = [doc for doc in candidates if doc is not None]
+        wanted = offset + limit if limit else None
+        if sort_by:
+            candidate_rows = index_manager.ordered_rows(filter_body, sort_by, reverse, limit=wanted)
+            presorted = candidate_rows is not None
+        elif near:
+            candidate_rows = index_manager.nearest_rows(filter_body, limit=wanted)
+            presorted = candidate_rows is not None
+
+        if candidate_rows is None:
+            candidate_rows, used_fields = index_manager.plan(filter_body)
+            if candidate_rows is not None:
+                print(f"✅ Used index(es) {used_fields}: {len(candidate_rows)} candidates")
         else:
-            if filter_body and table_name:
+            print(f"✅ Used ordered index on '{sort_by or near[0]}': {len(candidate_rows)} candidates")
+
+    _matches = _document_matcher(filter_body, table_name, include_archived)
+
+    with snapshot:
+        if candidate_rows is not None:
+            scheduling.check_scan_budget(len(candidate_rows))
+            # rows already in sort order: stop as soon as the page is full
+            wanted = offset + limit if presorted and limit else None
+            results = []
+            async for row in scheduling.cooperative(candidate_rows):
+                doc = snapshot.resolve(state.db_storage[row])
+                if doc is not None and _matches(doc):
+                    results.append(doc)
+                    if wanted is not None and len(results) >= wanted:
+                        break
+        elif table_name:
+            scheduling.check_scan_budget(shards.table_size(table_name))
+            if filter_body:
                 print(f"⚠️ No index available for {list(filter_body.keys())}, doing full scan")
-            candidates = list(state.db_storage)
-
-    if not include_archived:
-        candidates = [doc for doc in candidates if not doc.is_archived()]
-
-    if table_name:
-        candidates = [
-            doc for doc in candidates
-            if doc.table_data.get("name") == table_name
-        ]
-
-    results = []
-    for doc in candidates:
-        matches = True
-        for key, value in filter_body.items():
-            doc_value = doc.body.get(key)
-            if doc_value != value:
-                matches = False
-                break
+            results = await shards.scan(table_name, snapshot, _matches)
+        else:
+            scheduling.check_scan_budget(snapshot.storage_len)
+            results = [doc async for doc in scheduling.cooperative(snapshot.documents()) if _matches(doc)]
 
-        if matches:
-            results.append(doc)
+    if near and not presorted:
+        field, operand = near
+        results.sort(key=lambda doc: _distance_to(doc, field, operand))
 
-    if sort_by:
-        reverse = (order.lower() == "desc")
+    if sort_by and not presorted:
         try:
-            results.sort(
-                key=lambda doc: doc.body.get(sort_by),
-                reverse=reverse
-            )
+            if len(results) > SORT_OFFLOAD_ROWS:
+                await asyncio.to_thread(results.sort, key=lambda doc: doc.body.get(sort_by), reverse=reverse)
+            else:
+                results.sort(
+                    key=lambda doc: doc.body.get(sort_by),
+                    reverse=reverse
+                )
         except Exception as e:
             print(f"⚠️ Sort failed: {e}")
 
@@ -158,10 +212,290 @@ async def find_documents(
     if limit:
         results = results[:limit]
 
+    if cache_key is not None:
+        id_map = state.db_doc_ids
+        query_cache.result_cache.put(cache_key, changes, array('I', (id_map.get(doc.id) for doc in results)))
+
+    if fields:
+        return [_project_document(doc, fields) for doc in results]
+
     return results
 
 
-async def update_document(doc_id: uuid.UUID, version: int, body: Dict[str, Any]) -> StandardDocument:
+def _distance_to(doc: Any, field: str, near: Dict[str, Any]) -> float:
+    value = query.resolve_path(doc.body, field)
+    points = [query.geo_point(v) for v in (value if isinstance(value, list) else [value])]
+    distances = [query.haversine_m(p[0], p[1], near["lat"], near["lon"]) for p in points if p]
+    return min(distances, default=float("inf"))
+
+
+def _document_matcher(filter_body: Dict[str, Any], table_name: str | None,
+                      include_archived: bool) -> Callable[[Any], bool]:
+    def _matches(doc: Any) -> bool:
+        if not include_archived and doc.is_archived():
+            return False
+
+        if table_name and _doc_table_name(doc) != table_name:
+            return False
+
+        return query.matches_filter(doc.body, filter_body)
+
+    return _matches
+
+
+async def _stream_matches(snapshot: mvcc.Snapshot, filter_body: Dict[str, Any], table_name: str | None,
+                          include_archived: bool) -> AsyncIterator[Any]:
+    """
+    Yields matching documents one by one (never a list), from index
+    candidates when there are some, else from a scan.
+    """
+    _matches = _document_matcher(filter_body, table_name, include_archived)
+
+    candidate_rows = None
+    # archived documents are not in the indexes
+    if table_name and filter_body and not include_archived:
+        candidate_rows, _ = _get_or_create_index_manager(table_name).plan(filter_body)
+
+    if candidate_rows is not None:
+        scheduling.check_scan_budget(len(candidate_rows))
+        rows = candidate_rows
+    elif table_name:
+        scheduling.check_scan_budget(shards.table_size(table_name))
+        rows = shards.table_rows(table_name)
+    else:
+        scheduling.check_scan_budget(snapshot.storage_len)
+        rows = range(snapshot.storage_len)
+
+    async for row in scheduling.cooperative(rows):
+        if row >= len(state.db_storage):
+            break
+        doc = snapshot.resolve(state.db_storage[row])
+        if doc is not None and _matches(doc):
+            yield doc
+
+
+async def count_documents(
+        filter_body: Dict[str, Any],
+        table_name: str | None = None,
+        include_archived: bool = False
+) -> int:
+    query.validate_filter(filter_body)
+
+    if table_name and filter_body and not include_archived:
+        count = _get_or_create_index_manager(table_name).count(filter_body)
+        if count is not None:
+            print(f"✅ Counted {sorted(filter_body)} from index postings")
+            return count
+
+    count = 0
+    with mvcc.open_snapshot() as snapshot:
+        async for _ in _stream_matches(snapshot, filter_body, table_name, include_archived):
+            count += 1
+    return count
+
+
+async def documents_exist(
+        filter_body: Dict[str, Any],
+        table_name: str | None = None,
+        include_archived: bool = False
+) -> bool:
+    query.validate_filter(filter_body)
+
+    if table_name and filter_body and not include_archived:
+        rows = _get_or_create_index_manager(table_name).exact_rows(filter_body)
+        if rows is not None:
+            return len(rows) > 0
+
+    with mvcc.open_snapshot() as snapshot:
+        async for _ in _stream_matches(snapshot, filter_body, table_name, include_archived):
+            return True
+    return False
+
+
+async def distinct_values(
+        table_name: str,
+        field: str,
+        filter_body: Dict[str, Any],
+        include_archived: bool = False,
+        limit: int | None = None
+) -> List[Tuple[Any, int]]:
+    """
+    Distinct values of field among matching documents with the number of
+    documents holding each (array elements count separately), most
+    frequent first.
+    """
+    query.validate_filter(filter_body)
+
+    counts = None
+    if not include_archived:
+        counts = _get_or_create_index_manager(table_name).distinct(field, filter_body)
+        if counts is not None:
+            print(f"✅ Distinct '{field}' read from index keys")
+
+    if counts is None:
+        counter: Dict[Any, int] = {}
+        with mvcc.open_snapshot() as snapshot:
+            async for doc in _stream_matches(snapshot, filter_body, table_name, include_archived):
+                for key in index_keys(query.resolve_path(doc.body, field)):
+                    counter[key] = counter.get(key, 0) + 1
+        counts = list(counter.items())
+
+    counts.sort(key=lambda item: (-item[1], str(item[0])))
+    return counts[:limit] if limit else counts
+
+
+async def aggregate_documents(
+        table_name: str,
+        match: Dict[str, Any],
+        group_by: List[str],
+        accumulators: Dict[str, Dict[str, Any]],
+        sort_by: str | None = None,
+        order: str = "asc",
+        limit: int | None = None,
+        include_archived: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    match -> group_by -> accumulators -> sort/limit. Documents are fed to
+    the pipeline one at a time; the match stage uses indexes like find().
+    """
+    query.validate_filter(match)
+    pipeline = aggregation.Pipeline(group_by, accumulators)
+    reverse = (order.lower() == "desc")
+
+    if not group_by and not include_archived:
+        row = _aggregate_from_indexes(table_name, match, accumulators)
+        if row is not None:
+            print(f"✅ Aggregate over {sorted(match)} answered from indexes")
+            return [row]
+
+    with mvcc.open_snapshot() as snapshot:
+        async for doc in _stream_matches(snapshot, match, table_name, include_archived):
+            pipeline.feed(doc.body)
+
+    return pipeline.results(sort_by, reverse, limit)
+
+
+def _aggregate_from_indexes(table_name: str, match: Dict[str, Any],
+                            accumulators: Dict[str, Dict[str, Any]]) -> Dict[str, Any] | None:
+    """
+    Ungrouped accumulators straight from indexes: count from posting
+    sizes, min/max from btree ends, anything numeric from a column index.
+    """
+    index_manager = _get_or_create_index_manager(table_name)
+    rows = index_manager.exact_rows(match) if match else None
+    if match and rows is None and any(spec.get("op") != "count" for spec in accumulators.values()):
+        return None
+
+    row = {}
+    for name, spec in accumulators.items():
+        op = spec.get("op")
+        if op == "count":
+            count = index_manager.count(match) if match else None
+            if count is None:
+                return None
+            row[name] = count
+            continue
+
+        field = spec["field"]
+        column = index_manager.column_for(field, match)
+        if column is not None:
+            row[name] = column.aggregate(op, rows)
+            continue
+
+        extremes = index_manager.min_max(field, match) if op in ("min", "max") else None
+        if extremes is None:
+            return None
+        row[name] = extremes[0] if op == "min" else extremes[1]
+    return row
+
+
+def _project_document(doc: Any, fields: List[str]) -> Dict[str, Any]:
+    projected = {}
+    for field in fields:
+        if field == "_id":
+            projected["_id"] = doc.id
+            continue
+        value = query.resolve_path(doc.body, field)
+        if value is not None:
+            projected[field] = value
+    return projected
+
+
+def _project_values(doc_id: UUID, values: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    projected = {}
+    for field in fields:
+        if field == "_id":
+            projected["_id"] = doc_id
+        elif field in values:
+            projected[field] = values[field]
+    return projected
+
+
+async def search_documents(
+        table_name: str,
+        query_text: str,
+        field: str | None = None,
+        limit: int | None = 10
+) -> List[Tuple[DocumentRecord, float]]:
+    """BM25-ranked full-text search over a text index of the table"""
+    index_manager = _get_or_create_index_manager(table_name)
+
+    if field is None:
+        text_fields = index_manager.text_fields()
+        if len(text_fields) != 1:
+            raise ValueError(
+                f"Table '{table_name}' has {len(text_fields)} text indexes, specify 'field'"
+            )
+        field = text_fields[0]
+
+    ranked = index_manager.search_rows(field, query_text, limit=None)
+    # no await since the ranking, so the snapshot sees the same commit
+    snapshot = mvcc.open_snapshot()
+
+    results = []
+    with snapshot:
+        async for row, score in scheduling.cooperative(ranked):
+            doc = snapshot.resolve(state.db_storage[row])
+            if doc is None or doc.is_archived():
+                continue
+            results.append((doc, score))
+            if limit and len(results) >= limit:
+                break
+
+    return results
+
+
+async def search_vectors(
+        table_name: str,
+        field: str,
+        vector: List[float],
+        k: int = 10,
+        metric: str = "cosine",
+        nprobe: int | None = None
+) -> List[Tuple[DocumentRecord, float]]:
+    """Top-k nearest documents by a vector index of the table"""
+    index_manager = _get_or_create_index_manager(table_name)
+
+    # scored on a worker thread, so a request deadline can interrupt it
+    token = scheduling.CancelToken()
+    try:
+        ranked = await asyncio.to_thread(index_manager.vector_rows, field, vector, k, metric, nprobe, token)
+    except asyncio.CancelledError:
+        token.cancel()
+        raise
+    snapshot = mvcc.open_snapshot()
+
+    results = []
+    with snapshot:
+        for row, score in ranked:
+            doc = snapshot.resolve(state.db_storage[row])
+            if doc is not None and not doc.is_archived():
+                results.append((doc, score))
+
+    return results
+
+
+async def update_document(doc_id: uuid.UUID, version: int, body: Dict[str, Any]) -> DocumentRecord:
     async with state.db_lock:
         doc = state.db_index_by_id.get(doc_id)
 
@@ -172,7 +506,8 @@ async def update_document(doc_id: uuid.UUID, version: int, body: Dict[str, Any])
         if doc.version != version:
             raise ValueError(f"Conflict: Document version mismatch. DB is at {doc.version}, you sent {version}")
 
-        old_body = doc.body.copy()
+        # only what the indexes read: an encoded record needs no decode
+        old_body = doc.body_for(_written_keys(_doc_table_name(doc)))
 
         table_name = None
         if isinstance(doc.table_data, dict):
@@ -214,19 +549,24 @@ async def update_document(doc_id: uuid.UUID, version: int, body: Dict[str, Any])
 
         await wal.log_to_wal(wal_op)
 
-        doc.body = body
-        doc.version = new_version
-        doc.updated_at = now
-        doc._update_body_hash()
+        body = _intern_body(table_name, body)
+        new_doc = doc.model_copy(update={
+            "body": body,
+            "version": new_version,
+            "updated_at": now
+        })
+        new_doc._reset_body_hash()
+        mvcc.install_version(doc, new_doc)
+        serialization.document_cache.invalidate(doc_id)
 
         if table_name:
             index_manager = _get_or_create_index_manager(table_name)
             index_manager.update_document(doc_id, old_body, body)
 
-        return doc
+        return new_doc
 
 
-async def archive_document(doc_id: uuid.UUID) -> StandardDocument:
+async def archive_document(doc_id: uuid.UUID) -> DocumentRecord:
     async with state.db_lock:
         doc = state.db_index_by_id.get(doc_id)
 
@@ -235,7 +575,8 @@ async def archive_document(doc_id: uuid.UUID) -> StandardDocument:
         if doc.is_archived():
             raise LookupError("Document not found")
 
-        old_body = doc.body.copy()
+        # only what the indexes read: an encoded record needs no decode
+        old_body = doc.body_for(_written_keys(_doc_table_name(doc)))
 
         table_name = None
         if isinstance(doc.table_data, dict):
@@ -255,17 +596,19 @@ async def archive_document(doc_id: uuid.UUID) -> StandardDocument:
 
         await wal.log_to_wal(wal_op)
 
-        doc.archive()
-
-        doc.version = new_version
-        doc.updated_at = now
-        doc.archived_at = now
+        new_doc = doc.model_copy(update={
+            "version": new_version,
+            "updated_at": now,
+            "archived_at": now
+        })
+        mvcc.install_version(doc, new_doc)
+        serialization.document_cache.invalidate(doc_id)
 
         if table_name:
             index_manager = _get_or_create_index_manager(table_name)
             index_manager.remove_document(doc_id, old_body)
 
-        return doc
+        return new_doc
 
 
 async def combine_documents(name: str, document_ids: List[uuid.UUID],
@@ -275,7 +618,7 @@ async def combine_documents(name: str, document_ids: List[uuid.UUID],
     if len(document_ids) > 100:
         raise ValueError("Can't combine more than 100 documents at once :(")
 
-    documents: List[StandardDocument] = []
+    documents: List[DocumentRecord] = []
 
     async with state.db_lock:
         for doc_id in document_ids:
@@ -322,24 +665,23 @@ async def combine_documents(name: str, document_ids: List[uuid.UUID],
 
             wal_op = {
                 "op": "create_combined",
-                "doc": new_combined_doc.model_dump(by_alias=True)
+                "doc": new_combined_doc.model_dump(by_alias=True, exclude={"body_hash"})
             }
 
             await wal.log_to_wal(wal_op)
 
-            state.db_storage.append(new_combined_doc)
-            state.db_index_by_id[new_combined_doc.id] = new_combined_doc
+            mvcc.install_new(new_combined_doc)
         return new_combined_doc
 
 
-def _merge_overwrite(documents: List[StandardDocument]) -> Dict[str, Any]:
+def _merge_overwrite(documents: List[DocumentRecord]) -> Dict[str, Any]:
     result = {}
     for doc in documents:
         result.update(doc.body)
     return result
 
 
-def _merge_append(documents: List[StandardDocument]) -> Dict[str, Any]:
+def _merge_append(documents: List[DocumentRecord]) -> Dict[str, Any]:
     result = {}
     for doc in documents:
         for key, value in doc.body.items():
@@ -353,7 +695,7 @@ def _merge_append(documents: List[StandardDocument]) -> Dict[str, Any]:
     return result
 
 
-def _merge_namespace(documents: List[StandardDocument]) -> Dict[str, Any]:
+def _merge_namespace(documents: List[DocumentRecord]) -> Dict[str, Any]:
     result = {}
     for i, doc in enumerate(documents):
         result[f"doc_{i}_{doc.name}"] = doc.body
@@ -361,27 +703,26 @@ def _merge_namespace(documents: List[StandardDocument]) -> Dict[str, Any]:
 
 
 async def get_combined_document(doc_id: uuid.UUID) -> CombinedDocument | None:
-    async with state.db_lock:
-        doc = state.db_index_by_id.get(doc_id)
+    doc = state.db_index_by_id.get(doc_id)
 
-        if doc and isinstance(doc, CombinedDocument) and not doc.is_archived():
-            return doc
+    if doc and isinstance(doc, CombinedDocument) and not doc.is_archived():
+        return doc
 
     return None
 
 
-async def get_source_documents(combined_doc_id: uuid.UUID) -> List[StandardDocument]:
+async def get_source_documents(combined_doc_id: uuid.UUID) -> List[DocumentRecord]:
     combined_doc = await get_combined_document(combined_doc_id)
 
     if not combined_doc:
         raise LookupError(f"CombinedDocument not found: {combined_doc_id}")
 
-    source_docs: List[StandardDocument] = []
+    source_docs: List[DocumentRecord] = []
 
-    async with state.db_lock:
+    with mvcc.open_snapshot() as snapshot:
         for doc_id in combined_doc.document_ids:
-            doc = state.db_index_by_id.get(doc_id)
-            if doc and isinstance(doc, StandardDocument):
+            doc = snapshot.get(doc_id)
+            if doc and isinstance(doc, DocumentRecord):
                 source_docs.append(doc)
 
     return source_docs
@@ -405,6 +746,9 @@ async def create_new_table(request: CreateTableRequest) -> Table:
         if request.read_only:
             settings["read_only"] = True
 
+        if request.body_encoding:
+            settings["body_encoding"] = request.body_encoding
+
         if hasattr(request, "unique_fields") and request.unique_fields:
             settings["unique_fields"] = request.unique_fields
 
@@ -417,6 +761,7 @@ async def create_new_table(request: CreateTableRequest) -> Table:
         await wal.log_to_wal(wal_op)
 
         state.db_tables_by_name[new_table.name] = new_table
+        mvcc.note_table_change(new_table.name)
 
         return new_table
 
@@ -457,30 +802,101 @@ async def delete_table(name: str):
 
         if name in state.db_table_indexes:
             del state.db_table_indexes[name]
+        state.db_table_shards.pop(name, None)
+        state.db_value_dictionaries.pop(name, None)
 
         wal_op = {"op": "drop_table", "name": name}
         await wal.log_to_wal(wal_op)
+        mvcc.note_table_change(name)
 
         return True
 
 
-async def get_documents_in_table(table_name: str) -> List[StandardDocument]:
-    results = []
-
+async def get_documents_in_table(table_name: str) -> List[DocumentRecord]:
     if table_name not in state.db_tables_by_name:
         raise LookupError(f"Table '{table_name}' not found")
 
-    async with state.db_lock:
-        for doc in state.db_storage:
-            if doc.is_archived():
-                continue
+    with mvcc.open_snapshot() as snapshot:
+        results = await shards.scan(table_name, snapshot, lambda doc: not doc.is_archived())
 
-            doc_table_name = doc.table_data.get("name")
+    return results
 
-            if doc_table_name == table_name:
-                results.append(doc)
 
-    return results
+def _check_body_hashes(docs: List[Any]) -> Dict[str, Any]:
+    checked, unhashed, mismatched = 0, 0, []
+    for doc in docs:
+        # read the field, not get_body_hash(): hashing now would only compare the body with itself
+        if doc.body_hash is None:
+            unhashed += 1
+            continue
+        checked += 1
+        if not matches_body(doc.body, doc.body_hash):
+            mismatched.append(str(doc.id))
+    return {"checked": checked, "unhashed": unhashed, "mismatched": mismatched}
+
+
+async def verify_body_hashes(table_name: str | None = None) -> Dict[str, Any]:
+    """
+    Re-checks every stored body hash against its body. Versions are
+    immutable, so the documents of a snapshot can be hashed on a worker
+    thread while the event loop keeps serving.
+    """
+    if table_name is not None and table_name not in state.db_tables_by_name:
+        raise LookupError(f"Table '{table_name}' not found")
+
+    with mvcc.open_snapshot() as snapshot:
+        if table_name is not None:
+            docs = await shards.scan(table_name, snapshot, lambda doc: True)
+        else:
+            docs = [doc async for doc in scheduling.cooperative(snapshot.documents())]
+
+    report = await asyncio.to_thread(_check_body_hashes, docs)
+    if report["mismatched"]:
+        print(f"!!! Body hash mismatch for {len(report['mismatched'])} document(s): {report['mismatched'][:10]} !!!")
+    return report
+
+
+async def verify_hashes_periodically(interval: float) -> None:
+    """Background task for HASH_VERIFY_INTERVAL"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            report = await verify_body_hashes()
+            print(f"✅ Verified {report['checked']} body hashes, {len(report['mismatched'])} mismatched")
+        except Exception as e:
+            print(f"!!! Body hash verification failed: {e} !!!")
+
+
+def _measure_documents(docs: List[Any]) -> Dict[str, Any]:
+    record_bytes, encoded_bytes, bodies = 0, 0, []
+    for doc in docs:
+        record_bytes += sys.getsizeof(doc)
+        if isinstance(doc, records.EncodedDocumentRecord):
+            encoded_bytes += doc.encoded_size()
+            bodies.append(doc.index_body)
+        else:
+            bodies.append(doc.body)
+    return {
+        "documents": len(docs),
+        "record_bytes": record_bytes,
+        # shared keys and dictionary values are counted once per table
+        "body_bytes": interning.bodies_size(bodies),
+        "encoded_body_bytes": encoded_bytes
+    }
+
+
+async def table_memory_report(table_name: str) -> Dict[str, Any]:
+    """Approximate memory held by the latest versions of a table's documents"""
+    if table_name not in state.db_tables_by_name:
+        raise LookupError(f"Table '{table_name}' not found")
+
+    docs = shards.latest_documents(table_name)
+    report = await asyncio.to_thread(_measure_documents, docs)
+
+    dictionary = state.db_value_dictionaries.get(table_name)
+    report["value_dictionary"] = dictionary.stats() if dictionary else None
+    report["body_encoding"] = state.db_tables_by_name[table_name].settings.get("body_encoding")
+    return report
 
 
 async def wipe_all_data():
@@ -489,36 +905,88 @@ async def wipe_all_data():
         state.db_index_by_id.clear()
         state.db_tables_by_name.clear()
         state.db_table_indexes.clear()
+        mvcc.reset()
+        serialization.document_cache.clear()
+        query_cache.result_cache.clear()
+        state.db_value_dictionaries.clear()
 
         with open(WAL_FILE, 'w') as f:
             f.truncate(0)
 
-        empty_state = {"tables": [], "documents": []}
+        empty_state = {"epoch": wal.new_snapshot_epoch(), "tables": [], "documents": []}
         with open(STORAGE_FILE, 'w', encoding='utf-8') as f:
             json.dump(empty_state, f)
+        state.db_snapshot_epoch = empty_state["epoch"]
 
     return True
 
 
+def _doc_table_name(doc: Any) -> str | None:
+    table_data = getattr(doc, "table_data", None)
+    if isinstance(table_data, dict):
+        return table_data.get("name")
+    if isinstance(table_data, list) and len(table_data) > 1:
+        return table_data[1]
+    return None
+
+
+def _written_keys(table_name: str) -> FrozenSet[str]:
+    """Top-level body keys the write path reads: indexed and unique fields"""
+    keys = set()
+    index_manager = state.db_table_indexes.get(table_name)
+    if index_manager:
+        keys.update(index_manager.indexed_keys())
+    table = state.db_tables_by_name.get(table_name)
+    if table:
+        for field in table.settings.get("unique_fields", []):
+            keys.update((field, field.split(".", 1)[0]))
+    return frozenset(keys)
+
+
+def _intern_body(table_name: str | None, body: Dict[str, Any]) -> Dict[str, Any]:
+    if not table_name:
+        return body
+    dictionary = state.db_value_dictionaries.get(table_name)
+    if dictionary is None:
+        dictionary = state.db_value_dictionaries[table_name] = interning.ValueDictionary()
+    return interning.intern_body(body, dictionary)
+
+
+def _stored_record(doc: Any) -> Any:
+    """
+    Prepares a new record for storage: interns its body and encodes it
+    when the table has a body_encoding setting.
+    """
+    if not isinstance(doc, DocumentRecord):
+        return doc
+    table_name = _doc_table_name(doc)
+    doc.body = _intern_body(table_name, doc.body)
+
+    table = state.db_tables_by_name.get(table_name) if table_name else None
+    encoding = table.settings.get("body_encoding") if table else None
+    if not encoding:
+        return doc
+    return records.encode_record(doc, encoding, _written_keys(table_name))
+
+
+def _refresh_index_bodies(table_name: str) -> None:
+    """Re-extracts index bodies of encoded records after the table's indexes changed"""
+    keys = _written_keys(table_name)
+    for doc in shards.latest_documents(table_name):
+        if isinstance(doc, records.EncodedDocumentRecord):
+            doc.reindex(keys)
+
+
 def _check_duplicate(table_name: str, field: str, value: Any, exclude_doc_id: uuid.UUID = None) -> bool:
     if table_name not in state.db_tables_by_name:
         return False
 
-    for doc in state.db_storage:
+    keys = _written_keys(table_name)
+    for doc in shards.latest_documents(table_name):
         if doc.is_archived() or doc.id == exclude_doc_id:
             continue
 
-        doc_table_data = getattr(doc, "table_data", {})
-        if isinstance(doc_table_data, dict):
-            current_table_name = doc_table_data.get("name")
-        else:
-            current_table_name = doc_table_data[1] if isinstance(doc_table_data, list) and len(
-                doc_table_data) > 1 else None
-
-        if current_table_name != table_name:
-            continue
-
-        if doc.body.get(field) == value:
+        if doc.body_for(keys).get(field) == value:
             return True
 
     return False
\ No newline at end of file
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Iterable, TypeVar
+
+from core.constants.main_values import SCAN_CHUNK_SIZE, MAX_SCAN_DOCS
+
+T = TypeVar("T")
+
+
+async def cooperative(items: Iterable[T], chunk_size: int = SCAN_CHUNK_SIZE) -> AsyncIterator[T]:
+    """
+    Iterates items and hands control back to the event loop after every
+    chunk_size of them, so long scans never starve other requests
+    (including /ping). Cancellation is delivered at those points.
+    """
+    count = 0
+    for item in items:
+        yield item
+        count += 1
+        if count >= chunk_size:
+            count = 0
+            await asyncio.sleep(0)
+
+
+def check_scan_budget(planned_docs: int) -> None:
+    if MAX_SCAN_DOCS and planned_docs > MAX_SCAN_DOCS:
+        raise ValueError(
+            f"Query rejected: it would scan {planned_docs} documents, "
+            f"server limit is {MAX_SCAN_DOCS}. Add an index or narrow the filter."
+        )
+
+
+async def run_with_timeout(awaitable: Awaitable[T], timeout_ms: int | None) -> T:
+    """Raises TimeoutError if the query does not finish within timeout_ms"""
+    if not timeout_ms:
+        return await awaitable
+
+    async with asyncio.timeout(timeout_ms / 1000):
+        return await awaitable
+
+
+class CancelToken:
+    """Lets worker threads notice that the awaiting request was cancelled"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+class ScanCancelled(Exception):
+    pass
+
+
+def raise_if_cancelled(token: Any) -> None:
+    if token is not None and token.cancelled:
+        raise ScanCancelled()
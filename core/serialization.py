@@ -0,0 +1,131 @@
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Tuple, Type
+
+from fastapi import Response
+from prometheus_client import Counter, Gauge
+from pydantic import BaseModel, TypeAdapter
+
+from core.constants.main_values import DOC_CACHE_MAX_BYTES
+from core.records import to_model
+
+# Documents leaving the repository are already validated models. Routing them
+# through response_model makes FastAPI validate them again and walk them into
+# plain Python before json.dumps; here pydantic-core writes the bytes directly.
+
+_ANY_ADAPTER = TypeAdapter(Any)
+
+
+def model_json(model: Any, as_type: Type[BaseModel] | None = None) -> bytes:
+    """
+    JSON bytes of one model (or stored record). With as_type, the
+    endpoint's response_model, a model of another class is validated into
+    it first, as FastAPI would (e.g. a CombinedDocument in a
+    List[StandardDocument] loses document_ids and gets table_data).
+    """
+    model = to_model(model)
+    if as_type is not None and type(model) is not as_type:
+        model = as_type.model_validate(model.model_dump(by_alias=True))
+    return model.__pydantic_serializer__.to_json(model, by_alias=True)
+
+
+def models_json(models: Iterable[BaseModel], as_type: Type[BaseModel] | None = None) -> bytes:
+    """JSON array of models, see model_json"""
+    return b"[" + b",".join(model_json(m, as_type) for m in models) + b"]"
+
+
+def value_json(value: Any) -> bytes:
+    """JSON bytes of plain data (dicts, lists, UUIDs, datetimes, models)"""
+    return _ANY_ADAPTER.dump_json(value, by_alias=True)
+
+
+class TrustedJSONResponse(Response):
+    """Response for bytes that were serialized by the helpers above"""
+    media_type = "application/json"
+
+
+def model_response(model: BaseModel, status_code: int = 200,
+                   as_type: Type[BaseModel] | None = None) -> TrustedJSONResponse:
+    return TrustedJSONResponse(content=model_json(model, as_type), status_code=status_code)
+
+
+def models_response(models: Iterable[BaseModel], status_code: int = 200,
+                    headers: Dict[str, str] | None = None,
+                    as_type: Type[BaseModel] | None = None) -> TrustedJSONResponse:
+    return TrustedJSONResponse(content=models_json(models, as_type), status_code=status_code, headers=headers)
+
+
+def value_response(value: Any, status_code: int = 200) -> TrustedJSONResponse:
+    return TrustedJSONResponse(content=value_json(value), status_code=status_code)
+
+
+CACHE_HITS = Counter("yaradb_document_cache_hits_total", "Document reads served from cached bytes")
+CACHE_MISSES = Counter("yaradb_document_cache_misses_total", "Document reads that had to serialize")
+CACHE_EVICTIONS = Counter("yaradb_document_cache_evictions_total", "Cached documents dropped to stay in budget")
+CACHE_BYTES = Gauge("yaradb_document_cache_bytes", "Bytes held by the document cache")
+
+
+class DocumentBytesCache:
+    """
+    LRU of serialized documents keyed by (doc_id, version). A version is
+    never modified once published, so an entry can only go stale by
+    being superseded; writers still drop the old entry to free memory.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[Tuple[uuid.UUID, int], bytes] = OrderedDict()
+        self._versions: Dict[uuid.UUID, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def render(self, doc: BaseModel) -> bytes:
+        if self.max_bytes <= 0:
+            return model_json(doc)
+
+        key = (doc.id, doc.version)
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            CACHE_HITS.inc()
+            return data
+
+        CACHE_MISSES.inc()
+        data = model_json(doc)
+        if len(data) > self.max_bytes:
+            return data
+
+        self.invalidate(doc.id)
+        self._entries[key] = data
+        self._versions[doc.id] = doc.version
+        self.size += len(data)
+
+        while self.size > self.max_bytes:
+            (old_id, _), old = self._entries.popitem(last=False)
+            del self._versions[old_id]
+            self.size -= len(old)
+            CACHE_EVICTIONS.inc()
+
+        CACHE_BYTES.set(self.size)
+        return data
+
+    def invalidate(self, doc_id: uuid.UUID) -> None:
+        version = self._versions.pop(doc_id, None)
+        if version is not None:
+            self.size -= len(self._entries.pop((doc_id, version)))
+            CACHE_BYTES.set(self.size)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+        self.size = 0
+        CACHE_BYTES.set(0)
+
+
+document_cache = DocumentBytesCache(DOC_CACHE_MAX_BYTES)
+
+
+def cached_document_response(doc: BaseModel, headers: Dict[str, str] | None = None) -> TrustedJSONResponse:
+    return TrustedJSONResponse(content=document_cache.render(doc), headers=headers)
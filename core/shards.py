@@ -0,0 +1,139 @@
+import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Iterator, List, Tuple
+
+from core import state
+from core.constants.main_values import SHARD_COUNT, SCAN_WORKERS, PARALLEL_SCAN_MIN_ROWS, SCAN_CHUNK_SIZE
+from core.scheduling import CancelToken, cooperative, raise_if_cancelled
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def shard_of(doc_id: Any) -> int:
+    return doc_id.int % SHARD_COUNT
+
+
+def assign(table_name: str, doc_id: Any, row: int) -> None:
+    """Registers a storage row in its table partition"""
+    shards = state.db_table_shards.get(table_name)
+    if shards is None:
+        shards = [[] for _ in range(SHARD_COUNT)]
+        state.db_table_shards[table_name] = shards
+    shards[shard_of(doc_id)].append(row)
+
+
+def table_size(table_name: str) -> int:
+    return sum(len(rows) for rows in state.db_table_shards.get(table_name, ()))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="yaradb-scan")
+    return _executor
+
+
+def _scan_shard(rows: List[int], limit: int, snapshot: Any,
+                predicate: Callable[[Any], bool], token: CancelToken | None = None) -> List[Tuple[int, Any]]:
+    found = []
+    for i in range(limit):
+        if i % SCAN_CHUNK_SIZE == 0:
+            raise_if_cancelled(token)
+        row = rows[i]
+        doc = snapshot.resolve(state.db_storage[row])
+        if doc is not None and predicate(doc):
+            found.append((row, doc))
+    return found
+
+
+async def _scan_shard_cooperative(rows: List[int], limit: int, snapshot: Any,
+                                  predicate: Callable[[Any], bool]) -> List[Tuple[int, Any]]:
+    found = []
+    async for row in cooperative(rows[i] for i in range(limit)):
+        doc = snapshot.resolve(state.db_storage[row])
+        if doc is not None and predicate(doc):
+            found.append((row, doc))
+    return found
+
+
+async def scan(table_name: str, snapshot: Any, predicate: Callable[[Any], bool]) -> List[Any]:
+    """
+    Returns every document of the table visible in snapshot that satisfies
+    predicate, in storage order.
+
+    Large tables are scanned shard by shard on the scan pool and the
+    per-shard results (each already ordered by row) are merged. Smaller
+    ones are scanned inline in chunks that yield to the event loop.
+    """
+    shards = state.db_table_shards.get(table_name)
+    if not shards:
+        return []
+
+    # rows appended after the snapshot are invisible anyway
+    bounds = [(rows, len(rows)) for rows in shards]
+
+    if sum(n for _, n in bounds) < PARALLEL_SCAN_MIN_ROWS:
+        parts = [await _scan_shard_cooperative(rows, n, snapshot, predicate) for rows, n in bounds]
+    else:
+        loop = asyncio.get_running_loop()
+        executor = _get_executor()
+        token = CancelToken()
+        try:
+            parts = await asyncio.gather(*(
+                loop.run_in_executor(executor, _scan_shard, rows, n, snapshot, predicate, token)
+                for rows, n in bounds
+            ))
+        except asyncio.CancelledError:
+            # stop the worker threads too, not just the awaiting coroutine
+            token.cancel()
+            raise
+
+    return [doc for _, doc in heapq.merge(*parts, key=lambda item: item[0])]
+
+
+def _collect_shard(rows: List[int], limit: int, predicate: Callable[[Any], bool]) -> List[Tuple[int, Any]]:
+    found = []
+    for i in range(limit):
+        row = rows[i]
+        doc = state.db_storage[row]
+        if predicate(doc):
+            found.append((row, doc))
+    return found
+
+
+def collect(table_name: str, predicate: Callable[[Any], bool]) -> List[Any]:
+    """
+    Synchronous fan-out over the latest document versions (no snapshot).
+    Used where the caller must not yield to the event loop, e.g. while
+    building a new index that concurrent writers already maintain.
+    """
+    shards = state.db_table_shards.get(table_name)
+    if not shards:
+        return []
+
+    bounds = [(rows, len(rows)) for rows in shards]
+
+    if sum(n for _, n in bounds) < PARALLEL_SCAN_MIN_ROWS:
+        parts = [_collect_shard(rows, n, predicate) for rows, n in bounds]
+    else:
+        executor = _get_executor()
+        parts = list(executor.map(lambda bound: _collect_shard(bound[0], bound[1], predicate), bounds))
+
+    return [doc for _, doc in heapq.merge(*parts, key=lambda item: item[0])]
+
+
+def table_rows(table_name: str) -> Iterator[int]:
+    """Lazily merged storage rows of the table as of now, in storage order"""
+    shards = state.db_table_shards.get(table_name, ())
+    return heapq.merge(*(islice(rows, len(rows)) for rows in shards))
+
+
+def latest_documents(table_name: str) -> List[Any]:
+    """Latest version of every document of the table, in storage order"""
+    return [state.db_storage[row] for row in table_rows(table_name)]
+
+
+def reset() -> None:
+    state.db_table_shards.clear()
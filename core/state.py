@@ -1,17 +1,41 @@
 import asyncio
 from typing import List, Dict
 import uuid
-from models.document_types.document import StandardDocument
 from models.document_types.combined_document import CombinedDocument
 from models.structure.table import Table
-from core.indexes import IndexManager
+from core.indexes import IndexManager, DocIdMap
+from core.records import DocumentRecord
+from core.interning import ValueDictionary
 
-db_storage: List[StandardDocument] = []
-db_index_by_id: Dict[uuid.UUID, StandardDocument] = {}
+db_storage: List[DocumentRecord | CombinedDocument] = []
+db_index_by_id: Dict[uuid.UUID, DocumentRecord | CombinedDocument] = {}
 db_tables_by_name: Dict[str, Table] = {}
 
 db_table_indexes: Dict[str, IndexManager] = {}
 
+# --- MVCC ---
+db_commit_seq: int = 0
+# dense id of a document == its row in db_storage
+db_doc_ids: DocIdMap = DocIdMap()
+db_old_versions: Dict[uuid.UUID, List[DocumentRecord | CombinedDocument]] = {}
+db_active_snapshots: Dict[int, int] = {}
+
+# --- Table partitions: table name -> shard -> storage rows ---
+db_table_shards: Dict[str, List[List[int]]] = {}
+
+# --- Body interning: table name -> shared short string values ---
+db_value_dictionaries: Dict[str, ValueDictionary] = {}
+
+# --- Change tracking ---
+# bumped on every write to a table, never reset while the process lives
+db_table_changes: Dict[str, int] = {}
+# WAL offsets are the same in the owner and in every replica: the end of
+# the last entry applied, and per table the end of its last change
+db_wal_position: int = 0
+db_table_positions: Dict[str, int] = {}
+# names the snapshot file the WAL offsets are relative to
+db_snapshot_epoch: str = "0"
+
 try:
     db_lock = asyncio.Lock()
     wal_lock = asyncio.Lock()
@@ -0,0 +1,85 @@
+import re
+from typing import List, NamedTuple, Tuple
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in",
+    "into", "is", "it", "no", "not", "of", "on", "or", "such", "that", "the",
+    "their", "then", "there", "these", "they", "this", "to", "was", "will", "with"
+})
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# longest suffix first; the stem must keep at least 3 characters
+_SUFFIXES = ("ational", "ization", "fulness", "iveness", "ingly", "edly",
+             "ment", "ness", "ing", "ies", "ied", "ly", "ed", "es", "s")
+
+
+def stem(word: str) -> str:
+    """Light suffix-stripping stemmer, enough to fold plurals and tenses"""
+    if len(word) <= 3 or word.isdigit():
+        return word
+
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            base = word[:-len(suffix)]
+            if suffix in ("ies", "ied"):
+                return base + "y"
+            if suffix == "s" and base.endswith(("s", "u")):
+                # "class", "status" are not plurals
+                return word
+            doubled = len(base) > 3 and base[-1] == base[-2] and base[-1] not in "lsz"
+            if suffix in ("ing", "ed", "edly", "ingly") and doubled:
+                # running -> run, stopped -> stop
+                return base[:-1]
+            return base
+
+    return word
+
+
+def tokenize(text: str) -> List[Tuple[str, int]]:
+    """
+    (term, position) pairs of a text. Positions count stopwords too, so
+    phrase queries keep the original word distances.
+    """
+    tokens = []
+    for position, match in enumerate(_WORD_RE.finditer(text.lower())):
+        word = match.group()
+        if word in STOPWORDS:
+            continue
+        tokens.append((stem(word), position))
+    return tokens
+
+
+class SearchQuery(NamedTuple):
+    terms: List[str]
+    prefixes: List[str]
+    phrases: List[List[Tuple[str, int]]]
+
+
+def parse_query(query: str) -> SearchQuery:
+    """
+    Splits a search string into plain terms, prefix terms ("auto*") and
+    quoted phrases ("new york").
+    """
+    terms, prefixes, phrases = [], [], []
+
+    for phrase, word in _QUERY_RE.findall(query):
+        if phrase:
+            tokens = tokenize(phrase)
+            if len(tokens) == 1:
+                terms.append(tokens[0][0])
+            elif tokens:
+                phrases.append(tokens)
+        elif word.endswith("*") and len(word) > 1:
+            prefix = word.rstrip("*").lower()
+            if prefix:
+                prefixes.append(prefix)
+        else:
+            terms.extend(term for term, _ in tokenize(word))
+
+    return SearchQuery(terms, prefixes, phrases)
@@ -6,6 +6,9 @@ from datetime import datetime
 from fastapi import HTTPException
 
 from core import state
+from core import mvcc
+from core import shards
+from core import records
 from core.state import db_storage, db_index_by_id, wal_lock
 from models.document_types.document import StandardDocument
 from models.document_types.combined_document import CombinedDocument
@@ -18,75 +21,105 @@ async def log_to_wal(operation: dict):
 
     try:
         async with wal_lock:
-            await asyncio.to_thread(_write_wal, log_entry)
+            state.db_wal_position = await asyncio.to_thread(_write_wal, log_entry)
     except Exception as e:
         print(f"!!! CRITICAL WAL WRITE FAILED: {e} !!!")
         raise HTTPException(status_code=500, detail=f"Database WAL write error: {e}")
 
 
-def _write_wal(log_entry: str):
-    """Synchronous helper for writing to WAL"""
-    with open(WAL_FILE, 'a', encoding='utf-8') as f:
-        f.write(log_entry)
+def _write_wal(log_entry: str) -> int:
+    """Synchronous helper for writing to WAL, returns the new end offset"""
+    with open(WAL_FILE, 'ab') as f:
+        f.write(log_entry.encode('utf-8'))
         f.flush()
         os.fsync(f.fileno())
+        return f.tell()
+
+
+def new_snapshot_epoch() -> str:
+    return uuid.uuid4().hex[:8]
 
 
 def _apply_op_to_memory(op: dict):
     op_type = op.get("op")
     try:
         if op_type == "create":
-            doc = StandardDocument.model_validate(op["doc"])
-            db_storage.append(doc)
-            db_index_by_id[doc.id] = doc
+            from core.repository import _stored_record
+            doc = _stored_record(records.to_record(StandardDocument.model_validate(op["doc"])))
+            mvcc.install_new(doc)
+
+            # tables may have been created lazily by the first document
+            t_name = doc.table_data.get("name") if isinstance(doc.table_data, dict) else None
+            if t_name:
+                if t_name not in db_tables_by_name:
+                    db_tables_by_name[t_name] = Table(name=t_name)
+                db_tables_by_name[t_name].documents_count += 1
 
         elif op_type == "create_combined":
             doc = CombinedDocument.model_validate(op["doc"])
-            db_storage.append(doc)
-            db_index_by_id[doc.id] = doc
+            mvcc.install_new(doc)
 
         elif op_type == "update":
             doc_id = uuid.UUID(op["doc_id"])
             doc = db_index_by_id.get(doc_id)
-            if doc and isinstance(doc, StandardDocument):
-                doc.body = op["body"]
-                doc.version = op["version"]
-                doc.updated_at = datetime.fromisoformat(op["updated_at"])
-                doc._update_body_hash()
+            if doc and isinstance(doc, records.DocumentRecord):
+                from core.repository import _intern_body, _doc_table_name
+                new_doc = doc.model_copy(update={
+                    "body": _intern_body(_doc_table_name(doc), op["body"]),
+                    "version": op["version"],
+                    "updated_at": datetime.fromisoformat(op["updated_at"])
+                })
+                new_doc._reset_body_hash()
+                mvcc.install_version(doc, new_doc)
 
         elif op_type == "archive":
             doc_id = uuid.UUID(op["doc_id"])
             doc = db_index_by_id.get(doc_id)
             if doc:
-                # 'archive()' works for both btw
-                doc.archive()
-                doc.version = op["version"]
-                doc.updated_at = datetime.fromisoformat(op["updated_at"])
+                # records and CombinedDocuments both take model_copy(update=...)
+                updated_at = datetime.fromisoformat(op["updated_at"])
+                new_doc = doc.model_copy(update={
+                    "version": op["version"],
+                    "updated_at": updated_at,
+                    "archived_at": doc.archived_at or updated_at
+                })
+                mvcc.install_version(doc, new_doc)
         elif op_type == "create_table":
             from models.structure.table import Table
             table = Table.model_validate(op["table"])
             db_tables_by_name[table.name] = table
+            mvcc.note_table_change(table.name)
             print(f"🔄 Replayed table creation: {table.name}")
         elif op_type == "drop_table":
             name = op["name"]
             if name in db_tables_by_name:
                 del db_tables_by_name[name]
+                state.db_table_shards.pop(name, None)
+                state.db_value_dictionaries.pop(name, None)
+                mvcc.note_table_change(name)
                 print(f"🗑️ Replayed table drop: {name}")
 
         elif op_type == "create_index":
             table_name = op["table_name"]
             field = op["field"]
             index_type = op["index_type"]
+            predicate = op.get("predicate")
 
             from core.repository import _get_or_create_index_manager
             index_manager = _get_or_create_index_manager(table_name)
 
             try:
-                index_manager.create_index(field, index_type)
+                index_manager.create_index(field, index_type, predicate)
                 print(f"🔄 Replayed index creation: {table_name}.{field}")
             except ValueError:
                 pass
 
+            # keep Table.indexes in sync so the next checkpoint persists it
+            if table_name in db_tables_by_name:
+                db_tables_by_name[table_name].indexes[field] = index_type
+                if predicate:
+                    db_tables_by_name[table_name].index_predicates[field] = predicate
+
         elif op_type == "drop_index":
             table_name = op["table_name"]
             field = op["field"]
@@ -95,6 +128,10 @@ def _apply_op_to_memory(op: dict):
                 state.db_table_indexes[table_name].drop_index(field)
                 print(f"🗑️ Replayed index drop: {table_name}.{field}")
 
+            if table_name in db_tables_by_name:
+                db_tables_by_name[table_name].indexes.pop(field, None)
+                db_tables_by_name[table_name].index_predicates.pop(field, None)
+
     except Exception as e:
         print(f"Failed to apply WAL op: {op_type}. Error: {e}")
 
@@ -106,13 +143,18 @@ def load_snapshot():
             with open(STORAGE_FILE, 'r', encoding='utf-8') as f:
                 raw_data = json.load(f)
 
+                # files written before epochs existed: their mtime tells them apart
+                state.db_snapshot_epoch = (raw_data.get("epoch") if isinstance(raw_data, dict) else None) \
+                    or f"{os.stat(STORAGE_FILE).st_mtime_ns:x}"
+
+                from core.repository import _stored_record, _refresh_index_bodies
+
                 if isinstance(raw_data, list):
                     print("⚠️ Detected legacy storage format. Migrating...")
                     for item in raw_data:
                         try:
-                            doc = StandardDocument.model_validate(item)
-                            db_storage.append(doc)
-                            db_index_by_id[doc.id] = doc
+                            doc = _stored_record(records.to_record(StandardDocument.model_validate(item)))
+                            mvcc.install_new(doc)
                         except Exception as e:
                             print(f"Skipping invalid doc: {e}")
 
@@ -129,9 +171,8 @@ def load_snapshot():
                     docs_data = raw_data.get("documents", [])
                     for d_item in docs_data:
                         try:
-                            doc = StandardDocument.model_validate(d_item)
-                            db_storage.append(doc)
-                            db_index_by_id[doc.id] = doc
+                            doc = _stored_record(records.to_record(StandardDocument.model_validate(d_item)))
+                            mvcc.install_new(doc)
                         except Exception as e:
                             print(f"❌ Failed to load doc: {e}")
 
@@ -157,74 +198,77 @@ def load_snapshot():
                             print(f"   Building indexes for table '{table_name}'...")
 
                             if table_name not in state.db_table_indexes:
-                                state.db_table_indexes[table_name] = IndexManager()
+                                state.db_table_indexes[table_name] = IndexManager(state.db_doc_ids)
 
                             index_manager = state.db_table_indexes[table_name]
 
                             for field, idx_type in table.indexes.items():
                                 try:
-                                    index_manager.create_index(field, idx_type)
+                                    index_manager.create_index(field, idx_type, table.index_predicates.get(field))
                                 except ValueError:
                                     pass
 
-                            docs_in_table = []
-                            for doc in db_storage:
-                                if doc.is_archived():
-                                    continue
-
-                                doc_t_name = None
-                                if isinstance(doc.table_data, dict):
-                                    doc_t_name = doc.table_data.get("name")
-                                elif isinstance(doc.table_data, list) and len(doc.table_data) > 1:
-                                    doc_t_name = doc.table_data[1]
-
-                                if doc_t_name == table_name:
-                                    docs_in_table.append(doc)
+                            docs_in_table = shards.collect(table_name, lambda doc: not doc.is_archived())
 
                             index_manager.rebuild_all(docs_in_table)
+                            _refresh_index_bodies(table_name)
 
                     print(f"--- Loaded: {len(db_tables_by_name)} tables, {len(db_storage)} documents. ---")
 
         else:
+            state.db_snapshot_epoch = "0"
             print(f"--- File {STORAGE_FILE} not found. Starting with an empty DB. ---")
 
     except Exception as e:
         print(f"!!! CRITICAL ERROR while loading snapshot: {e} !!!")
         raise e
 
-def recover_from_wal():
+def recover_from_wal() -> int:
+    """
+    Replays the WAL into memory and returns the offset just past the last
+    complete entry. A torn entry at the end is left for whoever reads on.
+    """
+    position = 0
     if os.path.exists(WAL_FILE):
         print(f"--- Replaying WAL file ({WAL_FILE})... ---")
         replayed_ops = 0
-        with open(WAL_FILE, 'r', encoding='utf-8') as f:
+        with open(WAL_FILE, 'rb') as f:
             for line in f:
+                if not line.endswith(b"\n"):
+                    print(f"⚠️ Ignoring incomplete WAL entry at offset {position}")
+                    break
+                position += len(line)
                 if not line.strip():
                     continue
 
                 try:
                     op = json.loads(line)
+                    state.db_wal_position = position
                     _apply_op_to_memory(op)
                     replayed_ops += 1
                 except Exception as e:
-                    print(f"!!! CRITICAL: Failed to replay WAL entry: {line}. Error: {e} !!!")
+                    print(f"!!! CRITICAL: Failed to replay WAL entry: {line.decode('utf-8', 'replace')}. Error: {e} !!!")
         print("--- Rebuilding indexes... ---")
+        from core.repository import _refresh_index_bodies
         for table_name, index_manager in state.db_table_indexes.items():
-            docs_in_table = [
-                doc for doc in db_storage
-                if doc.table_data.get("name") == table_name
-            ]
+            docs_in_table = shards.collect(table_name, lambda doc: not doc.is_archived())
             index_manager.rebuild_all(docs_in_table)
+            _refresh_index_bodies(table_name)
             print(f"✅ Rebuilt indexes for table: {table_name}")
         print(f"--- WAL replay complete. {replayed_ops} operations replayed. ---")
+    return position
 
 
 def perform_checkpoint():
     print("\n--- YaraDB: Checkpointing... ---")
     try:
-        data_to_save = {
-            "tables": [t.model_dump(by_alias=True) for t in db_tables_by_name.values()],
-            "documents": [d.model_dump(by_alias=True) for d in db_storage]
-        }
+        epoch = new_snapshot_epoch()
+        with mvcc.open_snapshot() as snapshot:
+            data_to_save = {
+                "epoch": epoch,
+                "tables":  [t.model_dump(by_alias=True) for t in db_tables_by_name.values()],
+                "documents": [records.to_model(d).model_dump(by_alias=True) for d in snapshot.documents()]
+            }
 
         temp_file = f"{STORAGE_FILE}.tmp"
         with open(temp_file, 'w', encoding='utf-8') as f:
@@ -235,6 +279,10 @@ def perform_checkpoint():
         with open(WAL_FILE, 'w') as f:
             f.truncate(0)
 
+        state.db_snapshot_epoch = epoch
+        state.db_wal_position = 0
+        state.db_table_positions.clear()
+
         print("--- Checkpoint successful. ---")
     except Exception as e:
         print(f"!!! CRITICAL ERROR while saving DB: {e} !!!")
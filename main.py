@@ -1,5 +1,8 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from typing import List, Dict, Any, Union
+import os
+import subprocess
+import sys
 import uvicorn
 import uuid
 import logging
@@ -10,13 +13,19 @@ from core.lifespan import lifespan
 from models.document_types.document import StandardDocument
 from models.document_types.combined_document import CombinedDocument
 from starlette.middleware.cors import CORSMiddleware
-from models.api import CreateRequest, UpdateRequest, CombineRequest, CreateTableRequest, TableResponse, CreateIndexRequest, IndexResponse
+from models.api import CreateRequest, UpdateRequest, CombineRequest, CreateTableRequest, TableResponse, CreateIndexRequest, IndexResponse, SearchRequest, SearchHit, AggregateRequest, VectorSearchRequest
 from prometheus_fastapi_instrumentator import Instrumentator
 from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
 from datetime import datetime, timezone
 from models.api import SelfDestructRequest
 from core import state
+from core import shards
+from core import scheduling
+from core import serialization
+from core import etags
+from core import records
+from core import replica
+from core.constants.main_values import YARADB_ROLE, WORKERS, OWNER_SOCKET
 
 app = FastAPI(
     title="YaraDB",
@@ -32,7 +41,7 @@ app.add_middleware(
 
 Instrumentator().instrument(app).expose(app)
 
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=replica.client_address)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -48,6 +57,34 @@ logging.basicConfig(
 logger = logging.getLogger("yaradb")
 
 
+if YARADB_ROLE == "reader":
+    @app.middleware("http")
+    async def forward_writes_to_owner(request: Request, call_next):
+        if not replica.is_write_request(request.method, request.url.path):
+            return await call_next(request)
+
+        headers = replica.forwarded_headers(dict(request.headers), request.client and request.client.host)
+        try:
+            owner_response = await replica.forward_to_owner(
+                request.method,
+                request.url.path,
+                request.url.query,
+                headers,
+                await request.body()
+            )
+        except Exception as e:
+            logger.error(f"Owner process unreachable: {e}")
+            return Response(content='{"detail":"Write owner unavailable"}',
+                            status_code=503, media_type="application/json")
+
+        excluded = ("content-length", "transfer-encoding", "connection")
+        return Response(
+            content=owner_response.content,
+            status_code=owner_response.status_code,
+            headers={k: v for k, v in owner_response.headers.items() if k.lower() not in excluded}
+        )
+
+
 @app.get("/ping")
 async def root():
     return {"status": "alive"}
@@ -63,7 +100,7 @@ async def create_document_endpoint(request: Request, request_data: CreateRequest
             table_name=request_data.table_name
         )
         logger.info(f"Document created: {new_doc.id}")
-        return new_doc
+        return serialization.model_response(new_doc)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -76,7 +113,11 @@ async def get_document_by_id(request: Request, doc_id: uuid.UUID):
     doc = await repository.get_document(doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
-    return doc
+
+    etag = etags.document_etag(doc)
+    if etags.if_none_match(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return serialization.cached_document_response(doc, headers={"ETag": etag})
 
 
 @app.post("/document/find", response_model=List[StandardDocument])
@@ -89,18 +130,173 @@ async def find_documents(
         sort_by: str | None = None,
         order: str = "asc",
         limit: int | None = None,
-        offset: int = 0
+        offset: int = 0,
+        timeout_ms: int | None = None,
+        fields: str | None = None,
+        cache: bool = False
 ):
-    results = await repository.find_documents(
-        filter_body=filter_body,
-        table_name=table_name,
-        include_archived=include_archived,
-        sort_by=sort_by,
-        order=order,
-        limit=limit,
-        offset=offset
-    )
-    return results
+    # comma-separated body paths; "_id" selects the document id
+    projection = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        results = await scheduling.run_with_timeout(
+            repository.find_documents(
+                filter_body=filter_body,
+                table_name=table_name,
+                include_archived=include_archived,
+                sort_by=sort_by,
+                order=order,
+                limit=limit,
+                offset=offset,
+                fields=projection,
+                cache=cache
+            ),
+            timeout_ms
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Query timed out after {timeout_ms} ms")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if projection:
+        # projected rows are plain dicts, not StandardDocument
+        return serialization.value_response(results)
+    return serialization.models_response(results, as_type=StandardDocument)
+
+
+@app.post("/document/count")
+@limiter.limit("10/minute")
+async def count_documents(
+        request: Request,
+        filter_body: Dict[str, Any],
+        table_name: str | None = None,
+        include_archived: bool = False,
+        timeout_ms: int | None = None
+):
+    try:
+        count = await scheduling.run_with_timeout(
+            repository.count_documents(filter_body, table_name, include_archived),
+            timeout_ms
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Count timed out after {timeout_ms} ms")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"count": count}
+
+
+@app.post("/document/exists")
+@limiter.limit("10/minute")
+async def documents_exist(
+        request: Request,
+        filter_body: Dict[str, Any],
+        table_name: str | None = None,
+        include_archived: bool = False,
+        timeout_ms: int | None = None
+):
+    try:
+        exists = await scheduling.run_with_timeout(
+            repository.documents_exist(filter_body, table_name, include_archived),
+            timeout_ms
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Exists check timed out after {timeout_ms} ms")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"exists": exists}
+
+
+@app.post("/document/distinct")
+@limiter.limit("10/minute")
+async def distinct_values(
+        request: Request,
+        filter_body: Dict[str, Any],
+        table_name: str,
+        field: str,
+        include_archived: bool = False,
+        limit: int | None = None,
+        timeout_ms: int | None = None
+):
+    try:
+        counts = await scheduling.run_with_timeout(
+            repository.distinct_values(table_name, field, filter_body, include_archived, limit),
+            timeout_ms
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Distinct timed out after {timeout_ms} ms")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "table_name": table_name,
+        "field": field,
+        "values": [{"value": value, "count": count} for value, count in counts]
+    }
+
+
+@app.post("/aggregate")
+@limiter.limit("10/minute")
+async def aggregate(request: Request, req: AggregateRequest, timeout_ms: int | None = None):
+    try:
+        rows = await scheduling.run_with_timeout(
+            repository.aggregate_documents(
+                table_name=req.table_name,
+                match=req.match,
+                group_by=req.group_by,
+                accumulators={name: acc.model_dump() for name, acc in req.accumulators.items()},
+                sort_by=req.sort_by,
+                order=req.order,
+                limit=req.limit,
+                include_archived=req.include_archived
+            ),
+            timeout_ms
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Aggregation timed out after {timeout_ms} ms")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"table_name": req.table_name, "results": rows}
+
+
+@app.post("/document/search", response_model=List[SearchHit])
+@limiter.limit("10/minute")
+async def search_documents(request: Request, req: SearchRequest, timeout_ms: int | None = None):
+    try:
+        hits = await scheduling.run_with_timeout(
+            repository.search_documents(
+                table_name=req.table_name,
+                query_text=req.query,
+                field=req.field,
+                limit=req.limit
+            ),
+            timeout_ms
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Search timed out after {timeout_ms} ms")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return serialization.models_response(SearchHit(score=round(score, 6), document=records.to_model(doc)) for doc, score in hits)
+
+
+@app.post("/document/vector_search", response_model=List[SearchHit])
+@limiter.limit("10/minute")
+async def vector_search(request: Request, req: VectorSearchRequest):
+    """Nearest neighbours; score is the similarity, or the distance for l2"""
+    try:
+        hits = await scheduling.run_with_timeout(
+            repository.search_vectors(
+                table_name=req.table_name,
+                field=req.field,
+                vector=req.vector,
+                k=req.k,
+                metric=req.metric,
+                nprobe=req.nprobe
+            ),
+            req.timeout_ms
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Vector search timed out after {req.timeout_ms} ms")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return serialization.models_response(SearchHit(score=round(score, 6), document=records.to_model(doc)) for doc, score in hits)
 
 
 @app.put("/document/update/{doc_id}", response_model=StandardDocument)
@@ -113,7 +309,7 @@ async def update_document_endpoint(request: Request, doc_id: uuid.UUID, update_d
             body=update_data.body
         )
         logger.info(f"Document updated: {updated_doc.id}")
-        return updated_doc
+        return serialization.model_response(updated_doc, as_type=StandardDocument)
     except LookupError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except ValueError as e:
@@ -131,7 +327,7 @@ async def archive_document_endpoint(request: Request, doc_id: uuid.UUID):
     try:
         archived_doc = await repository.archive_document(doc_id)
         logger.info(f"Document archived: {archived_doc.id}")
-        return archived_doc
+        return serialization.model_response(archived_doc, as_type=StandardDocument)
     except LookupError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except ValueError as e:
@@ -173,6 +369,14 @@ async def self_destruct_endpoint(payload: SelfDestructRequest):
         raise HTTPException(status_code=500, detail="Self-destruct mechanism jammed.")
 
 
+@app.post("/system/verify-hashes")
+async def verify_hashes_endpoint(table_name: str | None = None):
+    try:
+        return await repository.verify_body_hashes(table_name)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
 @app.post("/document/batch/create")
 @limiter.limit("10/minute")
 async def batch_create(request: Request, docs: List[CreateRequest]):
@@ -181,7 +385,7 @@ async def batch_create(request: Request, docs: List[CreateRequest]):
         doc = await repository.create_document(req.name, req.body, req.table_name)
         results.append(doc)
     logger.info(f"Batch created: {len(results)} documents")
-    return results
+    return serialization.models_response([records.to_model(r) for r in results])
 
 
 @app.post("/document/combine", response_model=CombinedDocument)
@@ -194,7 +398,7 @@ async def combine_docs(request: Request, payload: CombineRequest):
             merge_strategy=payload.merge_strategy
         )
         logger.info(f"Combined document: {combined_doc.id}")
-        return combined_doc
+        return serialization.model_response(combined_doc)
     except LookupError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except ValueError as e:
@@ -252,16 +456,32 @@ async def delete_table_endpoint(table_name: str):
 
 
 @app.get("/table/{table_name}/documents", response_model=List[StandardDocument])
-async def get_table_content(table_name: str):
+async def get_table_content(request: Request, table_name: str):
+    if table_name not in state.db_tables_by_name:
+        raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
+
+    # taken before the scan: the content is never older than its tag
+    etag = etags.table_etag(table_name)
+    if etags.if_none_match(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
     try:
         docs = await repository.get_documents_in_table(table_name)
-        return docs
+        return serialization.models_response(docs, headers={"ETag": etag}, as_type=StandardDocument)
     except LookupError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/table/{table_name}/memory")
+async def get_table_memory(table_name: str):
+    try:
+        return await repository.table_memory_report(table_name)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
 @app.post("/table/{table_name}/index/create", response_model=IndexResponse)
 async def create_index_endpoint(table_name: str, req: CreateIndexRequest):
     try:
@@ -269,34 +489,47 @@ async def create_index_endpoint(table_name: str, req: CreateIndexRequest):
         if not table:
             raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
 
+        index_name = req.index_name()
         index_manager = repository._get_or_create_index_manager(table_name)
-        index = index_manager.create_index(req.field, req.index_type)
-
-        docs_in_table = [
-            doc for doc in state.db_storage
-            if doc.table_data.get("name") == table_name and not doc.is_archived()
-        ]
-
-        for doc in docs_in_table:
-            index_manager.add_document(doc.id, doc.body)
-
-        table.indexes[req.field] = req.index_type
+        # queries can't use the index until it holds every document
+        index_manager.create_index(index_name, req.index_type, req.predicate, building=True)
+
+        docs_in_table = shards.collect(table_name, lambda doc: not doc.is_archived())
+
+        # writers maintain the new index while we yield, so always index
+        # the latest version and skip documents archived in the meantime
+        try:
+            async for doc in scheduling.cooperative(docs_in_table):
+                latest = state.db_index_by_id.get(doc.id)
+                if latest is not None and not latest.is_archived():
+                    index_manager.index_document(index_name, latest.id, latest.body)
+        except BaseException:
+            index_manager.drop_index(index_name)
+            raise
+        repository._refresh_index_bodies(table_name)
+        index_manager.finish_index(index_name)
+
+        table.indexes[index_name] = req.index_type
+        if req.predicate:
+            table.index_predicates[index_name] = req.predicate
 
         from core import wal
         wal_op = {
             "op": "create_index",
             "table_name": table_name,
-            "field": req.field,
-            "index_type": req.index_type
+            "field": index_name,
+            "index_type": req.index_type,
+            "predicate": req.predicate
         }
         await wal.log_to_wal(wal_op)
 
-        logger.info(f"Index created: {table_name}.{req.field} ({req.index_type})")
+        logger.info(f"Index created: {table_name}.{index_name} ({req.index_type})")
 
         return IndexResponse(
             table_name=table_name,
-            field=req.field,
+            field=index_name,
             index_type=req.index_type,
+            predicate=req.predicate,
             created_at=datetime.now(timezone.utc)
         )
 
@@ -340,6 +573,7 @@ async def drop_index_endpoint(table_name: str, field: str):
 
     if field in table.indexes:
         del table.indexes[field]
+    table.index_predicates.pop(field, None)
 
     from core import wal
     wal_op = {
@@ -354,13 +588,46 @@ async def drop_index_endpoint(table_name: str, field: str):
     return {"status": "success", "message": f"Index '{field}' dropped"}
 
 
+def _run_multi_process(workers: int) -> None:
+    """
+    One owner process handles every write and the WAL (on a UNIX socket),
+    `workers` reader processes share the public port and serve reads
+    from WAL-following replicas.
+    """
+    if os.path.exists(OWNER_SOCKET):
+        os.remove(OWNER_SOCKET)
+
+    owner_env = dict(os.environ, YARADB_ROLE="owner")
+    owner = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--uds", OWNER_SOCKET, "--workers", "1"],
+        env=owner_env
+    )
+
+    os.environ["YARADB_ROLE"] = "reader"
+    try:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=workers,
+            reload=False,
+            limit_concurrency=100,
+        )
+    finally:
+        owner.terminate()
+        owner.wait()
+
+
 if __name__ == "__main__":
-    print("--- Starting YaraDB (v3.0) on http://0.0.0.0:8000 ---")
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        workers=1,
-        reload=False,
-        limit_concurrency=100,
-    )
\ No newline at end of file
+    print(f"--- Starting YaraDB (v3.0) on http://0.0.0.0:8000 with {WORKERS} worker(s) ---")
+    if WORKERS > 1:
+        _run_multi_process(WORKERS)
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=1,
+            reload=False,
+            limit_concurrency=100,
+        )
\ No newline at end of file
@@ -3,6 +3,8 @@ from pydantic import BaseModel, Field
 import uuid
 from datetime import datetime
 
+from models.document_types.document import StandardDocument
+
 class CreateRequest(BaseModel):
     table_name: str
     name: str | None = None
@@ -23,6 +25,8 @@ class CreateTableRequest(BaseModel):
     schema_definition: Dict[str, Any] | None = None
     read_only: bool = False
     unique_fields: List[str] = []
+    # keep bodies as encoded bytes, decoded on read (for mostly-cold tables)
+    body_encoding: Literal["json", "json+zlib"] | None = None
 
 class TableResponse(BaseModel):
     id: uuid.UUID
@@ -38,11 +42,70 @@ class SelfDestructRequest(BaseModel):
     confirm: bool = True
 
 class CreateIndexRequest(BaseModel):
+    field: str | None = None
+    fields: List[str] | None = Field(
+        default=None,
+        description="Ordered field list for a compound index (hash or btree)"
+    )
+    index_type: Literal["hash", "btree", "bitmap", "text", "column", "vector", "geo"] = "hash"
+    predicate: Dict[str, Any] | None = Field(
+        default=None,
+        description="Partial index: only documents matching this filter are indexed"
+    )
+
+    def index_name(self) -> str:
+        if self.fields:
+            if len(self.fields) == 1:
+                return self.fields[0]
+            if any("," in f for f in self.fields):
+                raise ValueError("Field names in a compound index can't contain ','")
+            return ",".join(self.fields)
+        if self.field:
+            return self.field
+        raise ValueError("Either 'field' or 'fields' is required")
+
+class SearchRequest(BaseModel):
+    table_name: str
+    query: str = Field(..., description='Terms, prefixes ("auto*") and quoted phrases')
+    field: str | None = Field(default=None, description="Text-indexed field, optional if the table has one")
+    limit: int = Field(default=10, ge=1)
+
+class VectorSearchRequest(BaseModel):
+    table_name: str
     field: str
-    index_type: Literal["hash", "btree"] = "hash"
+    vector: List[float]
+    k: int = Field(default=10, ge=1)
+    metric: Literal["cosine", "dot", "l2"] = "cosine"
+    nprobe: int | None = Field(
+        default=None, ge=1,
+        description="Approximate (IVF) search over this many clusters; exact when omitted"
+    )
+    timeout_ms: int | None = Field(default=None, ge=1, description="Fails with 504 once exceeded")
 
 class IndexResponse(BaseModel):
     table_name: str
     field: str
     index_type: str
-    created_at: datetime
\ No newline at end of file
+    predicate: Dict[str, Any] | None = None
+    created_at: datetime
+
+class SearchHit(BaseModel):
+    score: float
+    document: StandardDocument
+
+class Accumulator(BaseModel):
+    op: Literal["count", "sum", "avg", "min", "max"]
+    field: str | None = None
+
+class AggregateRequest(BaseModel):
+    table_name: str
+    match: Dict[str, Any] = Field(default_factory=dict, description="find() filter applied first")
+    group_by: List[str] = Field(default_factory=list, description="Body paths forming the group key")
+    accumulators: Dict[str, Accumulator] = Field(
+        default_factory=lambda: {"count": Accumulator(op="count")},
+        description="Output name -> accumulator"
+    )
+    sort_by: str | None = None
+    order: Literal["asc", "desc"] = "asc"
+    limit: int | None = Field(default=None, ge=1)
+    include_archived: bool = False
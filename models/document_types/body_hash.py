@@ -0,0 +1,31 @@
+import json
+import zlib
+import hashlib
+from typing import Any, Dict
+
+from core.constants.main_values import BODY_HASH_ALGORITHM
+
+# sha256 digests stay unprefixed, as they always were; the others carry
+# their algorithm so a hash can be re-checked after the setting changes
+HASH_ALGORITHMS = ("sha256", "blake2b", "crc32")
+
+
+def body_digest(body: Dict[str, Any], algorithm: str = BODY_HASH_ALGORITHM) -> str:
+    data = json.dumps(body, sort_keys=True).encode('utf-8')
+    if algorithm == "sha256":
+        return hashlib.sha256(data).hexdigest()
+    if algorithm == "blake2b":
+        return "blake2b:" + hashlib.blake2b(data, digest_size=16).hexdigest()
+    if algorithm == "crc32":
+        # not collision resistant: detects corruption, not tampering
+        return f"crc32:{zlib.crc32(data):08x}"
+    raise ValueError(f"Unknown body hash algorithm '{algorithm}', expected one of {list(HASH_ALGORITHMS)}")
+
+
+def algorithm_of(digest: str) -> str:
+    algorithm, sep, _ = digest.partition(":")
+    return algorithm if sep else "sha256"
+
+
+def matches_body(body: Dict[str, Any], digest: str) -> bool:
+    return body_digest(body, algorithm_of(digest)) == digest
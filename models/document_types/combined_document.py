@@ -1,10 +1,10 @@
 import uuid
-import json
-import hashlib
 from typing import List, Dict, Any
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, field_serializer
 from datetime import datetime, timezone
 
+from models.document_types.body_hash import body_digest
+
 
 class CombinedDocument(BaseModel):
     """
@@ -15,7 +15,7 @@ class CombinedDocument(BaseModel):
         name: Name of the combined document
         document_ids: List of source document UUIDs
         body: Combined data from all documents
-        body_hash: SHA-256 hash of body for integrity verification
+        body_hash: Hash of body for integrity verification, computed on first use
         created_at: Creation timestamp
         updated_at: Last update timestamp
         version: Document version (for OCC)
@@ -43,17 +43,23 @@ class CombinedDocument(BaseModel):
     version: int = 1
     archived_at: datetime | None = None
 
-    def _update_body_hash(self) -> None:
-        """Calculates and updates SHA-256 hash of body"""
-        body_str = json.dumps(self.body, sort_keys=True).encode('utf-8')
-        hash_obj = hashlib.sha256(body_str)
-        self.body_hash = hash_obj.hexdigest()
+    # commit sequence number of this version (MVCC)
+    _commit_seq: int = 0
+
+    def get_body_hash(self) -> str:
+        """Returns hash of body, calculating it on first call"""
+        if self.body_hash is None:
+            self.body_hash = body_digest(self.body)
+        return self.body_hash
+
+    def _reset_body_hash(self) -> None:
+        """Drops the cached hash after body changed"""
+        self.body_hash = None
 
-    @model_validator(mode='after')
-    def _run_hash_validator(self) -> 'CombinedDocument':
-        """Automatically calculates hash after creation/update"""
-        self._update_body_hash()
-        return self
+    @field_serializer("body_hash")
+    def _serialize_body_hash(self, body_hash: str | None) -> str:
+        """Serialized documents always carry their hash"""
+        return body_hash or self.get_body_hash()
 
     def get_id_str(self) -> str:
         """Returns ID as string"""
@@ -92,4 +98,4 @@ class CombinedDocument(BaseModel):
         if "_metadata" not in self.body:
             self.body["_metadata"] = {}
         self.body["_metadata"][key] = value
-        self._update_body_hash()
\ No newline at end of file
+        self._reset_body_hash()
\ No newline at end of file
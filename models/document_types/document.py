@@ -1,12 +1,11 @@
 import uuid
-import json
-import hashlib
 from datetime import datetime, timezone
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, field_serializer
 from typing import List, Any, Dict
 
 from models.interfaces.strategy_interface import IValueProcessor
 from models.processors.document_processor import DefaultProcessor, EmailProcessor, AgeProcessor
+from models.document_types.body_hash import body_digest
 
 
 class StandardDocument(BaseModel):
@@ -19,6 +18,7 @@ class StandardDocument(BaseModel):
     body: Dict[str, Any]
 
     # --- Footer ---
+    # computed on first use (see get_body_hash), None while not yet needed
     body_hash: str | None = None
 
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -27,15 +27,21 @@ class StandardDocument(BaseModel):
     version: int = 1
     archived_at: datetime | None = None
 
-    def _update_body_hash(self) -> None:
-        body_str = json.dumps(self.body, sort_keys=True).encode('utf-8')
-        hash_obj = hashlib.sha256(body_str)
-        self.body_hash = hash_obj.hexdigest()
+    # commit sequence number of this version (MVCC)
+    _commit_seq: int = 0
 
-    @model_validator(mode='after')
-    def _run_hash_validator(self) -> 'StandardDocument':
-        self._update_body_hash()
-        return self
+    def get_body_hash(self) -> str:
+        if self.body_hash is None:
+            self.body_hash = body_digest(self.body)
+        return self.body_hash
+
+    def _reset_body_hash(self) -> None:
+        """Call after changing body; the hash is recomputed when next read"""
+        self.body_hash = None
+
+    @field_serializer("body_hash")
+    def _serialize_body_hash(self, body_hash: str | None) -> str:
+        return body_hash or self.get_body_hash()
 
     _processors: Dict[str, IValueProcessor] = {
         "email": EmailProcessor(),
@@ -77,6 +83,6 @@ class StandardDocument(BaseModel):
         now = datetime.now(timezone.utc)
         self.updated_at = now
         self.version += 1
-        self._update_body_hash()
+        self._reset_body_hash()
 
         print(f"Updated '{value_name}' successfully.")
\ No newline at end of file
@@ -19,4 +19,8 @@ class Table(BaseModel):
     indexes: Dict[str, str] = Field(
         default_factory=dict,
         description="field_name -> index_type mapping"
+    )
+    index_predicates: Dict[str, Dict[str, Any]] = Field(
+        default_factory=dict,
+        description="field_name -> filter of a partial index"
     )
\ No newline at end of file
@@ -21,6 +21,15 @@ def clean_database():
         os.remove(WAL_FILE)
 
 
+@pytest.fixture(autouse=True)
+def disable_rate_limit():
+    if hasattr(app.state, "limiter"):
+        app.state.limiter.enabled = False
+    yield
+    if hasattr(app.state, "limiter"):
+        app.state.limiter.enabled = True
+
+
 @pytest.fixture(scope="function")
 def client():
     """Create a test client"""
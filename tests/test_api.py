@@ -1,16 +1,5 @@
 import pytest
 from datetime import datetime
-from main import app
-
-
-@pytest.fixture(autouse=True)
-def disable_rate_limit():
-    if hasattr(app.state, "limiter"):
-        app.state.limiter.enabled = False
-    yield
-    if hasattr(app.state, "limiter"):
-        app.state.limiter.enabled = True
-
 
 TEST_TABLE = "test_table"
 
@@ -614,4 +603,836 @@ def test_find_with_descending_sort(client):
 
     results = response.json()
     assert results[0]["body"]["value"] == 40
-    assert results[-1]["body"]["value"] == 0
\ No newline at end of file
+    assert results[-1]["body"]["value"] == 0
+
+def test_find_intersects_multiple_indexes(client):
+    table_name = "multi_index_intersection"
+    for i in range(8):
+        client.post("/document/create", json={
+            "table_name": table_name,
+            "name": f"doc_{i}",
+            "body": {"tenant": f"t{i % 2}", "status": "open" if i < 4 else "closed"}
+        })
+
+    client.post(f"/table/{table_name}/index/create", json={"field": "tenant", "index_type": "hash"})
+    client.post(f"/table/{table_name}/index/create", json={"field": "status", "index_type": "btree"})
+
+    response = client.post("/document/find", json={"tenant": "t1", "status": "open"},
+                           params={"table_name": table_name})
+    assert response.status_code == 200
+    assert [d["name"] for d in response.json()] == ["doc_1", "doc_3"]
+
+
+def test_bitmap_indexes_combine(client):
+    table_name = "bitmap_dashboard"
+    statuses = ["open", "closed", "pending"]
+    for i in range(12):
+        client.post("/document/create", json={
+            "table_name": table_name,
+            "name": f"doc_{i}",
+            "body": {"status": statuses[i % 3], "country": "UA" if i < 6 else "PL", "vip": i % 2 == 0}
+        })
+
+    for field in ("status", "country", "vip"):
+        resp = client.post(f"/table/{table_name}/index/create", json={"field": field, "index_type": "bitmap"})
+        assert resp.status_code == 200
+        assert resp.json()["index_type"] == "bitmap"
+
+    response = client.post("/document/find", json={
+        "status": {"$in": ["open", "pending"]},
+        "country": "UA",
+        "vip": {"$ne": False}
+    }, params={"table_name": table_name})
+    assert response.status_code == 200
+    assert [d["name"] for d in response.json()] == ["doc_0", "doc_2"]
+
+    response = client.post("/document/find", json={"status": {"$nin": ["open"]}, "country": "PL"},
+                           params={"table_name": table_name})
+    assert [d["name"] for d in response.json()] == ["doc_7", "doc_8", "doc_10", "doc_11"]
+
+    indexes = client.get(f"/table/{table_name}/indexes").json()["indexes"]
+    status_stats = next(i for i in indexes if i["field"] == "status")
+    assert status_stats["type"] == "bitmap"
+    assert status_stats["unique_values"] == 3
+
+    bad = client.post("/document/find", json={"status": {"$regex": "o"}}, params={"table_name": table_name})
+    assert bad.status_code == 400
+
+
+def test_compound_index_prefix_range_and_sort(client):
+    table_name = "compound_orders"
+    for i in range(10):
+        client.post("/document/create", json={
+            "table_name": table_name,
+            "name": f"order_{i}",
+            "body": {"customer": "alice" if i % 2 == 0 else "bob", "status": "paid" if i < 6 else "new", "total": i * 10}
+        })
+
+    resp = client.post(f"/table/{table_name}/index/create",
+                       json={"fields": ["customer", "status"], "index_type": "hash"})
+    assert resp.status_code == 200
+    assert resp.json()["field"] == "customer,status"
+
+    resp = client.post(f"/table/{table_name}/index/create",
+                       json={"fields": ["customer", "total"], "index_type": "btree"})
+    assert resp.status_code == 200
+
+    response = client.post("/document/find", json={"customer": "alice", "status": "paid"},
+                           params={"table_name": table_name})
+    assert [d["name"] for d in response.json()] == ["order_0", "order_2", "order_4"]
+
+    response = client.post("/document/find", json={"customer": "bob", "total": {"$gte": 30, "$lt": 90}},
+                           params={"table_name": table_name})
+    assert [d["name"] for d in response.json()] == ["order_3", "order_5", "order_7"]
+
+    response = client.post("/document/find", json={"customer": "alice", "total": {"$gte": 0}}, params={
+        "table_name": table_name, "sort_by": "total", "order": "desc", "limit": 2
+    })
+    assert [d["body"]["total"] for d in response.json()] == [80, 60]
+
+    table = client.get(f"/table/{table_name}").json()
+    assert table["indexes"]["customer,total"] == "btree"
+
+    indexes = client.get(f"/table/{table_name}/indexes").json()["indexes"]
+    compound = next(i for i in indexes if i["field"] == "customer,status")
+    assert compound["fields"] == ["customer", "status"]
+
+    bad = client.post(f"/table/{table_name}/index/create", json={"index_type": "hash"})
+    assert bad.status_code == 400
+
+
+def test_full_text_search(client):
+    table_name = "articles"
+    titles = [
+        "New York pizza guide",
+        "Pizza dough recipes",
+        "York and the new museum",
+        "Autumn walks in New York",
+    ]
+    for i, title in enumerate(titles):
+        client.post("/document/create", json={"table_name": table_name, "name": f"a_{i}", "body": {"title": title}})
+
+    resp = client.post(f"/table/{table_name}/index/create", json={"field": "title", "index_type": "text"})
+    assert resp.status_code == 200
+
+    hits = client.post("/document/search", json={"table_name": table_name, "query": "pizza"}).json()
+    assert {h["document"]["name"] for h in hits} == {"a_0", "a_1"}
+    assert hits[0]["score"] >= hits[1]["score"] > 0
+
+    hits = client.post("/document/search", json={"table_name": table_name, "query": '"new york"'}).json()
+    assert sorted(h["document"]["name"] for h in hits) == ["a_0", "a_3"]
+
+    hits = client.post("/document/search", json={"table_name": table_name, "query": "autu* museum", "limit": 1}).json()
+    assert len(hits) == 1
+
+    client.post("/document/create", json={"table_name": table_name, "name": "a_4", "body": {"title": "Pizza pizza pizza"}})
+    hits = client.post("/document/search", json={"table_name": table_name, "query": "pizza"}).json()
+    assert hits[0]["document"]["name"] == "a_4"
+
+    bad = client.post("/document/search", json={"table_name": "no_text_here", "query": "pizza"})
+    assert bad.status_code == 400
+
+
+def test_prefix_operator_for_autocomplete(client):
+    table_name = "autocomplete_users"
+    for name in ["maria", "mark", "max", "bob", "marcus", "Mario"]:
+        client.post("/document/create", json={"table_name": table_name, "name": name, "body": {"username": name}})
+
+    # full scan without an index
+    response = client.post("/document/find", json={"username": {"$prefix": "mar"}},
+                           params={"table_name": table_name, "sort_by": "username"})
+    assert [d["body"]["username"] for d in response.json()] == ["marcus", "maria", "mark"]
+
+    client.post(f"/table/{table_name}/index/create", json={"field": "username", "index_type": "btree"})
+
+    response = client.post("/document/find", json={"username": {"$prefix": "mar"}},
+                           params={"table_name": table_name, "sort_by": "username", "limit": 2})
+    assert [d["body"]["username"] for d in response.json()] == ["marcus", "maria"]
+
+    response = client.post("/document/find", json={"username": {"$prefix": "ma"}},
+                           params={"table_name": table_name, "sort_by": "username", "offset": 1, "limit": 2})
+    assert [d["body"]["username"] for d in response.json()] == ["maria", "mark"]
+
+    bad = client.post("/document/find", json={"username": {"$prefix": 1}}, params={"table_name": table_name})
+    assert bad.status_code == 400
+
+
+def test_partial_index(client):
+    table_name = "partial_tickets"
+    client.post("/table/create", json={"name": table_name})
+    for i in range(8):
+        client.post("/document/create", json={
+            "table_name": table_name,
+            "name": f"t_{i}",
+            "body": {"status": "open" if i < 3 else "closed", "priority": i % 4}
+        })
+
+    resp = client.post(f"/table/{table_name}/index/create", json={
+        "field": "priority", "index_type": "btree", "predicate": {"status": "open"}
+    })
+    assert resp.status_code == 200
+    assert resp.json()["predicate"] == {"status": "open"}
+
+    stats = client.get(f"/table/{table_name}/indexes").json()["indexes"][0]
+    assert stats["total_entries"] == 3
+    assert stats["predicate"] == {"status": "open"}
+
+    response = client.post("/document/find", json={"status": "open", "priority": {"$gte": 1}},
+                           params={"table_name": table_name})
+    assert [d["name"] for d in response.json()] == ["t_1", "t_2"]
+
+    # the query doesn't imply the predicate: closed tickets must not be lost
+    response = client.post("/document/find", json={"priority": 3}, params={"table_name": table_name})
+    assert [d["name"] for d in response.json()] == ["t_3", "t_7"]
+
+    doc = client.post("/document/find", json={"status": "closed", "priority": 3},
+                      params={"table_name": table_name}).json()[0]
+    client.put(f"/document/update/{doc['_id']}", json={
+        "version": doc["version"], "body": {"status": "open", "priority": 3}
+    })
+    response = client.post("/document/find", json={"status": "open", "priority": 3},
+                           params={"table_name": table_name})
+    assert [d["name"] for d in response.json()] == ["t_3"]
+
+    table = client.get(f"/table/{table_name}").json()
+    assert table["index_predicates"] == {"priority": {"status": "open"}}
+
+
+def test_find_on_array_paths_with_multikey_index(client):
+    table_name = "multikey_orders"
+    client.post("/table/create", json={"name": table_name})
+    client.post(f"/table/{table_name}/index/create", json={"field": "items.sku", "index_type": "btree"})
+    client.post(f"/table/{table_name}/index/create", json={"field": "tags", "index_type": "btree"})
+
+    orders = [
+        {"items": [{"sku": "apple", "qty": 2}, {"sku": "pear", "qty": 1}], "tags": ["fruit", "gift"]},
+        {"items": [{"sku": "pear", "qty": 7}], "tags": ["fruit"]},
+        {"items": [{"sku": "bread", "qty": 1}], "tags": "bakery"},
+    ]
+    for i, body in enumerate(orders):
+        client.post("/document/create", json={"table_name": table_name, "name": f"o_{i}", "body": body})
+
+    def names(filter_body, **params):
+        resp = client.post("/document/find", json=filter_body, params={"table_name": table_name, **params})
+        assert resp.status_code == 200
+        return [d["name"] for d in resp.json()]
+
+    assert names({"items.sku": "pear"}) == ["o_0", "o_1"]
+    assert names({"items.sku": {"$in": ["apple", "bread"]}}) == ["o_0", "o_2"]
+    assert names({"items.qty": {"$gte": 5}}) == ["o_1"]
+    assert names({"tags": "fruit", "items.sku": {"$ne": "apple"}}) == ["o_1"]
+    assert names({"tags": {"$gte": "a"}}, sort_by="tags") == ["o_2", "o_0", "o_1"]
+
+    doc = client.post("/document/find", json={"items.sku": "apple"}, params={"table_name": table_name}).json()[0]
+    client.put(f"/document/update/{doc['_id']}", json={
+        "version": doc["version"], "body": {"items": [{"sku": "plum", "qty": 2}], "tags": []}
+    })
+    assert names({"items.sku": "pear"}) == ["o_1"]
+    assert names({"items.sku": "plum"}) == ["o_0"]
+
+
+def test_find_with_projection_and_covered_query(client, capsys):
+    table_name = "projected_users"
+    for i in range(6):
+        client.post("/document/create", json={
+            "table_name": table_name,
+            "name": f"u_{i}",
+            "body": {"city": "Kyiv" if i % 2 else "Lviv", "age": 20 + i, "profile": {"bio": "x" * 50}}
+        })
+
+    resp = client.post("/document/find", json={"city": "Kyiv"},
+                       params={"table_name": table_name, "fields": "age,profile.bio"})
+    assert resp.status_code == 200
+    rows = resp.json()
+    assert [r["age"] for r in rows] == [21, 23, 25]
+    assert set(rows[0]) == {"age", "profile.bio"}
+
+    client.post(f"/table/{table_name}/index/create", json={"fields": ["city", "age"], "index_type": "btree"})
+    capsys.readouterr()
+
+    resp = client.post("/document/find", json={"city": "Lviv", "age": {"$gte": 21}}, params={
+        "table_name": table_name, "fields": "_id,age", "sort_by": "age", "order": "desc", "limit": 2
+    })
+    rows = resp.json()
+    assert [r["age"] for r in rows] == [24, 22]
+    assert set(rows[0]) == {"_id", "age"}
+    assert "Covered query" in capsys.readouterr().out
+
+    full = client.get(f"/document/get/{rows[0]['_id']}").json()
+    assert full["body"]["age"] == 24
+
+
+def test_count_distinct_and_exists(client, capsys):
+    table_name = "facet_products"
+    colors = ["red", "blue", "red", "green", "red", "blue"]
+    for i, color in enumerate(colors):
+        client.post("/document/create", json={
+            "table_name": table_name,
+            "name": f"p_{i}",
+            "body": {"color": color, "price": i * 10, "tags": ["sale"] if i % 2 else ["new", "sale"]}
+        })
+
+    def post(path, filter_body, **params):
+        resp = client.post(path, json=filter_body, params={"table_name": table_name, **params})
+        assert resp.status_code == 200
+        return resp.json()
+
+    # without indexes: streaming
+    assert post("/document/count", {"color": "red"})["count"] == 3
+    assert post("/document/exists", {"color": "purple"})["exists"] is False
+    assert post("/document/distinct", {}, field="tags")["values"] == [
+        {"value": "sale", "count": 6}, {"value": "new", "count": 3}
+    ]
+
+    client.post(f"/table/{table_name}/index/create", json={"field": "color", "index_type": "hash"})
+    client.post(f"/table/{table_name}/index/create", json={"field": "price", "index_type": "btree"})
+    capsys.readouterr()
+
+    assert post("/document/count", {"color": "red"})["count"] == 3
+    assert post("/document/count", {"price": {"$gte": 20, "$lt": 50}})["count"] == 3
+    assert post("/document/count", {"color": "blue", "price": {"$gt": 10}})["count"] == 1
+    assert post("/document/exists", {"color": "green"})["exists"] is True
+    assert post("/document/distinct", {"price": {"$gte": 20}}, field="color")["values"] == [
+        {"value": "red", "count": 2}, {"value": "blue", "count": 1}, {"value": "green", "count": 1}
+    ]
+    assert "from index" in capsys.readouterr().out
+
+    doc = client.post("/document/find", json={"color": "green"}, params={"table_name": table_name}).json()[0]
+    client.put(f"/document/archive/{doc['_id']}")
+    assert post("/document/count", {"color": "green"})["count"] == 0
+    assert post("/document/count", {"color": "green"}, include_archived=True)["count"] == 1
+
+
+def test_aggregate_pipeline(client, capsys):
+    table_name = "agg_sales"
+    sales = [
+        ("Kyiv", "phone", 100), ("Kyiv", "phone", 300), ("Kyiv", "laptop", 1000),
+        ("Lviv", "phone", 200), ("Lviv", "laptop", 800), ("Odesa", "tablet", None),
+    ]
+    for i, (city, product, amount) in enumerate(sales):
+        body = {"city": city, "product": product}
+        if amount is not None:
+            body["amount"] = amount
+        client.post("/document/create", json={"table_name": table_name, "name": f"s_{i}", "body": body})
+
+    resp = client.post("/aggregate", json={
+        "table_name": table_name,
+        "match": {"product": {"$ne": "tablet"}},
+        "group_by": ["city"],
+        "accumulators": {
+            "n": {"op": "count"},
+            "total": {"op": "sum", "field": "amount"},
+            "avg": {"op": "avg", "field": "amount"},
+            "cheapest": {"op": "min", "field": "amount"}
+        },
+        "sort_by": "total",
+        "order": "desc"
+    })
+    assert resp.status_code == 200
+    assert resp.json()["results"] == [
+        {"city": "Kyiv", "n": 3, "total": 1400, "avg": 1400 / 3, "cheapest": 100},
+        {"city": "Lviv", "n": 2, "total": 1000, "avg": 500, "cheapest": 200},
+    ]
+
+    resp = client.post("/aggregate", json={
+        "table_name": table_name,
+        "group_by": ["city", "product"],
+        "sort_by": "count",
+        "order": "desc",
+        "limit": 1
+    })
+    assert resp.json()["results"] == [{"city": "Kyiv", "product": "phone", "count": 2}]
+
+    client.post(f"/table/{table_name}/index/create", json={"field": "amount", "index_type": "btree"})
+    capsys.readouterr()
+    resp = client.post("/aggregate", json={
+        "table_name": table_name,
+        "accumulators": {"lo": {"op": "min", "field": "amount"}, "hi": {"op": "max", "field": "amount"}}
+    })
+    assert resp.json()["results"] == [{"lo": 100, "hi": 1000}]
+    assert "answered from indexes" in capsys.readouterr().out
+
+    bad = client.post("/aggregate", json={"table_name": table_name, "accumulators": {"x": {"op": "sum"}}})
+    assert bad.status_code == 400
+
+
+def test_column_index_serves_find_and_aggregate(client, capsys):
+    table_name = "metrics_columnar"
+    for i in range(40):
+        client.post("/document/create", json={
+            "table_name": table_name, "name": f"m_{i}", "body": {"host": f"h{i % 4}", "cpu": i * 2.5}
+        })
+
+    resp = client.post(f"/table/{table_name}/index/create", json={"field": "cpu", "index_type": "column"})
+    assert resp.status_code == 200
+    capsys.readouterr()
+
+    response = client.post("/document/find", json={"cpu": {"$gte": 90}}, params={
+        "table_name": table_name, "sort_by": "cpu", "order": "desc", "limit": 3
+    })
+    assert [d["body"]["cpu"] for d in response.json()] == [97.5, 95.0, 92.5]
+
+    resp = client.post("/aggregate", json={
+        "table_name": table_name,
+        "match": {"cpu": {"$lt": 10}},
+        "accumulators": {"avg": {"op": "avg", "field": "cpu"}, "hi": {"op": "max", "field": "cpu"}}
+    })
+    assert resp.json()["results"] == [{"avg": 3.75, "hi": 7.5}]
+    assert "answered from indexes" in capsys.readouterr().out
+
+    indexes = client.get(f"/table/{table_name}/indexes").json()["indexes"]
+    assert indexes[0]["type"] == "column" and indexes[0]["total_entries"] == 40
+
+
+def test_vector_search_endpoint(client):
+    table_name = "vector_docs"
+    client.post("/table/create", json={"name": table_name})
+    resp = client.post(f"/table/{table_name}/index/create", json={"field": "embedding", "index_type": "vector"})
+    assert resp.status_code == 200
+
+    points = {"east": [1.0, 0.0], "north": [0.0, 1.0], "north_east": [0.7, 0.7], "west": [-1.0, 0.0]}
+    for name, vector in points.items():
+        client.post("/document/create", json={"table_name": table_name, "name": name, "body": {"embedding": vector}})
+
+    hits = client.post("/document/vector_search", json={
+        "table_name": table_name, "field": "embedding", "vector": [0.9, 0.1], "k": 2
+    }).json()
+    assert [h["document"]["name"] for h in hits] == ["east", "north_east"]
+    assert hits[0]["score"] > hits[1]["score"]
+
+    hits = client.post("/document/vector_search", json={
+        "table_name": table_name, "field": "embedding", "vector": [-2.0, 0.0], "k": 1, "metric": "l2"
+    }).json()
+    assert hits[0]["document"]["name"] == "west" and hits[0]["score"] == 1.0
+
+    bad = client.post("/document/vector_search", json={
+        "table_name": table_name, "field": "missing", "vector": [1.0, 0.0]
+    })
+    assert bad.status_code == 400
+
+
+def test_vector_search_timeout_stops_the_scoring(client, monkeypatch):
+    import time
+    from core.indexes import VectorIndex
+
+    table_name = "vector_deadline_docs"
+    client.post("/table/create", json={"name": table_name})
+    client.post(f"/table/{table_name}/index/create", json={"field": "embedding", "index_type": "vector"})
+    client.post("/document/create", json={"table_name": table_name, "name": "p", "body": {"embedding": [1.0, 0.0]}})
+
+    tokens = []
+    real_search = VectorIndex.search
+
+    def slow_search(self, vector, k=10, metric="cosine", nprobe=None, token=None):
+        tokens.append(token)
+        give_up = time.monotonic() + 2
+        while not token.cancelled and time.monotonic() < give_up:
+            time.sleep(0.005)
+        return real_search(self, vector, k, metric, nprobe, token)
+
+    monkeypatch.setattr(VectorIndex, "search", slow_search)
+    resp = client.post("/document/vector_search", json={
+        "table_name": table_name, "field": "embedding", "vector": [1.0, 0.0], "timeout_ms": 20
+    })
+    assert resp.status_code == 504
+    assert tokens[0].cancelled
+
+    monkeypatch.setattr(VectorIndex, "search", real_search)
+    resp = client.post("/document/vector_search", json={
+        "table_name": table_name, "field": "embedding", "vector": [1.0, 0.0], "timeout_ms": 5000
+    })
+    assert [h["document"]["name"] for h in resp.json()] == ["p"]
+
+
+def test_geo_index_near_and_within_box(client):
+    table_name = "geo_couriers"
+    places = {
+        "maidan": (50.4501, 30.5234),
+        "podil": (50.4660, 30.5160),
+        "obolon": (50.5000, 30.4980),
+        "lviv": (49.8397, 24.0297),
+    }
+    for name, (lat, lon) in places.items():
+        client.post("/document/create", json={
+            "table_name": table_name, "name": name, "body": {"location": {"lat": lat, "lon": lon}}
+        })
+
+    def names(filter_body, **params):
+        resp = client.post("/document/find", json=filter_body, params={"table_name": table_name, **params})
+        assert resp.status_code == 200
+        return [d["name"] for d in resp.json()]
+
+    near = {"location": {"$near": {"lat": 50.4505, "lon": 30.5240, "max_distance_m": 3000}}}
+    box = {"location": {"$within_box": {"min_lat": 50.44, "min_lon": 30.49, "max_lat": 50.47, "max_lon": 30.53}}}
+
+    # scan and index must agree, both nearest first
+    assert names(near) == ["maidan", "podil"]
+    assert names(box) == ["maidan", "podil"]
+
+    resp = client.post(f"/table/{table_name}/index/create", json={"field": "location", "index_type": "geo"})
+    assert resp.status_code == 200
+
+    assert names(near) == ["maidan", "podil"]
+    assert names(near, limit=1) == ["maidan"]
+    assert names(box) == ["maidan", "podil"]
+    assert names({"location": {"$near": {"lat": 50.45, "lon": 30.52, "max_distance_m": 600000}}}) == [
+        "maidan", "podil", "obolon", "lviv"
+    ]
+
+    bad = client.post("/document/find", json={"location": {"$near": {"lat": 50}}}, params={"table_name": table_name})
+    assert bad.status_code == 400
+
+
+def test_document_responses_match_response_model_encoding(client):
+    import json
+    import uuid
+    from fastapi.encoders import jsonable_encoder
+    from core import records, state
+
+    table_name = "serialization_table"
+    client.post("/table/create", json={"name": table_name})
+    created = client.post("/document/create", json={
+        "table_name": table_name,
+        "name": "unicode",
+        "body": {"city": "Київ", "score": 97.5, "tags": ["a", "b"], "nested": {"ok": True, "none": None}}
+    })
+    assert created.status_code == 200
+    assert created.headers["content-type"] == "application/json"
+
+    doc = state.db_index_by_id[uuid.UUID(created.json()["_id"])]
+    # what FastAPI's response_model path would have rendered
+    expected = json.dumps(jsonable_encoder(records.to_model(doc), by_alias=True), ensure_ascii=False,
+                          separators=(",", ":")).encode("utf-8")
+
+    fetched = client.get(f"/document/get/{doc.id}")
+    assert fetched.content == expected
+
+    found = client.post("/document/find", json={}, params={"table_name": table_name})
+    assert found.content == b"[" + expected + b"]"
+
+    projected = client.post("/document/find", json={}, params={"table_name": table_name, "fields": "_id,city"})
+    assert projected.json() == [{"_id": str(doc.id), "city": "Київ"}]
+
+
+def test_document_float_rendering_is_pinned(client):
+    import json
+
+    created = client.post("/document/create", json={
+        "table_name": TEST_TABLE, "name": "floats", "body": {"big": 1e16, "small": 1e-7, "plain": 0.1}
+    })
+    fetched = client.get(f"/document/get/{created.json()['_id']}")
+    # pydantic-core's float format, not json.dumps' (1e+16, 1e-07): the
+    # bytes feed ETags and the document cache, so a change here is visible
+    assert b'"body":{"big":1e16,"small":1e-7,"plain":0.1}' in fetched.content
+    assert fetched.content == created.content
+    assert json.loads(fetched.content)["body"] == {"big": 1e16, "small": 1e-7, "plain": 0.1}
+
+
+def test_combined_documents_render_as_the_response_model(client):
+    import json
+    import uuid
+    from fastapi.encoders import jsonable_encoder
+    from core import state
+    from models.document_types.document import StandardDocument
+
+    ids = [client.post("/document/create", json={
+        "table_name": TEST_TABLE, "name": f"part{i}", "body": {"combined_marker": "yes", f"k{i}": i}
+    }).json()["_id"] for i in range(2)]
+    combined = client.post("/document/combine", json={"name": "both", "document_ids": ids})
+    assert combined.status_code == 200
+    assert [str(i) for i in combined.json()["document_ids"]] == ids
+
+    doc = state.db_index_by_id[uuid.UUID(combined.json()["_id"])]
+    # what response_model=List[StandardDocument] rendered before
+    as_standard = StandardDocument.model_validate(doc.model_dump(by_alias=True))
+    expected = json.dumps(jsonable_encoder(as_standard, by_alias=True), ensure_ascii=False,
+                          separators=(",", ":")).encode("utf-8")
+
+    found = client.post("/document/find", json={"combined_marker": "yes", "k0": 0, "k1": 1})
+    assert found.content == b"[" + expected + b"]"
+    assert found.json()[0]["table_data"] == {}
+    assert "document_ids" not in found.json()[0]
+
+
+def test_get_serves_cached_bytes_until_update(client):
+    from core.serialization import document_cache, CACHE_HITS
+
+    created = client.post("/document/create", json={
+        "table_name": TEST_TABLE, "name": "hot", "body": {"views": 1}
+    }).json()
+    doc_id = created["_id"]
+
+    first = client.get(f"/document/get/{doc_id}")
+    hits = CACHE_HITS._value.get()
+    second = client.get(f"/document/get/{doc_id}")
+    assert second.content == first.content
+    assert CACHE_HITS._value.get() == hits + 1
+
+    client.put(f"/document/update/{doc_id}", json={"version": 1, "body": {"views": 2}})
+    updated = client.get(f"/document/get/{doc_id}").json()
+    assert updated["version"] == 2
+    assert updated["body"] == {"views": 2}
+
+    client.put(f"/document/archive/{doc_id}")
+    assert client.get(f"/document/get/{doc_id}").status_code == 404
+    assert all(str(key[0]) != doc_id for key in document_cache._entries)
+
+
+def test_conditional_get_with_etags(client):
+    table_name = "etag_table"
+    client.post("/table/create", json={"name": table_name})
+    doc = client.post("/document/create", json={
+        "table_name": table_name, "name": "polled", "body": {"state": "new"}
+    }).json()
+
+    first = client.get(f"/document/get/{doc['_id']}")
+    etag = first.headers["etag"]
+    not_modified = client.get(f"/document/get/{doc['_id']}", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+    table_first = client.get(f"/table/{table_name}/documents")
+    table_etag = table_first.headers["etag"]
+    assert client.get(f"/table/{table_name}/documents",
+                      headers={"If-None-Match": f'"other", {table_etag}'}).status_code == 304
+
+    client.put(f"/document/update/{doc['_id']}", json={"version": 1, "body": {"state": "done"}})
+
+    changed = client.get(f"/document/get/{doc['_id']}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["body"] == {"state": "done"}
+
+    table_changed = client.get(f"/table/{table_name}/documents", headers={"If-None-Match": table_etag})
+    assert table_changed.status_code == 200
+    assert table_changed.headers["etag"] != table_etag
+
+
+def test_find_result_cache_invalidated_by_writes(client, capsys):
+    table_name = "query_cache_table"
+    client.post("/table/create", json={"name": table_name})
+    for i in range(3):
+        client.post("/document/create", json={
+            "table_name": table_name, "name": f"row{i}", "body": {"kind": "a", "n": i}
+        })
+
+    def find(filter_body):
+        resp = client.post("/document/find", json=filter_body,
+                           params={"table_name": table_name, "cache": "true", "sort_by": "n"})
+        assert resp.status_code == 200
+        return [d["body"]["n"] for d in resp.json()]
+
+    capsys.readouterr()
+    assert find({"kind": "a", "n": {"$gte": 0}}) == [0, 1, 2]
+    assert "query cache" not in capsys.readouterr().out
+    # same filter, different key order: one entry
+    assert find({"n": {"$gte": 0}, "kind": "a"}) == [0, 1, 2]
+    assert "✅ Served from query cache: 3 documents" in capsys.readouterr().out
+
+    client.post("/document/create", json={
+        "table_name": table_name, "name": "row3", "body": {"kind": "a", "n": 3}
+    })
+    assert find({"kind": "a"}) == [0, 1, 2, 3]
+    assert "query cache" not in capsys.readouterr().out
+    assert find({"kind": "a"}) == [0, 1, 2, 3]
+    assert "query cache" in capsys.readouterr().out
+
+
+def test_body_hash_is_lazy_and_verifiable(client):
+    import uuid
+    from core import state
+
+    table_name = "hash_table"
+    client.post("/table/create", json={"name": table_name})
+    created = client.post("/document/create", json={
+        "table_name": table_name, "name": "hashed", "body": {"payload": "x" * 100}
+    })
+    # responses always carry the hash
+    assert len(created.json()["body_hash"]) == 64
+
+    updated = client.put(f"/document/update/{created.json()['_id']}", json={"version": 1, "body": {"payload": "y"}})
+    doc = state.db_index_by_id[uuid.UUID(created.json()["_id"])]
+    assert updated.json()["body_hash"] == doc.body_hash != created.json()["body_hash"]
+
+    report = client.post("/system/verify-hashes", params={"table_name": table_name}).json()
+    assert report["mismatched"] == []
+    assert report["checked"] >= 1
+
+    doc.body["payload"] = "tampered"
+    report = client.post("/system/verify-hashes", params={"table_name": table_name}).json()
+    assert report["mismatched"] == [str(doc.id)]
+
+    assert client.post("/system/verify-hashes", params={"table_name": "no_such_table"}).status_code == 404
+
+
+def test_body_digest_algorithms():
+    from models.document_types.document import StandardDocument
+    from models.document_types.body_hash import body_digest, matches_body
+
+    doc = StandardDocument(name="lazy", body={"a": 1})
+    assert doc.body_hash is None
+    assert doc.get_body_hash() == body_digest({"a": 1}, "sha256")
+
+    for algorithm in ("blake2b", "crc32"):
+        digest = body_digest({"a": 1}, algorithm)
+        assert digest.startswith(f"{algorithm}:")
+        assert matches_body({"a": 1}, digest)
+        assert not matches_body({"a": 2}, digest)
+
+    with pytest.raises(ValueError):
+        body_digest({"a": 1}, "md5")
+
+
+def test_document_record_round_trip():
+    from datetime import timezone
+    from core.records import DocumentRecord
+    from models.document_types.document import StandardDocument
+
+    doc = StandardDocument(name="compact", body={"a": [1, 2]}, table_data={"id": "t1", "name": "records"})
+    record = DocumentRecord.from_document(doc)
+    twin = DocumentRecord.from_document(doc.model_copy())
+
+    assert record.to_document().model_dump_json(by_alias=True) == doc.model_dump_json(by_alias=True)
+    assert record.created_at == doc.created_at and record.created_at.tzinfo == timezone.utc
+    # one table_data dict per table, not per document
+    assert record.table_data is twin.table_data
+
+    archived = record.model_copy(update={"version": 2, "archived_at": doc.created_at, "updated_at": doc.created_at})
+    assert archived.is_archived() and not record.is_archived()
+    assert archived.version == 2 and archived.body is record.body
+
+
+def test_encoded_body_table(client):
+    import uuid
+    from core import records, state
+
+    table_name = "cold_table"
+    resp = client.post("/table/create", json={
+        "name": table_name, "unique_fields": ["sku"], "body_encoding": "json+zlib"
+    })
+    assert resp.status_code == 200
+    client.post(f"/table/{table_name}/index/create", json={"field": "status", "index_type": "hash"})
+
+    body = {"sku": "A-1", "status": "active", "notes": "x" * 500, "nested": {"k": [1, 2]}}
+    created = client.post("/document/create", json={"table_name": table_name, "name": "cold", "body": body}).json()
+    assert created["body"] == body
+
+    record = state.db_index_by_id[uuid.UUID(created["_id"])]
+    assert isinstance(record, records.EncodedDocumentRecord)
+    assert record.index_body == {"sku": "A-1", "status": "active"}
+    assert record.encoded_size() < len(body["notes"])
+
+    dup = client.post("/document/create", json={"table_name": table_name, "name": "dup", "body": {"sku": "A-1"}})
+    assert dup.status_code == 400
+
+    def find(filter_body):
+        return client.post("/document/find", json=filter_body, params={"table_name": table_name}).json()
+
+    assert [d["body"] for d in find({"status": "active"})] == [body]
+
+    client.put(f"/document/update/{created['_id']}", json={"version": 1, "body": {**body, "status": "done"}})
+    assert find({"status": "active"}) == []
+    assert len(find({"status": "done"})) == 1
+
+    # an index added later re-extracts the stored index bodies
+    client.post(f"/table/{table_name}/index/create", json={"field": "nested.k", "index_type": "btree"})
+    record = state.db_index_by_id[uuid.UUID(created["_id"])]
+    assert set(record.index_body) == {"sku", "status", "nested"}
+    assert len(find({"nested.k": 2})) == 1
+
+    client.put(f"/document/archive/{created['_id']}")
+    assert find({"status": "done"}) == []
+
+
+def test_body_interning_and_memory_report(client):
+    import uuid
+    from core import state
+
+    table_name = "interned_table"
+    client.post("/table/create", json={"name": table_name})
+    ids = []
+    for i in range(3):
+        doc = client.post("/document/create", json={
+            "table_name": table_name, "name": f"u{i}", "body": {"status": "active", "profile": {"tier": "gold"}}
+        }).json()
+        ids.append(uuid.UUID(doc["_id"]))
+
+    first, second = (state.db_index_by_id[i].body for i in ids[:2])
+    assert first["status"] is second["status"]
+    assert first["profile"]["tier"] is second["profile"]["tier"]
+    assert next(iter(first)) is next(iter(second))
+
+    client.put(f"/document/update/{ids[2]}", json={"version": 1, "body": {"status": "active"}})
+    assert state.db_index_by_id[ids[2]].body["status"] is first["status"]
+
+    report = client.get(f"/table/{table_name}/memory").json()
+    assert report["documents"] == 3
+    assert report["body_bytes"] > 0
+    assert report["value_dictionary"]["entries"] == 2
+    assert report["value_dictionary"]["hits"] >= 5
+
+    assert client.get("/table/no_such_table/memory").status_code == 404
+
+
+def test_value_dictionary_stops_interning_unique_values(client, monkeypatch):
+    from core import interning, state
+
+    monkeypatch.setattr(interning, "VALUE_DICT_SAMPLE_SIZE", 10)
+    dictionary = interning.ValueDictionary()
+    bodies = [interning.intern_body({"status": "active", "email": f"u{i}@example.com"}, dictionary)
+              for i in range(30)]
+
+    assert dictionary.skipped_fields == {"email"}
+    assert dictionary.enabled
+    assert bodies[-1]["status"] is bodies[0]["status"]
+    # only the first window of emails went into the dictionary
+    assert len(dictionary) == 1 + 10
+
+    unique = interning.ValueDictionary()
+    for i in range(10):
+        interning.intern_body({"a": f"a{i}", "b": f"b{i}"}, unique)
+    assert not unique.enabled and unique.stats()["enabled"] is False
+    interning.intern_body({"a": "a1"}, unique)
+    assert (unique.hits, unique.misses) == (0, 10)
+
+    table_name = "dropped_interned_table"
+    client.post("/table/create", json={"name": table_name})
+    client.post("/document/create", json={"table_name": table_name, "name": "d", "body": {"status": "x"}})
+    assert table_name in state.db_value_dictionaries and table_name in state.db_table_shards
+    assert client.delete(f"/table/{table_name}").status_code == 200
+    assert table_name not in state.db_value_dictionaries
+    assert table_name not in state.db_table_shards
+
+
+def test_legacy_snapshot_bodies_are_interned(client):
+    import json
+    import uuid
+    from core import replica, state
+    from core.constants.main_values import STORAGE_FILE
+
+    ids = [str(uuid.uuid4()) for _ in range(2)]
+    with open(STORAGE_FILE, "w", encoding="utf-8") as f:
+        json.dump([{"_id": doc_id, "name": f"old{i}", "table_data": {"name": "legacy_table"},
+                    "body": {"status": "active"}} for i, doc_id in enumerate(ids)], f)
+
+    replica.full_reload()
+    first, second = (state.db_index_by_id[uuid.UUID(doc_id)].body for doc_id in ids)
+    assert first == {"status": "active"}
+    assert first["status"] is second["status"]
+    assert state.db_value_dictionaries["legacy_table"].hits == 1
+
+
+def test_batch_create(client):
+    resp = client.post("/document/batch/create", json=[
+        {"table_name": TEST_TABLE, "name": "batch_a", "body": {"n": 1}},
+        {"table_name": TEST_TABLE, "name": "batch_b", "body": {"n": 2}}
+    ])
+    assert resp.status_code == 200
+    created = resp.json()
+    assert [d["name"] for d in created] == ["batch_a", "batch_b"]
+    assert created[0]["table_data"]["name"] == TEST_TABLE
+    assert len(created[0]["body_hash"]) == 64
+
+    fetched = client.get(f"/document/get/{created[1]['_id']}").json()
+    assert fetched == created[1]
@@ -1,5 +1,10 @@
 ﻿import pytest
+import uuid
+from array import array
 from core.constants.main_values import STORAGE_FILE, WAL_FILE
+from core.indexes import IndexManager, intersect_postings, union_postings
+from core.bitmaps import RoaringBitmap
+from core.query import filter_implies
 import os
 
 
@@ -49,6 +54,71 @@ def test_full_index_lifecycle(client):
     assert len(search_resp_scan.json()) == 1
 
 
+def test_queries_ignore_an_index_until_its_build_finishes(client, monkeypatch):
+    from core import repository, scheduling
+
+    table_name = "building_index_table"
+    client.post("/table/create", json={"name": table_name})
+    for i in range(6):
+        client.post("/document/create", json={"table_name": table_name, "name": f"b{i}", "body": {"kind": "a"}})
+
+    real_cooperative = scheduling.cooperative
+    builds, mid_build = [], []
+
+    async def probing_cooperative(items, *args, **kwargs):
+        # the first loop is the index build; query halfway through it
+        probing = not builds
+        builds.append(True)
+        for i, item in enumerate(items):
+            if probing and i == 3:
+                mid_build.append(await repository.count_documents({"kind": "a"}, table_name))
+                mid_build.append(len(await repository.find_documents({"kind": "a"}, table_name)))
+            yield item
+
+    monkeypatch.setattr(scheduling, "cooperative", probing_cooperative)
+    resp = client.post(f"/table/{table_name}/index/create", json={"field": "kind", "index_type": "hash"})
+    monkeypatch.setattr(scheduling, "cooperative", real_cooperative)
+    assert resp.status_code == 200
+    assert mid_build == [6, 6]
+
+    # published once complete
+    rows, used = repository._get_or_create_index_manager(table_name).plan({"kind": "a"})
+    assert used == ["kind"] and len(rows) == 6
+
+
+def test_null_operands_match_missing_fields_with_and_without_indexes(client):
+    filters = [
+        {"f": {"$in": [None, "x"]}},
+        {"f": {"$eq": None}},
+        {"f": None},
+        {"f": {"$ne": None}},
+        {"f": {"$nin": [None, "y"]}},
+    ]
+
+    def results(table_name):
+        out = []
+        for filter_body in filters:
+            found = client.post("/document/find", json=filter_body, params={"table_name": table_name}).json()
+            count = client.post("/document/count", json=filter_body, params={"table_name": table_name}).json()
+            out.append((sorted(d["name"] for d in found), count))
+        return out
+
+    def fill(table_name):
+        client.post("/table/create", json={"name": table_name})
+        for name, body in (("x", {"f": "x"}), ("y", {"f": "y"}), ("missing", {"g": 1})):
+            client.post("/document/create", json={"table_name": table_name, "name": name, "body": body})
+
+    fill("null_scan_table")
+    scanned = results("null_scan_table")
+    assert scanned[0][0] == ["missing", "x"]
+
+    for index_type in ("hash", "btree", "bitmap"):
+        table_name = f"null_{index_type}_table"
+        fill(table_name)
+        client.post(f"/table/{table_name}/index/create", json={"field": "f", "index_type": index_type})
+        assert results(table_name) == scanned, index_type
+
+
 def test_archive_removes_from_index(client):
     table_name = "archive_test"
     client.post("/table/create", json={"name": table_name})
@@ -78,4 +148,270 @@ def test_delete_table_cleans_indexes(client):
     client.delete(f"/table/{table_name}")
 
     resp = client.get(f"/table/{table_name}/indexes")
-    assert resp.status_code == 404
\ No newline at end of file
+    assert resp.status_code == 404
+
+
+def test_postings_are_dense_sorted_ints():
+    manager = IndexManager()
+    manager.create_index("status", "hash")
+    ids = [uuid.uuid4() for _ in range(5)]
+
+    for i, doc_id in enumerate(ids):
+        manager.add_document(doc_id, {"status": "open" if i % 2 == 0 else "closed"})
+
+    postings = manager.query_rows("status", value="open")
+    assert postings.typecode == "I"
+    assert list(postings) == [0, 2, 4]
+    assert manager.query("status", value="open") == {ids[0], ids[2], ids[4]}
+
+    manager.update_document(ids[0], {"status": "open"}, {"status": "closed"})
+    assert list(manager.query_rows("status", value="closed")) == [0, 1, 3]
+
+
+def test_postings_intersection_and_union():
+    small = array("I", [3, 500, 9000])
+    large = array("I", range(0, 10000, 3))
+    assert list(intersect_postings(small, large)) == [3, 9000]
+    assert list(intersect_postings(array("I", [1, 2, 3]), array("I", [2, 3, 4]))) == [2, 3]
+    assert list(intersect_postings(array("I", [1]), array("I"))) == []
+    assert list(union_postings(array("I", [1, 5]), array("I", [2, 5]))) == [1, 2, 5]
+
+
+def test_roaring_bitmap_set_operations():
+    evens = RoaringBitmap(range(0, 200000, 2))
+    small = RoaringBitmap([1, 2, 3, 4, 70000, 150000])
+
+    assert len(evens) == 100000
+    assert list(evens & small) == [2, 4, 70000, 150000]
+    assert list(small - evens) == [1, 3]
+    assert len(evens | small) == 100002
+    assert 70000 in evens and 70001 not in evens
+
+    for value in range(0, 200000, 4):
+        evens.remove(value)
+    assert len(evens) == 50000
+    assert list(evens)[:3] == [2, 6, 10]
+
+
+def test_text_index_is_maintained_incrementally():
+    manager = IndexManager()
+    manager.create_index("title", "text")
+    ids = [uuid.uuid4() for _ in range(3)]
+
+    manager.add_document(ids[0], {"title": "Running shoes for trail running"})
+    manager.add_document(ids[1], {"title": "Leather shoes"})
+    manager.add_document(ids[2], {"title": "Trail map of the park"})
+
+    ranked = [manager.id_map.to_uuid(row) for row, _ in manager.search_rows("title", "run shoes")]
+    assert ranked == [ids[0], ids[1]]
+
+    manager.update_document(ids[1], {"title": "Leather shoes"}, {"title": "Leather boots"})
+    assert [row for row, _ in manager.search_rows("title", "shoes")] == [manager.id_map.get(ids[0])]
+
+    manager.remove_document(ids[0], {"title": "Running shoes for trail running"})
+    assert manager.search_rows("title", "shoes") == []
+    assert manager.get_index("title").stats()["indexed_documents"] == 2
+
+
+def test_text_index_build_racing_an_update():
+    manager = IndexManager()
+    doc_id = uuid.uuid4()
+    manager.create_index("title", "text")
+
+    # the build yields; a writer updates the document through the live index
+    manager.add_document(doc_id, {"title": "Leather shoes"})
+    manager.update_document(doc_id, {"title": "Leather shoes"}, {"title": "Leather boots"})
+    # the build then reaches the document and indexes its latest version
+    manager.index_document("title", doc_id, {"title": "Leather boots"})
+
+    index = manager.get_index("title")
+    assert manager.search_rows("title", "shoes") == []
+    assert [row for row, _ in manager.search_rows("title", "boots")] == [manager.id_map.get(doc_id)]
+    assert index._postings["boot"][manager.id_map.get(doc_id)].tolist() == [1]
+    assert index._total_length == 2
+
+    manager.remove_document(doc_id, {"title": "Leather boots"})
+    assert index._postings == {} and index._sorted_terms == []
+    assert index.stats()["indexed_documents"] == 0
+
+
+def test_btree_prefix_lookup_is_lexical_and_bounded():
+    manager = IndexManager()
+    manager.create_index("username", "btree")
+    names = ["bob", "alice", "alina", "al", "albert", "zed", "alz"]
+    ids = [uuid.uuid4() for _ in names]
+    for doc_id, name in zip(ids, names):
+        manager.add_document(doc_id, {"username": name})
+
+    def usernames(rows):
+        return [names[ids.index(manager.id_map.to_uuid(row))] for row in rows]
+
+    index = manager.get_index("username")
+    assert usernames(index.prefix_lookup("al", ordered=True)) == ["al", "albert", "alice", "alina", "alz"]
+    assert usernames(index.prefix_lookup("ali", ordered=True, limit=1)) == ["alice"]
+    assert usernames(index.prefix_lookup("al", ordered=True, reverse=True, limit=2)) == ["alz", "alina"]
+    assert len(index.prefix_lookup("x")) == 0
+    assert len(index.prefix_lookup("")) == len(names)
+
+
+def test_filter_implies_partial_index_predicate():
+    assert filter_implies({"status": "open", "x": 1}, {"status": "open"})
+    assert filter_implies({"status": {"$in": ["open", "new"]}}, {"status": {"$ne": "closed"}})
+    assert filter_implies({"age": {"$gt": 30, "$lt": 40}}, {"age": {"$gte": 18}})
+    assert not filter_implies({"age": {"$gte": 10}}, {"age": {"$gte": 18}})
+    assert not filter_implies({"status": {"$ne": "closed"}}, {"status": "open"})
+    assert not filter_implies({"x": 1}, {"status": "open"})
+    # an array can match "news" through one element and still hold "spam"
+    assert filter_implies({"tags": "news"}, {"tags": {"$ne": "spam"}})
+    assert not filter_implies({"tags": "news"}, {"tags": {"$ne": "spam"}}, {"tags"})
+    assert not filter_implies({"tags": {"$in": ["a", "b"]}}, {"tags": {"$nin": ["spam"]}}, {"tags"})
+    assert filter_implies({"tags": {"$ne": "spam"}}, {"tags": {"$ne": "spam"}}, {"tags"})
+
+
+def test_partial_index_with_negated_predicate_on_array_field(client):
+    table_name = "multikey_partial_table"
+    client.post("/table/create", json={"name": table_name})
+    client.post(f"/table/{table_name}/index/create", json={
+        "field": "tags", "index_type": "hash", "predicate": {"tags": {"$ne": "spam"}}
+    })
+    for name, tags in (("clean", ["news"]), ("mixed", ["news", "spam"]), ("scalar", "news")):
+        client.post("/document/create", json={"table_name": table_name, "name": name, "body": {"tags": tags}})
+
+    # "mixed" is left out of the partial index, yet matches the query
+    found = client.post("/document/find", json={"tags": "news"}, params={"table_name": table_name}).json()
+    assert sorted(d["name"] for d in found) == ["clean", "mixed", "scalar"]
+
+
+def test_covered_rows_reads_only_matching_keys(monkeypatch):
+    manager = IndexManager()
+    manager.create_index("status", "hash")
+    manager.create_index("age", "btree")
+    manager.create_index("city,age", "btree")
+    ids = [uuid.uuid4() for _ in range(6)]
+    for i, doc_id in enumerate(ids):
+        manager.add_document(doc_id, {"status": "on" if i % 2 else "off", "age": 20 + i,
+                                      "city": "Kyiv" if i < 3 else "Lviv"})
+    rows = [manager.id_map.get(doc_id) for doc_id in ids]
+
+    # equality is one key lookup: walking every entry would fail here
+    monkeypatch.setattr(manager.get_index("status"), "entries", None)
+    assert manager.covered_rows({"status": "on"}, ["status"]) == [(rows[i], {"status": "on"}) for i in (1, 3, 5)]
+    assert manager.covered_rows({"status": "gone"}, ["status"]) == []
+
+    assert manager.covered_rows({"age": 22}, ["age"]) == [(rows[2], {"age": 22})]
+    assert manager.covered_rows({"age": {"$gte": 24}}, ["age"]) == [(rows[4], {"age": 24}), (rows[5], {"age": 25})]
+
+    compound = manager.get_index("city,age")
+    assert [(key, list(found)) for key, found in compound.entries(("Lviv",), (None, True, 24, False))] == [
+        (("Lviv", 23), [rows[3]])]
+    assert manager.covered_rows({"city": "Lviv", "age": {"$lt": 24}}, ["city", "age"]) == [
+        (rows[3], {"city": "Lviv", "age": 23})]
+    assert manager.covered_rows({"city": "Kyiv", "age": 21}, ["age"]) == [(rows[1], {"city": "Kyiv", "age": 21})]
+
+
+def test_multikey_btree_over_array_of_objects():
+    manager = IndexManager()
+    manager.create_index("items.qty", "btree")
+    manager.create_index("items.sku", "hash")
+    order_a, order_b = uuid.uuid4(), uuid.uuid4()
+
+    manager.add_document(order_a, {"items": [{"sku": "A1", "qty": 5}, {"sku": "B2", "qty": 1}]})
+    manager.add_document(order_b, {"items": [{"sku": "B2", "qty": 3}, {"sku": "C3"}]})
+    row_a, row_b = manager.id_map.get(order_a), manager.id_map.get(order_b)
+
+    assert list(manager.query_rows("items.sku", value="B2")) == [row_a, row_b]
+    assert list(manager.query_rows("items.qty", min_val=2, max_val=4)) == [row_b]
+
+    qty = manager.get_index("items.qty")
+    assert list(qty.ordered_lookup()) == [row_a, row_b]
+
+    manager.update_document(order_a, {"items": [{"sku": "A1", "qty": 5}, {"sku": "B2", "qty": 1}]},
+                            {"items": [{"sku": "A1", "qty": 5}]})
+    assert list(manager.query_rows("items.sku", value="B2")) == [row_b]
+    assert qty.stats()["unique_values"] == 2
+
+
+def test_column_index_vectorized_filters_and_aggregates():
+    pytest.importorskip("numpy")
+    manager = IndexManager()
+    manager.create_index("latency", "column")
+    ids = [uuid.uuid4() for _ in range(3000)]
+    for i, doc_id in enumerate(ids):
+        manager.add_document(doc_id, {"latency": i % 100})
+    manager.add_document(uuid.uuid4(), {"latency": "n/a"})
+
+    column = manager.get_index("latency")
+    rows, used = manager.plan({"latency": {"$gte": 95, "$lt": 98}})
+    assert used == ["latency"] and len(rows) == 90
+    assert manager.count({"latency": {"$in": [1, 2]}}) == 60
+
+    ordered = manager.ordered_rows({"latency": {"$gt": 97}}, "latency", reverse=True, limit=3)
+    # the top 3 of 60 candidates (98s and 99s) are all 99s
+    assert len(ordered) == 3 and column.aggregate("min", ordered) == 99
+    assert column.aggregate("sum") == sum(i % 100 for i in range(3000))
+    assert column.aggregate("avg") == 49.5
+
+    manager.update_document(ids[99], {"latency": 99}, {"latency": 1000})
+    manager.remove_document(ids[0], {"latency": 0})
+    assert column.aggregate("max") == 1000
+    assert column.aggregate("count") == 2999
+
+    manager.add_document(uuid.uuid4(), {"latency": True})
+    assert manager.column_for("latency", {}) is None
+
+
+def test_column_index_recovers_and_refuses_inexact_ints():
+    pytest.importorskip("numpy")
+    manager = IndexManager()
+    manager.create_index("n", "column")
+    column = manager.get_index("n")
+    manager.add_document(uuid.uuid4(), {"n": 1})
+    flag_id, big_id = uuid.uuid4(), uuid.uuid4()
+
+    manager.add_document(flag_id, {"n": True})
+    manager.add_document(uuid.uuid4(), {"n": 2.5})
+    assert manager.column_for("n", {}) is None
+    manager.remove_document(flag_id, {"n": True})
+    assert manager.column_for("n", {}) is column
+    assert column.aggregate("sum") == 3.5
+
+    # 2**53 + 1 is stored as 2**53 in float64
+    manager.add_document(big_id, {"n": 2 ** 53 + 1})
+    manager.add_document(uuid.uuid4(), {"n": 2 ** 53})
+    assert manager.column_for("n", {}) is None
+    assert manager.exact_rows({"n": 2 ** 53}) is None
+    manager.remove_document(big_id, {"n": 2 ** 53 + 1})
+    assert manager.count({"n": 2 ** 53}) == 1
+    assert manager.exact_rows({"n": {"$in": [2 ** 53 + 1]}}) is None
+
+
+def test_vector_index_top_k_and_ivf(monkeypatch):
+    np = pytest.importorskip("numpy")
+    import core.indexes as indexes
+    monkeypatch.setattr(indexes, "VECTOR_IVF_MIN_ROWS", 100)
+
+    manager = IndexManager()
+    manager.create_index("embedding", "vector")
+    rng = np.random.default_rng(7)
+    vectors = rng.normal(size=(500, 8)).astype("float32")
+    ids = [uuid.uuid4() for _ in vectors]
+    for doc_id, vector in zip(ids, vectors):
+        manager.add_document(doc_id, {"embedding": vector.tolist()})
+
+    query = vectors[42].tolist()
+    for metric in ("cosine", "dot", "l2"):
+        hits = manager.vector_rows("embedding", query, k=5, metric=metric)
+        assert len(hits) == 5
+    nearest = manager.vector_rows("embedding", query, k=1, metric="l2")[0]
+    assert manager.id_map.to_uuid(nearest[0]) == ids[42] and nearest[1] < 1e-5
+
+    # approximate search still finds the exact match in its own cluster
+    approx = manager.vector_rows("embedding", query, k=3, metric="cosine", nprobe=2)
+    assert manager.id_map.to_uuid(approx[0][0]) == ids[42]
+
+    manager.remove_document(ids[42], {"embedding": query})
+    assert manager.id_map.to_uuid(manager.vector_rows("embedding", query, k=1)[0][0]) != ids[42]
+    assert manager.get_index("embedding").stats()["total_entries"] == 499
+
+    with pytest.raises(ValueError):
+        manager.vector_rows("embedding", [1.0, 2.0], k=1)
@@ -0,0 +1,51 @@
+from core import mvcc, repository, state
+
+
+async def test_snapshot_sees_point_in_time_state():
+    doc = await repository.create_document("snap", {"counter": 1}, "mvcc_table")
+
+    with mvcc.open_snapshot() as snapshot:
+        updated = await repository.update_document(doc.id, 1, {"counter": 2})
+        late = await repository.create_document("late", {"counter": 3}, "mvcc_table")
+
+        assert snapshot.get(doc.id).body == {"counter": 1}
+        assert snapshot.get(late.id) is None
+        assert updated.body == {"counter": 2}
+        assert doc.body == {"counter": 1}
+
+        visible = [d for d in snapshot.documents() if getattr(d, "table_data", {}).get("name") == "mvcc_table"]
+        assert [d.body["counter"] for d in visible] == [1]
+
+
+async def test_old_versions_released_after_readers_close():
+    doc = await repository.create_document("gc", {"v": 1}, "mvcc_gc_table")
+
+    snapshot = mvcc.open_snapshot()
+    await repository.update_document(doc.id, 1, {"v": 2})
+    assert doc.id in state.db_old_versions
+
+    snapshot.close()
+    assert doc.id not in state.db_old_versions
+
+    await repository.update_document(doc.id, 2, {"v": 3})
+    assert doc.id not in state.db_old_versions
+
+
+async def test_garbage_is_collected_only_when_the_oldest_reader_leaves(monkeypatch):
+    doc = await repository.create_document("gc_oldest", {"v": 1}, "mvcc_gc_oldest_table")
+    collections = []
+    collect = mvcc._collect_garbage
+    monkeypatch.setattr(mvcc, "_collect_garbage", lambda: collections.append(1) or collect())
+
+    oldest = mvcc.open_snapshot()
+    await repository.update_document(doc.id, 1, {"v": 2})
+    newer = mvcc.open_snapshot()
+    again = mvcc.open_snapshot()
+    await repository.update_document(doc.id, 2, {"v": 3})
+
+    newer.close()
+    again.close()
+    assert collections == [] and len(state.db_old_versions[doc.id]) == 2
+
+    oldest.close()
+    assert collections == [1] and doc.id not in state.db_old_versions
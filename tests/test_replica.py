@@ -0,0 +1,111 @@
+import os
+import json
+from datetime import datetime, timezone
+
+from core import replica, state, wal
+from core.constants.main_values import WAL_FILE
+
+
+async def test_replica_follows_owner_wal(client):
+    table_name = "replica_table"
+    client.post(f"/table/create", json={"name": table_name})
+    client.post(f"/table/{table_name}/index/create", json={"field": "status", "index_type": "hash"})
+    doc_id = client.post("/document/create", json={
+        "table_name": table_name, "name": "r1", "body": {"status": "new"}
+    }).json()["_id"]
+
+    replica.full_reload()
+    assert state.db_tables_by_name[table_name].documents_count == 1
+
+    with open(WAL_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "op": "update",
+            "doc_id": doc_id,
+            "version": 2,
+            "body": {"status": "done"},
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }) + "\n")
+        # a torn write must wait for its newline
+        f.write('{"op": "archive", "doc_id"')
+
+    assert await replica.catch_up() == 1
+
+    found = client.post("/document/find", json={"status": "done"}, params={"table_name": table_name}).json()
+    assert [d["_id"] for d in found] == [doc_id]
+    assert client.post("/document/find", json={"status": "new"}, params={"table_name": table_name}).json() == []
+
+
+async def test_full_reload_leaves_a_torn_entry_for_catch_up(client):
+    table_name = "replica_torn_table"
+    client.post("/table/create", json={"name": table_name})
+    doc_id = client.post("/document/create", json={
+        "table_name": table_name, "name": "t1", "body": {"n": 1}
+    }).json()["_id"]
+
+    entry = json.dumps({
+        "op": "update",
+        "doc_id": doc_id,
+        "version": 2,
+        "body": {"n": 2},
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }) + "\n"
+    with open(WAL_FILE, "a", encoding="utf-8") as f:
+        f.write(entry[:20])
+
+    replica.full_reload()
+    assert replica._wal_offset == os.path.getsize(WAL_FILE) - 20
+
+    with open(WAL_FILE, "a", encoding="utf-8") as f:
+        f.write(entry[20:])
+
+    assert await replica.catch_up() == 1
+    assert client.get(f"/document/get/{doc_id}").json()["body"] == {"n": 2}
+
+
+def test_table_etag_is_the_same_on_replicas(client):
+    table_name = "replica_etag_table"
+    client.post("/table/create", json={"name": table_name})
+    doc_id = client.post("/document/create", json={
+        "table_name": table_name, "name": "e1", "body": {"n": 1}
+    }).json()["_id"]
+    client.put(f"/document/update/{doc_id}", json={"version": 1, "body": {"n": 2}})
+    owner_tag = client.get(f"/table/{table_name}/documents").headers["etag"]
+
+    # a reader rebuilds the same state from the files
+    replica.full_reload()
+    assert client.get(f"/table/{table_name}/documents").headers["etag"] == owner_tag
+
+    wal.perform_checkpoint()
+    checkpointed_tag = client.get(f"/table/{table_name}/documents").headers["etag"]
+    assert checkpointed_tag != owner_tag
+    replica.full_reload()
+    assert client.get(f"/table/{table_name}/documents").headers["etag"] == checkpointed_tag
+
+
+def test_write_detection():
+    assert not replica.is_write_request("GET", "/document/get/1")
+    assert not replica.is_write_request("POST", "/document/find")
+    assert replica.is_write_request("POST", "/document/create")
+    assert replica.is_write_request("DELETE", "/table/users")
+
+
+def test_forwarded_writes_are_limited_per_client(monkeypatch):
+    from starlette.requests import Request
+
+    headers = replica.forwarded_headers(
+        {"host": "db", "content-length": "2", "X-Forwarded-For": "6.6.6.6", "x-api": "1"}, "10.0.0.7")
+    assert headers == {"x-api": "1", "x-forwarded-for": "10.0.0.7"}
+
+    def request(client, forwarded_for):
+        raw = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+        return Request({"type": "http", "method": "POST", "path": "/", "headers": raw, "client": client})
+
+    monkeypatch.setattr(replica, "YARADB_ROLE", "owner")
+    # owner socket traffic has no peer address: the reader names the client
+    assert replica.client_address(request(None, "10.0.0.7")) == "10.0.0.7"
+    assert replica.client_address(request(None, None)) == "127.0.0.1"
+    # a direct TCP client can't pick its own key
+    assert replica.client_address(request(("10.0.0.9", 5000), "10.0.0.7")) == "10.0.0.9"
+
+    monkeypatch.setattr(replica, "YARADB_ROLE", "standalone")
+    assert replica.client_address(request(None, "10.0.0.7")) == "127.0.0.1"
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from core import scheduling
+
+
+async def test_cooperative_scan_lets_other_tasks_run():
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0)
+
+    task = asyncio.create_task(ticker())
+    async for _ in scheduling.cooperative(range(5000), chunk_size=100):
+        pass
+    task.cancel()
+
+    assert len(ticks) >= 40
+
+
+async def test_query_timeout():
+    with pytest.raises(TimeoutError):
+        await scheduling.run_with_timeout(asyncio.sleep(1), 10)
+
+    assert await scheduling.run_with_timeout(asyncio.sleep(0, result="done"), 1000) == "done"
+
+
+def test_scan_budget_rejects_large_scans(client, monkeypatch):
+    table_name = "budget_table"
+    for i in range(3):
+        client.post("/document/create", json={"table_name": table_name, "name": f"b{i}", "body": {"n": i}})
+
+    monkeypatch.setattr(scheduling, "MAX_SCAN_DOCS", 2)
+
+    resp = client.post("/document/find", json={"n": 1}, params={"table_name": table_name})
+    assert resp.status_code == 400
+    assert "Query rejected" in resp.json()["detail"]
+
+    # the streaming endpoints scan the same way
+    for path in ("/document/count", "/document/exists"):
+        resp = client.post(path, json={"n": 1}, params={"table_name": table_name})
+        assert resp.status_code == 400
+        assert "Query rejected" in resp.json()["detail"]
+    resp = client.post("/aggregate", json={"table_name": table_name, "match": {"n": 1},
+                                           "accumulators": {"total": {"op": "count"}}})
+    assert resp.status_code == 400
+    assert "Query rejected" in resp.json()["detail"]
+
+    client.post(f"/table/{table_name}/index/create", json={"field": "n", "index_type": "hash"})
+    resp = client.post("/document/find", json={"n": 1}, params={"table_name": table_name, "timeout_ms": 5000})
+    assert resp.status_code == 200
+    assert len(resp.json()) == 1
+    assert client.post("/document/exists", json={"n": 1}, params={"table_name": table_name}).status_code == 200
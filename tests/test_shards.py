@@ -0,0 +1,26 @@
+from core import shards, state
+
+
+def test_parallel_scan_keeps_storage_order(client, monkeypatch):
+    monkeypatch.setattr(shards, "PARALLEL_SCAN_MIN_ROWS", 1)
+    table_name = "sharded_table"
+
+    created = []
+    for i in range(12):
+        resp = client.post("/document/create", json={
+            "table_name": table_name, "name": f"s{i}", "body": {"n": i, "even": i % 2 == 0}
+        })
+        created.append(resp.json()["_id"])
+
+    assert shards.table_size(table_name) == 12
+    assert sum(1 for rows in state.db_table_shards[table_name] if rows) > 1
+
+    docs = client.get(f"/table/{table_name}/documents").json()
+    assert [d["_id"] for d in docs] == created
+
+    evens = client.post("/document/find", json={"even": True}, params={"table_name": table_name}).json()
+    assert [d["body"]["n"] for d in evens] == [0, 2, 4, 6, 8, 10]
+
+    client.post(f"/table/{table_name}/index/create", json={"field": "n", "index_type": "btree"})
+    indexes = client.get(f"/table/{table_name}/indexes").json()["indexes"]
+    assert indexes[0]["total_entries"] == 12